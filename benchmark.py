@@ -0,0 +1,440 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import numpy as np
+from stage_profiler import StageProfiler
+from token_frequency import ExactFrequency
+from unique_counter import new_counter
+from tokenizer import get_tokenizer
+
+BENCHMARKS = ['normalize', 'statistics_ubuntu', 'statistics_twitter', 'statistics_json',
+              'bleu', 'rouge', 'distinct_n', 'average_human_rating']
+
+# the import of the command line entry points, timed with -X importtime in a fresh interpreter
+STARTUP_BENCHMARKS = ['startup_ds_ex3', 'startup_ds_ex2_task4']
+
+# backends which only the stages needing them import, an entry point loading one at startup has regressed
+HEAVY_MODULES = ['nltk', 'sacrebleu', 'tqdm', 'pyarrow', 'pandas', 'scipy']
+
+NUMBER_REFERENCES = 11
+
+CHUNK_SIZE = 100000
+
+
+class SyntheticText(object):
+    """
+    generate synthetic utterances, the words are drawn from a Zipf-like distribution over
+    a fixed vocabulary so the token and n-gram statistics look like a real corpus
+    """
+
+    def __init__(self, seed=0, vocabularySize=50000, minLength=3, maxLength=20):
+        """
+        :param seed: int type, seed of the random generator
+        :param vocabularySize: int type, number of distinct words
+        :param minLength: int type, minimum number of words of an utterance
+        :param maxLength: int type, maximum number of words of an utterance
+        """
+        self.random = np.random.RandomState(seed)
+        self.minLength = minLength
+        self.maxLength = maxLength
+        letters = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+        lengths = self.random.randint(2, 9, size=vocabularySize)
+        self.vocabulary = np.array([''.join(self.random.choice(letters, length)) for length in lengths],
+                                   dtype=object)
+        self.vocabulary[:8] = ['.', ',', '?', '!', "'s", "n't", '@user', 'http://t.co/x']
+        probabilities = 1.0 / np.arange(1, vocabularySize + 1)
+        self.probabilities = probabilities / probabilities.sum()
+
+    def token_ids(self, numberUtterances):
+        """
+        draw the word ids of a batch of utterances
+        :param numberUtterances: int type, number of utterances
+        :return ids: list type, numpy array of word ids for each utterance
+        """
+        lengths = self.random.randint(self.minLength, self.maxLength + 1, size=numberUtterances)
+        ids = self.random.choice(len(self.vocabulary), size=int(lengths.sum()), p=self.probabilities)
+        return np.split(ids, np.cumsum(lengths)[:-1])
+
+    def words(self, ids):
+        """
+        join the words of word ids into an utterance
+        :param ids: numpy array type, word ids
+        :return utterance: String type, utterance
+        """
+        return ' '.join(self.vocabulary[ids])
+
+    def utterances(self, numberUtterances):
+        """
+        generate utterances in batches
+        :param numberUtterances: int type, number of utterances
+        :return utterances: generator type, utterances
+        """
+        for start in range(0, numberUtterances, CHUNK_SIZE):
+            for ids in self.token_ids(min(CHUNK_SIZE, numberUtterances - start)):
+                yield self.words(ids)
+
+    def perturb(self, ids, rate):
+        """
+        replace some words of an utterance by random words, for hypotheses close to a reference
+        :param ids: numpy array type, word ids
+        :param rate: float type, probability to replace a word
+        :return ids: numpy array type, perturbed word ids
+        """
+        replaced = self.random.random_sample(len(ids)) < rate
+        ids = ids.copy()
+        ids[replaced] = self.random.choice(len(self.vocabulary), size=int(replaced.sum()), p=self.probabilities)
+        return ids
+
+
+def generate_evaluation(path, numberUtterances, numberSystems=2, seed=0):
+    """
+    generate a DSTC6-style evaluation directory: hypotheses/S_i.txt, the references
+    original_refs.txt and refgen_resultK.txt, and human_rating_scores.txt
+    :param path: String type, evaluation directory
+    :param numberUtterances: int type, number of utterances of every system and reference
+    :param numberSystems: int type, number of systems
+    :param seed: int type, seed of the random generator
+    """
+    text = SyntheticText(seed)
+    hypothesesPath = os.path.join(path, 'hypotheses')
+    referencesPath = os.path.join(path, 'references')
+    os.makedirs(hypothesesPath, exist_ok=True)
+    os.makedirs(referencesPath, exist_ok=True)
+    referenceNames = ['original_refs'] + ['refgen_result{}'.format(k) for k in range(1, NUMBER_REFERENCES)]
+    references = [open(os.path.join(referencesPath, name + '.txt'), 'w') for name in referenceNames]
+    systemIds = ['S_{}'.format(i) for i in range(1, numberSystems + 1)]
+    hypotheses = [open(os.path.join(hypothesesPath, systemId + '.txt'), 'w') for systemId in systemIds]
+    try:
+        for start in range(0, numberUtterances, CHUNK_SIZE):
+            for ids in text.token_ids(min(CHUNK_SIZE, numberUtterances - start)):
+                for rf in references:
+                    rf.write(text.words(text.perturb(ids, 0.3)) + '\n')
+                for hf in hypotheses:
+                    hf.write(text.words(text.perturb(ids, 0.6)) + '\n')
+    finally:
+        for f in references + hypotheses:
+            f.close()
+    with open(os.path.join(path, 'human_rating_scores.txt'), 'w') as hf:
+        hf.write('system\tutterance\tratings\n')
+        for start in range(0, numberUtterances, CHUNK_SIZE):
+            size = min(CHUNK_SIZE, numberUtterances - start)
+            for systemId in systemIds:
+                raters = text.random.randint(3, 11, size=size)
+                rates = text.random.randint(1, 6, size=int(raters.sum()))
+                for i, line in enumerate(np.split(rates, np.cumsum(raters)[:-1])):
+                    hf.write('{}\tU_{}\t[{}]\n'.format(systemId, start + i, ','.join(map(str, line))))
+
+
+def generate_ubuntu(path, numberUtterances, utterancesPerFile=100, seed=0):
+    """
+    generate an Ubuntu-style corpus, directories of tsv dialogues with the utterance in the 4th column
+    :param path: String type, root directory of the corpus
+    :param numberUtterances: int type, number of utterances
+    :param utterancesPerFile: int type, number of utterances of each dialogue file
+    :param seed: int type, seed of the random generator
+    """
+    text = SyntheticText(seed)
+    utterances = text.utterances(numberUtterances)
+    for fileId in range(0, (numberUtterances + utterancesPerFile - 1) // utterancesPerFile):
+        folder = os.path.join(path, str(fileId // 1000))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, '{}.tsv'.format(fileId)), 'w') as f:
+            for i, utterance in zip(range(0, utterancesPerFile), utterances):
+                f.write('2006-12-11T09:50:00.000Z\tPer{}\tPer{}\t{}\n'.format(i % 2, (i + 1) % 2, utterance))
+
+
+def generate_twitter(file, numberUtterances, turnsPerDialogue=4, seed=0):
+    """
+    generate a Twitter-style corpus, tab separated id, utterance, user and date,
+    the dialogues are separated by empty lines
+    :param file: String type, corpus file name
+    :param numberUtterances: int type, number of utterances
+    :param turnsPerDialogue: int type, number of utterances of each dialogue
+    :param seed: int type, seed of the random generator
+    """
+    text = SyntheticText(seed)
+    with open(file, 'w') as f:
+        for i, utterance in enumerate(text.utterances(numberUtterances)):
+            f.write('{}\t{}\t{}\t2011-02-22 06:39:07\n'.format(39937211206082560 + i, utterance, 47559444 + i % 7))
+            if i % turnsPerDialogue == turnsPerDialogue - 1:
+                f.write('\n')
+
+
+def generate_json(file, numberUtterances, turnsPerDialogue=5, seed=0):
+    """
+    generate a JSON dialogue corpus, each turn holds a sys and a usr utterance
+    :param file: String type, corpus file name
+    :param numberUtterances: int type, number of utterances
+    :param turnsPerDialogue: int type, number of turns of each dialogue
+    :param seed: int type, seed of the random generator
+    """
+    text = SyntheticText(seed)
+    utterances = text.utterances(numberUtterances)
+    dialogues = dict()
+    numberTurns = (numberUtterances + 1) // 2
+    for turnId in range(0, numberTurns):
+        dialogue = dialogues.setdefault('Dialogue{}'.format(turnId // turnsPerDialogue + 1), list())
+        turn = {'query_type': ['request']}
+        for key in ['sys', 'usr']:
+            utterance = next(utterances, None)
+            if utterance is not None:
+                turn[key] = utterance
+        dialogue.append(turn)
+    with open(file, 'w') as f:
+        json.dump(dialogues, f, indent=4)
+
+
+def generate_data(dataPath, size, seed=0):
+    """
+    generate all the synthetic corpora of a size once, later runs reuse them
+    :param dataPath: String type, directory of the synthetic corpora
+    :param size: int type, number of utterances of each corpus
+    :param seed: int type, seed of the random generator
+    :return paths: dict type, corpus name to its path
+    """
+    root = os.path.join(dataPath, '{}-{}'.format(size, seed))
+    paths = dict()
+    paths['evaluation'] = os.path.join(root, 'evaluation')
+    paths['ubuntu'] = os.path.join(root, 'ubuntu')
+    paths['twitter'] = os.path.join(root, 'twitter.txt')
+    paths['json'] = os.path.join(root, 'dialogues.json')
+    done = os.path.join(root, 'done')
+    if not os.path.exists(done):
+        os.makedirs(root, exist_ok=True)
+        generate_evaluation(paths['evaluation'], size, seed=seed)
+        generate_ubuntu(paths['ubuntu'], size, seed=seed)
+        generate_twitter(paths['twitter'], size, seed=seed)
+        generate_json(paths['json'], size, seed=seed)
+        open(done, 'w').close()
+    return paths
+
+
+def run_benchmark(name, paths, tokenizer='nltk'):
+    """
+    run one benchmark on the synthetic corpora, the inputs are read before the timing starts
+    :param name: String type, one of BENCHMARKS
+    :param paths: dict type, corpus name to its path
+    :param tokenizer: String type, tokenizer backend of the statistics, one of nltk, fast
+    :return run: function type, the timed function
+    :return utterances: int type, number of utterances processed by the function
+    """
+    import ds_ex2_task4
+    import ds_ex3
+    if name == 'normalize':
+        with open(paths['twitter'], 'r') as f:
+            utterances = [line.split('\t')[1] for line in f if '\t' in line]
+        engine = get_tokenizer(tokenizer)
+        return lambda: [engine.tokenize(utterance) for utterance in utterances], len(utterances)
+    if name == 'statistics_ubuntu':
+        files = ds_ex2_task4.list_ubuntu_files(paths['ubuntu'])
+
+        def run():
+            result = (0, 0, new_counter('exact'), ExactFrequency())
+            for file in files:
+                result = ds_ex2_task4.statistics_ubuntu(file, *result, tokenizer=tokenizer)
+            return result
+        numberUtterances = 0
+        for file in files:
+            with open(file, 'r') as f:
+                numberUtterances += sum(1 for line in f)
+        return run, numberUtterances
+    if name == 'statistics_twitter':
+        with open(paths['twitter'], 'r') as f:
+            numberUtterances = sum(1 for line in f if '\t' in line)
+        return lambda: ds_ex2_task4.statistics_twitter(paths['twitter'], tokenizer=tokenizer), numberUtterances
+    if name == 'statistics_json':
+        with open(paths['json'], 'r') as f:
+            numberUtterances = sum(key in turn for dialogue in json.load(f).values()
+                                   for turn in dialogue for key in ['sys', 'usr'])
+        return lambda: ds_ex2_task4.statistics_json(paths['json'], tokenizer=tokenizer), numberUtterances
+    if name == 'average_human_rating':
+        file = os.path.join(paths['evaluation'], 'human_rating_scores.txt')
+        with open(file, 'r') as f:
+            numberLines = sum(1 for line in f) - 1
+        return lambda: ds_ex3.average_human_rating(file), numberLines
+    hypotheses, references = ds_ex3.get_data(os.path.join(paths['evaluation'], 'hypotheses'),
+                                             os.path.join(paths['evaluation'], 'references'))
+    numberUtterances = sum(len(lines) for lines in hypotheses.values())
+    if name == 'bleu':
+        return lambda: ds_ex3.bleu(hypotheses, references), numberUtterances
+    if name == 'rouge':
+        return lambda: ds_ex3.rouge(hypotheses, references), numberUtterances
+    if name == 'distinct_n':
+        return lambda: ds_ex3.distinct_n(hypotheses, [1, 2, 3]), numberUtterances
+    raise ValueError('unknown benchmark: {}, expected one of {}'.format(name, BENCHMARKS))
+
+
+def parse_importtime(text):
+    """
+    read the report of python -X importtime
+    :param text: String type, standard error of the interpreter
+    :return times: dict type, module to its cumulative import time in seconds
+    :return depths: dict type, module to its nesting depth, 0 for the imported module
+    """
+    times = dict()
+    depths = dict()
+    for line in text.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        selfTime, cumulative, name = line[len('import time:'):].split('|')
+        depths[name.strip()] = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = int(cumulative) / 1e6
+    return times, depths
+
+
+def startup_time(module, repeats=5):
+    """
+    time the import of a module in a fresh interpreter, the fastest of repeated runs is kept
+    :param module: String type, module name
+    :param repeats: int type, number of runs
+    :return result: dict type, figures of the fastest run, with the heavy backends it loaded
+        and the direct imports of the module from the slowest
+    """
+    best = None
+    for i in range(0, repeats):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                                 cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError('cannot import {}: {}'.format(module, process.stderr.strip().splitlines()[-1]))
+        times, depths = parse_importtime(process.stderr)
+        if best is None or times[module] < best[0][module]:
+            best = (times, depths)
+    times, depths = best
+    result = dict()
+    result['wall'] = times[module]
+    result['heavy'] = [name for name in HEAVY_MODULES if name in times]
+    result['imports'] = sorted(((name, times[name]) for name in times if depths[name] == 1),
+                               key=lambda item: -item[1])[:5]
+    return result
+
+
+def run_startup(names, repeats=5):
+    """
+    run the startup benchmarks, they do not depend on the corpus size, which is recorded as 0
+    :param names: list type, startup benchmark names
+    :param repeats: int type, number of runs of each benchmark
+    :return results: list type, figures of each benchmark, the throughput is in starts per second
+    """
+    results = list()
+    for name in names:
+        figures = startup_time(name[len('startup_'):], repeats)
+        result = dict()
+        result['benchmark'] = name
+        result['size'] = 0
+        result['wall'] = figures['wall']
+        result['throughput'] = 1 / figures['wall']
+        result['heavy'] = figures['heavy']
+        result['imports'] = figures['imports']
+        results.append(result)
+        print('{:<22}{:>10}{:>12.3f}s  heavy: {}  slowest: {}'.format(
+            name, 0, result['wall'], ','.join(result['heavy']) or '-',
+            ', '.join('{} {:.0f}ms'.format(module, wall * 1000) for module, wall in result['imports'][:3])))
+    return results
+
+
+def run_benchmarks(names, sizes, dataPath, tokenizer='nltk', seed=0):
+    """
+    run the benchmarks at every size
+    :param names: list type, benchmark names
+    :param sizes: list type, numbers of utterances of the synthetic corpora
+    :param dataPath: String type, directory of the synthetic corpora
+    :param tokenizer: String type, tokenizer backend of the statistics, one of nltk, fast
+    :param seed: int type, seed of the random generator
+    :return results: list type, figures of each benchmark run
+    """
+    results = list()
+    for size in sizes:
+        paths = generate_data(dataPath, size, seed)
+        for name in names:
+            run, numberUtterances = run_benchmark(name, paths, tokenizer)
+            profiler = StageProfiler(enabled=True)
+            with profiler.stage(name):
+                run()
+            stage = profiler.stages[-1]
+            result = dict()
+            result['benchmark'] = name
+            result['size'] = size
+            result['utterances'] = numberUtterances
+            result['wall'] = stage['wall']
+            result['cpu'] = stage['cpu']
+            result['peakRss'] = stage['peakRss']
+            result['throughput'] = numberUtterances / stage['wall'] if stage['wall'] > 0 else float('inf')
+            results.append(result)
+            print('{:<22}{:>10}{:>12.3f}s{:>14.0f} utt/s{:>10.1f} MB'.format(
+                name, size, result['wall'], result['throughput'],
+                result['peakRss'] / 2.0 ** 20 if result['peakRss'] is not None else float('nan')))
+    return results
+
+
+def compare_baseline(results, baseline, tolerance=0.2):
+    """
+    compare the throughput of the benchmarks to a saved baseline
+    :param results: list type, figures of each benchmark run
+    :param baseline: list type, figures of the baseline runs
+    :param tolerance: float type, allowed relative loss of throughput
+    :return regressions: list type, (benchmark, size, baseline throughput, throughput) slower than allowed
+    """
+    baselineThroughput = dict(((r['benchmark'], r['size']), r['throughput']) for r in baseline)
+    regressions = list()
+    for result in results:
+        key = (result['benchmark'], result['size'])
+        if key not in baselineThroughput:
+            continue
+        ratio = result['throughput'] / baselineThroughput[key]
+        print('{:<22}{:>10}{:>10.2f}x baseline'.format(key[0], key[1], ratio))
+        if ratio < 1 - tolerance:
+            regressions.append((key[0], key[1], baselineThroughput[key], result['throughput']))
+    return regressions
+
+
+def parse_args(args):
+    """
+    parse the command line arguments given as -name value pairs, --name is the same as -name
+    :param args: list type, command line arguments
+    :return options: dict type, option name to option value
+    """
+    options = dict()
+    for i in range(0, len(args)-1, 2):
+        if args[i].startswith('-'):
+            options[args[i].lstrip('-')] = args[i+1]
+    return options
+
+
+def main():
+    """
+    The main function, run the benchmarks, save them as a baseline or compare them to one
+    """
+    options = parse_args(sys.argv[1:])
+    sizes = [int(size) for size in options.get('sizes', '10000').split(',')]
+    names = options['benchmarks'].split(',') if 'benchmarks' in options else BENCHMARKS + STARTUP_BENCHMARKS
+    dataPath = options.get('data', os.path.join(tempfile.gettempdir(), 'dstc_benchmark'))
+    tokenizer = options.get('tokenizer', 'nltk')
+    seed = int(options.get('seed', 0))
+    startupNames = [name for name in names if name in STARTUP_BENCHMARKS]
+    names = [name for name in names if name not in STARTUP_BENCHMARKS]
+    results = run_benchmarks(names, sizes, dataPath, tokenizer, seed)
+    results += run_startup(startupNames, int(options.get('repeats', 5)))
+    if 'save' in options:
+        with open(options['save'], 'w') as bf:
+            json.dump({'tokenizer': tokenizer, 'seed': seed, 'results': results}, bf, indent=2)
+    if 'baseline' in options:
+        with open(options['baseline'], 'r') as bf:
+            baseline = json.load(bf)['results']
+        regressions = compare_baseline(results, baseline, float(options.get('tolerance', 0.2)))
+        for name, size, before, after in regressions:
+            if name in STARTUP_BENCHMARKS:
+                print('regression: {}, {:.3f} -> {:.3f}s'.format(name, 1 / before, 1 / after))
+            else:
+                print('regression: {} at {} utterances, {:.0f} -> {:.0f} utt/s'.format(name, size, before, after))
+        for result in results:
+            if len(result.get('heavy', [])) > 0:
+                print('regression: {} imports {} at startup'.format(result['benchmark'], ','.join(result['heavy'])))
+                regressions.append(result)
+        if len(regressions) > 0:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
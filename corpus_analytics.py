@@ -0,0 +1,285 @@
+import os
+import re
+import sys
+import json
+import math
+from collections import Counter
+from multiprocessing import Pool
+from functools import partial
+from corpus_reader import iter_chunks, iter_line_batches, column_pattern, decode_fields
+from tokenizer import get_tokenizer
+from ds_ex2_task4 import list_ubuntu_files, parse_args, progress_bar
+
+QUANTILES = [0.5, 0.9, 0.99]
+
+# per conversation: turns, participants and tokens, per utterance: tokens
+MEASURES = ['turns', 'participants', 'conversationTokens', 'utteranceTokens']
+
+BOUNDARY_SCAN_SIZE = 1 << 16
+
+# the end of a blank line, with \n or \r\n line endings
+BLANK_LINE_PATTERN = re.compile(rb'\n\r?\n')
+
+
+class OnlineStatistics(object):
+    """
+    the mean and variance of a stream of integers with Welford's algorithm, and their exact
+    histogram for the quantiles, the memory grows with the number of distinct values only
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = Counter()
+
+    def add(self, value):
+        """
+        add a value to the stream
+        :param value: int type, value
+        """
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.histogram[value] += 1
+
+    def merge(self, other):
+        """
+        merge the statistics of another stream into this one, with the pairwise update of Chan et al.
+        :param other: OnlineStatistics type, statistics to be merged
+        """
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.histogram.update(other.histogram)
+
+    def std(self):
+        """
+        the population standard deviation, as numpy.std
+        :return std: float type, standard deviation
+        """
+        return math.sqrt(self.m2 / self.count) if self.count > 0 else float('nan')
+
+    def quantile(self, q):
+        """
+        the exact quantile of the stream, the lowest value with at least q of the values at or below it
+        :param q: float type, quantile between 0 and 1
+        :return value: int type, quantile value
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for value in sorted(self.histogram):
+            seen += self.histogram[value]
+            if seen >= rank:
+                return value
+
+    def summary(self):
+        """
+        summarize the stream
+        :return summary: dict type, count, mean, std, min, max and quantiles
+        """
+        summary = dict()
+        summary['count'] = self.count
+        summary['mean'] = self.mean if self.count > 0 else float('nan')
+        summary['std'] = self.std()
+        summary['min'] = min(self.histogram) if self.count > 0 else None
+        summary['max'] = max(self.histogram) if self.count > 0 else None
+        for q in QUANTILES:
+            summary['p{:g}'.format(q * 100)] = self.quantile(q)
+        return summary
+
+
+class ConversationStatistics(object):
+    """
+    the statistics of all measures of a corpus, or of a part of it
+    """
+
+    def __init__(self):
+        self.measures = dict((measure, OnlineStatistics()) for measure in MEASURES)
+
+    def add_conversation(self, users, tokenLengths):
+        """
+        add a conversation
+        :param users: list type, user of each turn
+        :param tokenLengths: list type, number of tokens of each turn
+        """
+        if len(tokenLengths) == 0:
+            return
+        self.measures['turns'].add(len(tokenLengths))
+        self.measures['participants'].add(len(set(users)))
+        self.measures['conversationTokens'].add(sum(tokenLengths))
+        utteranceTokens = self.measures['utteranceTokens']
+        for length in tokenLengths:
+            utteranceTokens.add(length)
+
+    def merge(self, other):
+        """
+        merge the statistics of another part of the corpus
+        :param other: ConversationStatistics type, statistics to be merged
+        """
+        for measure in MEASURES:
+            self.measures[measure].merge(other.measures[measure])
+
+    def summary(self):
+        """
+        summarize every measure
+        :return summary: dict type, measure to its summary
+        """
+        return dict((measure, self.measures[measure].summary()) for measure in MEASURES)
+
+
+def analyze_ubuntu_files(files, tokenizer='nltk'):
+    """
+    analyze a shard of ubuntu files, each file is a conversation, with the user in the
+    2nd column and the utterance in the 4th column, each file is read once
+    :param files: list type, file paths of the shard
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :return statistics: ConversationStatistics type, statistics of the shard
+    """
+    engine = get_tokenizer(tokenizer)
+    userPattern = column_pattern(1)
+    utterancePattern = column_pattern(3)
+    statistics = ConversationStatistics()
+    for file in files:
+        users = list()
+        tokenLengths = list()
+        for chunk in iter_chunks(file):
+            users.extend(userPattern.findall(chunk))
+            utterances = decode_fields(utterancePattern.findall(chunk))
+            tokenLengths.extend(len(tokens) for tokens in engine.tokenize_batch(utterances))
+        statistics.add_conversation(users, tokenLengths)
+    return statistics
+
+
+def analyze_twitter_range(byteRange, file, tokenizer='nltk'):
+    """
+    analyze a byte range of the twitter corpus, the conversations are separated by blank
+    lines, with the utterance in the 2nd column and the user in the 3rd column
+    :param byteRange: tuple type, (start, stop) offsets, both at the start of a conversation
+    :param file: String type, file path of corpus
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :return statistics: ConversationStatistics type, statistics of the range
+    """
+    engine = get_tokenizer(tokenizer)
+    statistics = ConversationStatistics()
+    users = list()
+    utterances = list()
+    for lines in iter_line_batches(file, start=byteRange[0], stop=byteRange[1]):
+        for line in lines:
+            if len(line.strip()) == 0:
+                tokenLengths = [len(tokens) for tokens in engine.tokenize_batch(decode_fields(utterances))]
+                statistics.add_conversation(users, tokenLengths)
+                users = list()
+                utterances = list()
+                continue
+            fields = line.split(b'\t', 3)
+            if len(fields) > 1:
+                utterances.append(fields[1])
+            # a line without the user column counts a turn but no participant
+            if len(fields) > 2:
+                users.append(fields[2])
+    tokenLengths = [len(tokens) for tokens in engine.tokenize_batch(decode_fields(utterances))]
+    statistics.add_conversation(users, tokenLengths)
+    return statistics
+
+
+def conversation_ranges(file, parts):
+    """
+    split the twitter corpus into byte ranges which start after a blank line,
+    so no conversation is split between two ranges
+    :param file: String type, file path of corpus
+    :param parts: int type, number of ranges wanted
+    :return ranges: list type, (start, stop) offsets of the ranges
+    """
+    size = os.path.getsize(file)
+    bounds = [0]
+    with open(file, 'rb') as f:
+        for k in range(1, parts):
+            # a blank line is a \n or \r\n preceded by a \n, so look from the byte before the offset
+            offset = max(size * k // parts, bounds[-1], 1) - 1
+            f.seek(offset)
+            data = b''
+            while True:
+                block = f.read(BOUNDARY_SCAN_SIZE)
+                data += block
+                match = BLANK_LINE_PATTERN.search(data)
+                if match is not None or len(block) == 0:
+                    break
+            if match is None:
+                break
+            bounds.append(offset + match.end())
+    bounds.append(size)
+    ranges = list()
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        if stop > start:
+            ranges.append((start, stop))
+    return ranges
+
+
+def analyze_corpus(path, workers=1, tokenizer='nltk', shardsPerWorker=4):
+    """
+    analyze an ubuntu corpus directory or a twitter corpus file in one scan, in parallel
+    over the files or over byte ranges of the file
+    :param path: String type, ubuntu root dir or twitter file path
+    :param workers: int type, number of worker processes, 1 means serial
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param shardsPerWorker: int type, number of shards per worker, for load balancing
+    :return statistics: ConversationStatistics type, statistics of the corpus
+    """
+    if os.path.isdir(path):
+        files = list_ubuntu_files(path)
+        numberShards = max(1, min(len(files), workers * shardsPerWorker))
+        shards = [files[i::numberShards] for i in range(numberShards)]
+        worker = partial(analyze_ubuntu_files, tokenizer=tokenizer)
+        sizes = [len(shard) for shard in shards]
+    else:
+        shards = conversation_ranges(path, workers * shardsPerWorker)
+        worker = partial(analyze_twitter_range, file=path, tokenizer=tokenizer)
+        sizes = [stop - start for start, stop in shards]
+    statistics = ConversationStatistics()
+    par = progress_bar(sum(sizes))
+    if workers > 1:
+        with Pool(workers) as pool:
+            for size, partStatistics in zip(sizes, pool.imap(worker, shards)):
+                par.update(size)
+                statistics.merge(partStatistics)
+    else:
+        for size, shard in zip(sizes, shards):
+            statistics.merge(worker(shard))
+            par.update(size)
+    par.close()
+    return statistics
+
+
+def main():
+    """
+    The main function, analyze the conversations of an ubuntu or a twitter corpus
+    """
+    options = parse_args(sys.argv[1:])
+    if 'path' in options:
+        inputs = options['path']
+    else:
+        print('please input the path of the corpus')
+        inputs = input("input:")
+    workers = int(options.get('workers', 1))
+    tokenizer = options.get('tokenizer', 'nltk')
+    summary = analyze_corpus(inputs, workers, tokenizer).summary()
+    corpus = 'Ubuntu corpus' if os.path.isdir(inputs) else 'Twitter corpus'
+    print('\n\nFor the {}'.format(corpus))
+    for measure in MEASURES:
+        print('    {}: {}'.format(measure, ', '.join('{} {}'.format(key, value)
+                                                    for key, value in summary[measure].items())))
+    if 'output' in options:
+        with open(options['output'], 'w') as of:
+            json.dump(summary, of, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+import sqlite3
+
+# bumped when the stored statistics change, an index of another version is rebuilt
+INDEX_VERSION = '2'
+
+
+class CorpusIndex(object):
+    """
+    on-disk index of the per-file statistics of a corpus, a rerun only processes
+    the new or changed files and merges the stored results of the others
+    """
+
+    def __init__(self, path, mode, error, tokenizer):
+        """
+        open the index, the stored results are dropped if they were produced
+        with another counting mode, tokenizer or index version
+        :param path: String type, file path of the index
+        :param mode: String type, unique counting mode of the stored sketches
+        :param error: float type, relative standard error of the hll mode
+        :param tokenizer: String type, tokenizer backend of the stored token counts
+        """
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        config = {'mode': mode, 'error': repr(float(error)), 'tokenizer': tokenizer, 'version': INDEX_VERSION}
+        stored = dict(self.connection.execute('SELECT key, value FROM meta'))
+        if stored != config:
+            self.connection.execute('DROP TABLE IF EXISTS files')
+            self.connection.execute('DELETE FROM meta')
+            self.connection.executemany('INSERT INTO meta VALUES (?, ?)', config.items())
+        self.connection.execute('CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, '
+                                'size INTEGER, mtime INTEGER, utterances INTEGER, tokens INTEGER, '
+                                'uniqueUtterance BLOB, tokenFrequency BLOB)')
+        self.connection.commit()
+
+    def stat(self, file):
+        """
+        get the size and modification time which identify the version of a file
+        :param file: String type, file path
+        :return size: int type, file size in bytes
+        :return mtime: int type, modification time in nanoseconds
+        """
+        st = os.stat(file)
+        return st.st_size, st.st_mtime_ns
+
+    def stale_files(self, files):
+        """
+        find the files which are not in the index or changed since they were indexed
+        :param files: list type, file paths of the corpus
+        :return staleFiles: list type, file paths which need to be processed
+        """
+        indexed = dict()
+        for path, size, mtime in self.connection.execute('SELECT path, size, mtime FROM files'):
+            indexed[path] = (size, mtime)
+        return [file for file in files if indexed.get(file) != self.stat(file)]
+
+    def put(self, file, size, mtime, ucount, tcount, uniqueUtterance, tokenFrequency):
+        """
+        store the statistics of a file, the transaction is committed by commit
+        :param file: String type, file path
+        :param size: int type, file size in bytes when processed
+        :param mtime: int type, modification time in nanoseconds when processed
+        :param ucount: int type, number of utterances of the file
+        :param tcount: int type, number of tokens of the file
+        :param uniqueUtterance: counter of the unique utterances of the file
+        :param tokenFrequency: exact counter of the token frequencies of the file
+        """
+        self.connection.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                (file, size, mtime, ucount, tcount,
+                                 uniqueUtterance.to_bytes(), tokenFrequency.to_bytes()))
+
+    def commit(self):
+        """
+        persist the stored statistics, the progress survives a crash after this
+        """
+        self.connection.commit()
+
+    def prune(self, files):
+        """
+        remove the files which are no longer in the corpus
+        :param files: list type, file paths of the corpus
+        """
+        current = set(files)
+        removed = [(path,) for (path,) in self.connection.execute('SELECT path FROM files')
+                   if path not in current]
+        self.connection.executemany('DELETE FROM files WHERE path = ?', removed)
+        self.connection.commit()
+
+    def totals(self, uniqueUtterance, tokenFrequency):
+        """
+        merge the statistics of all the indexed files
+        :param uniqueUtterance: empty counter for the unique utterances
+        :param tokenFrequency: empty counter for the token frequencies, exact or sketch
+        :return totalUtterance: total number of utterances
+        :return totalToken: total number of tokens
+        :return uniqueUtterance: merged counter of unique utterances
+        :return tokenFrequency: merged counter of token frequencies
+        """
+        totalUtterance = 0
+        totalToken = 0
+        rows = self.connection.execute('SELECT utterances, tokens, uniqueUtterance, tokenFrequency FROM files')
+        for ucount, tcount, utteranceData, tokenData in rows:
+            totalUtterance += ucount
+            totalToken += tcount
+            uniqueUtterance.merge_bytes(utteranceData)
+            tokenFrequency.merge_bytes(tokenData)
+        return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
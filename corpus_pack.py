@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import mmap
+import numpy as np
+
+MANIFEST = 'manifest.json'
+
+
+def count_lines(file):
+    """
+    count the lines of a text file
+    :param file: String type, file name
+    :return numberLines: int type, number of lines
+    """
+    with open(file, 'r') as f:
+        return sum(1 for line in f)
+
+
+def pack_stream(file, prefix):
+    """
+    pack a text file into a line-aligned binary stream: one UTF-8 blob of the lines
+    without their newline, and an offsets array with the start of each line
+    :param file: String type, text file name
+    :param prefix: String type, output path without extension, .bin and .offsets.npy are written
+    :return numberLines: int type, number of lines
+    """
+    offsets = [0]
+    with open(file, 'r') as f, open(prefix + '.bin', 'wb') as out:
+        for line in f:
+            data = line.rstrip('\n').encode('utf-8')
+            out.write(data)
+            offsets.append(offsets[-1] + len(data))
+    np.save(prefix + '.offsets.npy', np.array(offsets, dtype=np.int64))
+    return len(offsets) - 1
+
+
+def pack_corpus(hypothesesPath, referencesPath, outPath):
+    """
+    pack the hypotheses and references of an evaluation into a directory of line-aligned streams,
+    all streams must have the same number of lines, which is checked before anything is written
+    :param hypothesesPath: String type, hypotheses file path
+    :param referencesPath: String type, references file path
+    :param outPath: String type, directory of the packed corpus
+    :return manifest: dict type, systems, references and number of lines of the packed corpus
+    """
+    from ds_ex3 import list_systems, list_references
+    systemIds = list_systems(hypothesesPath)
+    referenceNames = list_references(referencesPath)
+    files = [('hypotheses', systemId, os.path.join(hypothesesPath, systemId + '.txt')) for systemId in systemIds]
+    files += [('references', name, os.path.join(referencesPath, name + '.txt')) for name in referenceNames]
+    lineCounts = dict((file, count_lines(file)) for kind, name, file in files)
+    if len(set(lineCounts.values())) > 1:
+        raise ValueError('the streams have different numbers of lines: {}'.format(lineCounts))
+
+    for kind in ['hypotheses', 'references']:
+        os.makedirs(os.path.join(outPath, kind), exist_ok=True)
+    for kind, name, file in files:
+        pack_stream(file, os.path.join(outPath, kind, name))
+    manifest = dict()
+    manifest['systems'] = systemIds
+    manifest['references'] = referenceNames
+    manifest['lines'] = lineCounts[files[0][2]] if len(files) > 0 else 0
+    with open(os.path.join(outPath, MANIFEST), 'w') as mf:
+        json.dump(manifest, mf, indent=2)
+    return manifest
+
+
+class PackedStream(object):
+    """
+    a memory-mapped line-aligned stream, lines are decoded only when they are read
+    """
+
+    def __init__(self, prefix):
+        """
+        :param prefix: String type, path of the stream without extension
+        """
+        self.prefix = prefix
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        with open(prefix + '.bin', 'rb') as f:
+            if self.offsets[-1] > 0:
+                self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.blob = b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.slice(*index.indices(len(self))[:2])
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('line {} out of range of {} lines'.format(index, len(self)))
+        return self.blob[int(self.offsets[index]):int(self.offsets[index + 1])].decode('utf-8')
+
+    def slice(self, start, stop):
+        """
+        read a range of lines with one read of the blob
+        :param start: int type, first line
+        :param stop: int type, line after the last line
+        :return lines: list type, lines of the range
+        """
+        offsets = self.offsets[start:stop + 1]
+        if len(offsets) < 2:
+            return list()
+        data = self.blob[int(offsets[0]):int(offsets[-1])]
+        bounds = (offsets - offsets[0]).tolist()
+        return [data[bounds[i]:bounds[i + 1]].decode('utf-8') for i in range(0, len(bounds) - 1)]
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def iter_lines(self, batchSize=10000):
+        """
+        stream all the lines, reading a batch of lines at a time
+        :param batchSize: int type, number of lines per read
+        :return lines: generator type, lines of the stream
+        """
+        for start in range(0, len(self), batchSize):
+            for line in self.slice(start, min(start + batchSize, len(self))):
+                yield line
+
+    def __getstate__(self):
+        return {'prefix': self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state['prefix'])
+
+
+class AlignedCorpus(object):
+    """
+    a packed evaluation corpus, the systems and references are memory-mapped streams of equal length
+    """
+
+    def __init__(self, path):
+        """
+        :param path: String type, directory of the packed corpus
+        """
+        with open(os.path.join(path, MANIFEST), 'r') as mf:
+            manifest = json.load(mf)
+        self.path = path
+        self.systemIds = manifest['systems']
+        self.referenceNames = manifest['references']
+        self.hypotheses = dict()
+        for systemId in self.systemIds:
+            self.hypotheses[systemId] = PackedStream(os.path.join(path, 'hypotheses', systemId))
+        self.references = [PackedStream(os.path.join(path, 'references', name)) for name in self.referenceNames]
+        self.validate()
+
+    def validate(self):
+        """
+        check that all the streams have the same number of lines
+        """
+        lengths = dict((systemId, len(stream)) for systemId, stream in self.hypotheses.items())
+        lengths.update((name, len(stream)) for name, stream in zip(self.referenceNames, self.references))
+        if len(set(lengths.values())) > 1:
+            raise ValueError('the streams of {} have different numbers of lines: {}'.format(self.path, lengths))
+
+    def iter_aligned(self, systemId, start=0, stop=None, batchSize=10000):
+        """
+        stream the aligned (hypothesis, references) tuples of a system
+        :param systemId: String type, system id
+        :param start: int type, first line
+        :param stop: int type, line after the last line, None for the end
+        :param batchSize: int type, number of lines per read
+        :return aligned: generator type, (hypothesis, list of references) tuples
+        """
+        hypotheses = self.hypotheses[systemId]
+        if stop is None:
+            stop = len(hypotheses)
+        for begin in range(start, stop, batchSize):
+            end = min(begin + batchSize, stop)
+            refs = [stream.slice(begin, end) for stream in self.references]
+            for i, hyp in enumerate(hypotheses.slice(begin, end)):
+                yield hyp, [ref[i] for ref in refs]
+
+
+def main():
+    """
+    The main function, pack the hypotheses and references of an evaluation directory
+    """
+    args = sys.argv[1:]
+    if len(args) == 4 and args[0] == '-path' and args[2] == '-out':
+        inputs = args[1]
+        outPath = args[3]
+    else:
+        print('usage: python corpus_pack.py -path <evaluation dir> -out <packed dir>')
+        return
+    manifest = pack_corpus(os.path.join(inputs, 'hypotheses'), os.path.join(inputs, 'references'), outPath)
+    print('packed {} systems and {} references of {} lines'.format(
+        len(manifest['systems']), len(manifest['references']), manifest['lines']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,431 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from corpus_reader import iter_chunks, column_pattern, decode_fields, read_column, iter_dialogues, \
+    iter_dialogue_utterances
+from unique_counter import new_counter, describe_counter
+from token_frequency import ExactFrequency, new_frequency, describe_frequency
+from tokenizer import get_tokenizer
+from ds_ex2_task4 import list_ubuntu_files, statistics_batch, corpus_kind, parse_args
+
+PIPELINE_BATCH_SIZE = 10000
+
+# batches of a corpus submitted to the pool and not merged yet, a reader waits when its queue is full
+QUEUE_SIZE = 8
+
+REPORT_INTERVAL = 5.0
+
+# seconds a warm-up job holds its worker, so the warm-up jobs are spread over all the workers
+WARM_DELAY = 0.05
+
+
+def read_manifest(file):
+    """
+    read the corpora of a manifest: a JSON list of objects with a path and an optional corpus
+    kind and name, or a text file with one path per line, optionally followed by a tab and the
+    corpus kind, the kind is told from the path when it is not given
+    :param file: String type, manifest file name
+    :return corpora: list type, (name, path, corpus) tuples
+    """
+    with open(file, 'r') as mf:
+        if file.endswith('.json'):
+            entries = json.load(mf)
+        else:
+            entries = list()
+            for line in mf:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields[0].strip()) == 0 or fields[0].startswith('#'):
+                    continue
+                entries.append({'path': fields[0], 'corpus': fields[1] if len(fields) > 1 else None})
+    corpora = list()
+    for entry in entries:
+        path = os.path.join(os.path.dirname(os.path.abspath(file)), entry['path'])
+        corpus = corpus_kind(path, entry.get('corpus', None))
+        name = entry.get('name', None) or os.path.basename(os.path.normpath(path))
+        corpora.append((name, path, corpus))
+    return corpora
+
+
+def iter_corpus_batches(path, corpus, batchSize=PIPELINE_BATCH_SIZE):
+    """
+    read the utterances of a corpus in batches, as the statistics of ds_ex2_task4 read them
+    :param path: String type, path of the corpus
+    :param corpus: String type, one of json, twitter, ubuntu
+    :param batchSize: int type, number of utterances of a batch, the last one may be smaller
+    :return batches: generator type, (utterances, bytes read since the previous batch) tuples,
+        the bytes of a json corpus are counted with its last batch
+    """
+    utterances = list()
+    size = 0
+    if corpus == 'twitter':
+        pattern = column_pattern(1)
+        for chunk in iter_chunks(path):
+            fields = decode_fields(pattern.findall(chunk))
+            size += len(chunk)
+            for start in range(0, len(fields), batchSize):
+                yield fields[start:start + batchSize], size
+                size = 0
+    elif corpus == 'ubuntu':
+        for file in list_ubuntu_files(path):
+            utterances.extend(read_column(file, 3, strict=True))
+            size += os.path.getsize(file)
+            if len(utterances) >= batchSize:
+                yield utterances, size
+                utterances = list()
+                size = 0
+    else:
+        for dialogueUtterances in iter_dialogue_utterances(iter_dialogues(path)):
+            utterances.extend(dialogueUtterances)
+            if len(utterances) >= batchSize:
+                yield utterances, 0
+                utterances = list()
+        size = os.path.getsize(path)
+    if len(utterances) > 0 or size > 0:
+        yield utterances, size
+
+
+def statistics_job(utterances, mode='exact', error=0.01, tokenizer='nltk'):
+    """
+    tokenize and count a batch of utterances in a worker of the pool
+    :param utterances: list type, utterances of the batch
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :return ucount: int type, number of utterances of the batch
+    :return tcount: int type, number of tokens of the batch
+    :return uniqueUtterance: a counter of unique utterances of the batch
+    :return tokenFrequency: ExactFrequency type, token frequencies of the batch
+    :return busy: float type, seconds the worker spent on the batch
+    """
+    started = time.perf_counter()
+    uniqueUtterance = new_counter(mode, error)
+    tokenFrequency = ExactFrequency()
+    tcount = statistics_batch(utterances, get_tokenizer(tokenizer), uniqueUtterance, tokenFrequency)
+    return len(utterances), tcount, uniqueUtterance, tokenFrequency, time.perf_counter() - started
+
+
+def warm_job(tokenizer='nltk'):
+    """
+    load the tokenizer in a worker of the pool, before the corpora are timed
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :return pid: int type, process id of the worker
+    """
+    get_tokenizer(tokenizer).tokenize_batch(['warm up'])
+    time.sleep(WARM_DELAY)
+    return os.getpid()
+
+
+def warm_pool(executor, workers, tokenizer='nltk', rounds=10):
+    """
+    start the workers of the pool and load the tokenizer in each of them, so the start-up of
+    the pool is not counted in the throughput of the first corpora
+    :param executor: ProcessPoolExecutor type, pool shared by all the corpora
+    :param workers: int type, number of worker processes of the pool
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param rounds: int type, maximum number of rounds of warm-up jobs
+    :return startup: float type, seconds taken to warm the pool
+    """
+    started = time.perf_counter()
+    pids = set()
+    for _ in range(rounds):
+        futures = [executor.submit(warm_job, tokenizer) for _ in range(workers)]
+        pids.update(future.result() for future in futures)
+        if len(pids) >= workers:
+            break
+    return time.perf_counter() - started
+
+
+class CorpusPipeline(object):
+    """
+    the statistics of one corpus as a reader -> tokenizer -> aggregator pipeline: a reader thread
+    reads batches and submits them to the shared pool, a bounded queue holds the submitted batches
+    and an aggregator thread merges their statistics in order; the time the reader is blocked on
+    a full queue and the time the aggregator waits for a batch tell which side holds the pipeline
+    """
+
+    def __init__(self, name, path, corpus, executor, mode='exact', error=0.01, tokenizer='nltk',
+                 frequency='exact', frequencyError=0.0001, batchSize=PIPELINE_BATCH_SIZE, queueSize=QUEUE_SIZE):
+        """
+        :param name: String type, name of the corpus in the report
+        :param path: String type, path of the corpus
+        :param corpus: String type, one of json, twitter, ubuntu
+        :param executor: ProcessPoolExecutor type, pool shared by all the corpora
+        :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+        :param error: float type, relative standard error of the hll mode
+        :param tokenizer: String type, tokenizer backend, one of nltk, fast
+        :param frequency: String type, token frequency counting mode, one of exact, sketch
+        :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+        :param batchSize: int type, number of utterances of a batch
+        :param queueSize: int type, number of batches of the corpus in flight before the reader waits
+        """
+        self.name = name
+        self.path = path
+        self.corpus = corpus
+        self.executor = executor
+        self.mode = mode
+        self.error = error
+        self.tokenizer = tokenizer
+        self.batchSize = batchSize
+        self.queueSize = queueSize
+        self.queue = queue.Queue(queueSize)
+        self.totalUtterance = 0
+        self.totalToken = 0
+        self.uniqueUtterance = new_counter(mode, error)
+        self.tokenFrequency = new_frequency(frequency, frequencyError)
+        self.bytesRead = 0
+        self.batches = 0
+        self.readTime = 0.0
+        self.blockedTime = 0.0
+        self.fullPuts = 0
+        self.depthSum = 0
+        self.maxDepth = 0
+        self.waitTime = 0.0
+        self.mergeTime = 0.0
+        self.busyTime = 0.0
+        self.failure = None
+        self.started = None
+        self.finished = None
+        self.reader = threading.Thread(target=self.read, name=name + '-reader', daemon=True)
+        self.aggregator = threading.Thread(target=self.aggregate, name=name + '-aggregator', daemon=True)
+
+    def start(self):
+        self.started = time.perf_counter()
+        self.reader.start()
+        self.aggregator.start()
+
+    def read(self):
+        """
+        read the batches of the corpus and submit them, the end is marked by None in the queue
+        """
+        try:
+            batches = iter_corpus_batches(self.path, self.corpus, self.batchSize)
+            while self.failure is None:
+                started = time.perf_counter()
+                batch = next(batches, None)
+                self.readTime += time.perf_counter() - started
+                if batch is None:
+                    break
+                utterances, size = batch
+                self.bytesRead += size
+                future = self.executor.submit(statistics_job, utterances, self.mode, self.error, self.tokenizer)
+                depth = self.queue.qsize()
+                self.depthSum += depth
+                self.maxDepth = max(self.maxDepth, depth)
+                if depth >= self.queueSize:
+                    self.fullPuts += 1
+                started = time.perf_counter()
+                self.queue.put(future)
+                self.blockedTime += time.perf_counter() - started
+                self.batches += 1
+        except Exception as e:
+            self.failure = e
+        finally:
+            self.queue.put(None)
+
+    def aggregate(self):
+        """
+        merge the statistics of the batches as they are done, after a failure the queue is
+        still drained so the reader is never left blocked
+        """
+        while True:
+            started = time.perf_counter()
+            future = self.queue.get()
+            if future is None:
+                break
+            if self.failure is not None:
+                future.cancel()
+                continue
+            try:
+                ucount, tcount, partUtterance, partToken, busy = future.result()
+            except Exception as e:
+                self.failure = e
+                continue
+            self.waitTime += time.perf_counter() - started
+            started = time.perf_counter()
+            self.totalUtterance += ucount
+            self.totalToken += tcount
+            self.uniqueUtterance.merge(partUtterance)
+            self.tokenFrequency.add_counts(partToken)
+            self.mergeTime += time.perf_counter() - started
+            self.busyTime += busy
+        self.finished = time.perf_counter()
+
+    def alive(self):
+        return self.reader.is_alive() or self.aggregator.is_alive()
+
+    def join(self):
+        """
+        wait for the end of the pipeline
+        """
+        self.reader.join()
+        self.aggregator.join()
+        if self.failure is not None:
+            raise RuntimeError('the statistics of {} failed: {}'.format(self.name, self.failure)) from self.failure
+
+    def progress(self):
+        """
+        describe the progress of the pipeline, for the periodic report
+        :return line: String type, progress of the corpus
+        """
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return '{}: {} utterances, {:.0f} utt/s, {:.2f} MB/s, queue {}/{}'.format(
+            self.name, self.totalUtterance, self.totalUtterance / elapsed, self.bytesRead / elapsed / 2 ** 20,
+            self.queue.qsize(), self.queueSize)
+
+    def report(self, top=10):
+        """
+        the six statistics of the corpus, its throughput and its backpressure figures
+        :param top: int type, number of most frequent tokens
+        :return report: dict type, figures of the corpus
+        """
+        wall = self.finished - self.started
+        report = dict()
+        report['name'] = self.name
+        report['path'] = self.path
+        report['corpus'] = self.corpus
+        report['utterances'] = self.totalUtterance
+        report['averageLength'] = self.totalToken / self.totalUtterance if self.totalUtterance else 0.0
+        report['tokens'] = self.totalToken
+        report['uniqueUtterances'] = len(self.uniqueUtterance)
+        report['uniqueUtteranceMode'] = describe_counter(self.uniqueUtterance)
+        report['uniqueTokens'] = len(self.tokenFrequency)
+        report['frequencyMode'] = describe_frequency(self.tokenFrequency)
+        report['top'] = self.tokenFrequency.top(top)
+        report['wall'] = wall
+        report['megabytes'] = self.bytesRead / 2 ** 20
+        report['utterancesPerSecond'] = self.totalUtterance / wall if wall > 0 else float('inf')
+        report['megabytesPerSecond'] = report['megabytes'] / wall if wall > 0 else float('inf')
+        report['batches'] = self.batches
+        report['readTime'] = self.readTime
+        report['tokenizeTime'] = self.busyTime
+        report['mergeTime'] = self.mergeTime
+        report['readerBlocked'] = self.blockedTime
+        report['fullQueuePuts'] = self.fullPuts
+        report['aggregatorWaited'] = self.waitTime
+        report['meanQueueDepth'] = self.depthSum / self.batches if self.batches else 0.0
+        report['maxQueueDepth'] = self.maxDepth
+        report['queueSize'] = self.queueSize
+        return report
+
+
+def run_corpora(corpora, workers=None, mode='exact', error=0.01, tokenizer='nltk', frequency='exact',
+                frequencyError=0.0001, batchSize=PIPELINE_BATCH_SIZE, queueSize=QUEUE_SIZE, top=10,
+                interval=REPORT_INTERVAL):
+    """
+    run the pipelines of all the corpora concurrently, their tokenization shares one pool of workers
+    :param corpora: list type, (name, path, corpus) tuples, as given by read_manifest
+    :param workers: int type, number of worker processes, None for the number of cpus
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param batchSize: int type, number of utterances of a batch
+    :param queueSize: int type, number of batches of a corpus in flight before its reader waits
+    :param top: int type, number of most frequent tokens reported
+    :param interval: float type, seconds between the progress lines, 0 for none
+    :return reports: list type, report of each corpus
+    :return summary: dict type, start-up of the pool, wall time of the corpora after it, workers and
+        their utilization over all the corpora
+    """
+    workers = workers or os.cpu_count() or 1
+    # the readers submit from their threads, so the workers are not forked from a threaded process
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    with ProcessPoolExecutor(workers, mp_context=context) as executor:
+        startup = warm_pool(executor, workers, tokenizer)
+        started = time.perf_counter()
+        pipelines = [CorpusPipeline(name, path, corpus, executor, mode, error, tokenizer, frequency,
+                                    frequencyError, batchSize, queueSize) for name, path, corpus in corpora]
+        for pipeline in pipelines:
+            pipeline.start()
+        while True:
+            running = [pipeline for pipeline in pipelines if pipeline.alive()]
+            if len(running) == 0:
+                break
+            running[0].aggregator.join(interval if interval > 0 else None)
+            if interval > 0 and running[0].alive():
+                sys.stderr.write(' | '.join(pipeline.progress() for pipeline in pipelines) + '\n')
+        for pipeline in pipelines:
+            pipeline.join()
+    wall = time.perf_counter() - started
+    reports = [pipeline.report(top) for pipeline in pipelines]
+    summary = dict()
+    summary['startup'] = startup
+    summary['wall'] = wall
+    summary['workers'] = workers
+    summary['utterancesPerSecond'] = sum(report['utterances'] for report in reports) / wall
+    summary['megabytesPerSecond'] = sum(report['megabytes'] for report in reports) / wall
+    summary['workerUtilization'] = sum(report['tokenizeTime'] for report in reports) / (wall * workers)
+    return reports, summary
+
+
+def print_report(report):
+    """
+    print the statistics of a corpus as ds_ex2_task4 does, then its throughput and backpressure
+    :param report: dict type, figures of the corpus given by CorpusPipeline.report
+    """
+    print("\n\nFor the {} ({} corpus)\n \
+    Number of utterances:{}\n \
+    average utterance length (in tokens):{}\n \
+    number of tokens:{}\n \
+    number of unique utterances ({}):{}\n \
+    number of unique tokens:{}\n \
+    token frequencies ({}), top {}:".format(report['name'], report['corpus'], report['utterances'],
+        report['averageLength'], report['tokens'], report['uniqueUtteranceMode'], report['uniqueUtterances'],
+        report['uniqueTokens'], report['frequencyMode'], len(report['top'])))
+    for token, count in report['top']:
+        print('        {}\t{}'.format(token, count))
+    print("     throughput: {:.0f} utterances/s, {:.2f} MB/s, {:.2f} MB in {:.2f}s\n \
+    stages: read {:.2f}s, tokenize {:.2f}s in the workers, merge {:.2f}s\n \
+    backpressure: reader blocked {:.2f}s on a full queue ({} of {} batches), aggregator waited {:.2f}s, \
+queue depth mean {:.1f} max {} of {}".format(report['utterancesPerSecond'], report['megabytesPerSecond'],
+        report['megabytes'], report['wall'], report['readTime'], report['tokenizeTime'], report['mergeTime'],
+        report['readerBlocked'], report['fullQueuePuts'], report['batches'], report['aggregatorWaited'],
+        report['meanQueueDepth'], report['maxQueueDepth'], report['queueSize']))
+
+
+def run_manifest(options):
+    """
+    run the corpora of the manifest given on the command line and print their reports
+    :param options: dict type, command line options given by parse_args
+    :return reports: list type, report of each corpus
+    """
+    corpora = read_manifest(options['manifest'])
+    reports, summary = run_corpora(corpora, int(options['workers']) if 'workers' in options else None,
+                                   options.get('unique', 'exact'), float(options.get('error', 0.01)),
+                                   options.get('tokenizer', 'nltk'), options.get('frequency', 'exact'),
+                                   float(options.get('frequencyError', 0.0001)),
+                                   int(options.get('batch', PIPELINE_BATCH_SIZE)),
+                                   int(options.get('queue', QUEUE_SIZE)), int(options.get('top', 10)),
+                                   float(options.get('interval', REPORT_INTERVAL)))
+    for report in reports:
+        print_report(report)
+    print("\n\nAll {} corpora in {:.2f}s after a pool start-up of {:.2f}s: {:.0f} utterances/s, {:.2f} MB/s, "
+          "{} workers {:.0%} busy".format(len(reports), summary['wall'], summary['startup'],
+                                          summary['utterancesPerSecond'], summary['megabytesPerSecond'],
+                                          summary['workers'], summary['workerUtilization']))
+    if 'output' in options:
+        with open(options['output'], 'w') as of:
+            json.dump({'summary': summary, 'corpora': reports}, of, indent=2)
+    return reports
+
+
+def main():
+    """
+    The main function, run the statistics of the corpora of a manifest concurrently
+    """
+    options = parse_args(sys.argv[1:])
+    if 'manifest' not in options:
+        print('please input the manifest of the corpora')
+        options['manifest'] = input("input:")
+    run_manifest(options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import re
+import json
+
+JSON_CHUNK_SIZE = 1 << 20
+
+READ_CHUNK_SIZE = 1 << 22
+
+FIELD_SEPARATOR = '\x00'
+
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+
+WHITESPACE_PATTERN = re.compile(r'[ \t\n\r]*')
+
+COLUMN_PATTERNS = dict()
+
+
+class JsonObjectStream(object):
+    """
+    read the members of a top-level JSON object one at a time from a file, only the
+    unparsed text and the member being parsed are kept in memory
+    """
+
+    def __init__(self, f, chunkSize=JSON_CHUNK_SIZE):
+        """
+        :param f: file type, text file opened for reading
+        :param chunkSize: int type, number of characters read at a time
+        """
+        self.f = f
+        self.chunkSize = chunkSize
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """
+        drop the parsed text and read more text into the buffer
+        :param size: int type, number of characters to read, None for the chunk size
+        :return read: bool type, whether any text was read
+        """
+        chunk = self.f.read(size or self.chunkSize)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        if len(chunk) == 0:
+            self.eof = True
+        return len(chunk) > 0
+
+    def peek(self):
+        """
+        skip the whitespace and look at the next character
+        :return char: String type, next character, empty at the end of the file
+        """
+        while True:
+            self.position = WHITESPACE_PATTERN.match(self.buffer, self.position).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        """
+        consume the next character, which must be one of chars
+        :param chars: String type, allowed characters
+        :return char: String type, consumed character
+        """
+        char = self.peek()
+        if char == '' or char not in chars:
+            raise ValueError('expected one of {!r} but found {!r} in {}'.format(
+                chars, char or 'the end of the file', self.f.name))
+        self.position += 1
+        return char
+
+    def decode(self):
+        """
+        parse the next JSON value, more text is read until the value is complete,
+        doubling the read size so a large value is not parsed again too often
+        :return value: parsed value
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(max(self.chunkSize, len(self.buffer) - self.position))
+
+
+def iter_json_dialogues(file, chunkSize=JSON_CHUNK_SIZE):
+    """
+    stream the dialogues of a JSON file whose top-level object maps the dialogue names
+    to their turns, one dialogue is parsed at a time
+    :param file: String type, file path of corpus
+    :param chunkSize: int type, number of characters read at a time
+    :return dialogues: generator type, (dialogue name, turns) tuples
+    """
+    with open(file, 'r') as f:
+        stream = JsonObjectStream(f, chunkSize)
+        stream.expect('{')
+        if stream.peek() == '}':
+            return
+        while True:
+            name = stream.decode()
+            stream.expect(':')
+            yield name, stream.decode()
+            if stream.expect(',}') == '}':
+                break
+
+
+def iter_jsonl_dialogues(file):
+    """
+    stream the dialogues of a JSON Lines file, each line holds the turns of a dialogue,
+    or an object mapping dialogue names to their turns
+    :param file: String type, file path of corpus
+    :return dialogues: generator type, (dialogue name, turns) tuples
+    """
+    with open(file, 'r') as f:
+        for lineNumber, line in enumerate(f, 1):
+            if len(line.strip()) == 0:
+                continue
+            value = json.loads(line)
+            if isinstance(value, dict):
+                for name in value:
+                    yield name, value[name]
+            else:
+                yield 'Dialogue{}'.format(lineNumber), value
+
+
+def iter_dialogues(file, chunkSize=JSON_CHUNK_SIZE):
+    """
+    stream the dialogues of a JSON or a JSON Lines file, told apart by the extension
+    :param file: String type, file path of corpus
+    :param chunkSize: int type, number of characters read at a time from a JSON file
+    :return dialogues: generator type, (dialogue name, turns) tuples
+    """
+    if file.lower().endswith(JSON_LINES_EXTENSIONS):
+        return iter_jsonl_dialogues(file)
+    return iter_json_dialogues(file, chunkSize)
+
+
+def iter_dialogue_utterances(dialogues):
+    """
+    take the sys and usr utterances of every turn, a turn missing one of them repeats the
+    previous utterance, as statistics_json always did, and empty utterances are skipped
+    :param dialogues: iterable type, (dialogue name, turns) tuples
+    :return utterances: generator type, list of utterances of each dialogue
+    """
+    utterance = ''
+    for name, turns in dialogues:
+        utterances = list()
+        for turn in turns:
+            for key in ["sys", "usr"]:
+                if key in turn:
+                    utterance = turn[key]
+                if len(utterance) >= 1:
+                    utterances.append(utterance)
+        yield utterances
+
+
+def iter_chunks(file, chunkSize=READ_CHUNK_SIZE, start=0, stop=None):
+    """
+    read a text file as large binary chunks which end on a line boundary, the line
+    endings are translated to \\n as the universal newlines of a text file are
+    :param file: String type, file name
+    :param chunkSize: int type, number of bytes read at a time
+    :param start: int type, byte offset to start at, on a line boundary
+    :param stop: int type, byte offset to stop at, on a line boundary, None for the end
+    :return chunks: generator type, bytes of whole lines
+    """
+    with open(file, 'rb') as f:
+        f.seek(start)
+        remaining = float('inf') if stop is None else stop - start
+        rest = b''
+        while True:
+            data = f.read(int(min(chunkSize, remaining)))
+            remaining -= len(data)
+            if len(data) == 0:
+                break
+            data = rest + data
+            # a \r at the end may be the first half of a \r\n
+            end = len(data) - 1 if data.endswith(b'\r') else len(data)
+            if b'\r' in data:
+                chunk = data[:end].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+            else:
+                chunk = data[:end]
+            cut = chunk.rfind(b'\n') + 1
+            if cut == 0:
+                rest = data
+                continue
+            rest = chunk[cut:] + data[end:]
+            yield chunk[:cut]
+        if len(rest) > 0:
+            yield rest.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+
+def column_pattern(column):
+    """
+    get the pattern which finds a tab separated column on every line of a chunk, the
+    field keeps the newline when it is the last column, as line.split('\\t')[column] does
+    :param column: int type, index of the column
+    :return pattern: compiled pattern with the field as its group
+    """
+    if column not in COLUMN_PATTERNS:
+        COLUMN_PATTERNS[column] = re.compile(rb'^(?:[^\t\n]*\t){%d}([^\t\n]*\n?)' % column, re.M)
+    return COLUMN_PATTERNS[column]
+
+
+def decode_fields(fields):
+    """
+    decode a batch of fields with one decode call
+    :param fields: list type, UTF-8 bytes of the fields
+    :return fields: list type, decoded fields
+    """
+    texts = FIELD_SEPARATOR.encode('utf-8').join(fields).decode('utf-8').split(FIELD_SEPARATOR)
+    if len(texts) != len(fields):
+        return [field.decode('utf-8') for field in fields]
+    return texts
+
+
+def iter_column(file, column, chunkSize=READ_CHUNK_SIZE, decode=True, strict=False):
+    """
+    stream one tab separated column of a file in batches, the lines with fewer columns
+    are skipped, or raise when strict, and the other columns are never split nor decoded
+    :param file: String type, file name
+    :param column: int type, index of the column
+    :param chunkSize: int type, number of bytes read at a time
+    :param decode: bool type, decode the fields, else yield the bytes
+    :param strict: bool type, raise ValueError on a line without the column, as line.split('\t')[column] did
+    :return fields: generator type, list of fields of each chunk
+    """
+    pattern = column_pattern(column)
+    for chunk in iter_chunks(file, chunkSize):
+        fields = pattern.findall(chunk)
+        if strict:
+            numberLines = chunk.count(b'\n') + (0 if chunk.endswith(b'\n') else 1)
+            if len(fields) != numberLines:
+                raise ValueError('{} lines of {} have no column {}'.format(numberLines - len(fields), file, column))
+        yield decode_fields(fields) if decode else fields
+
+
+def read_column(file, column, decode=True, strict=False):
+    """
+    read one tab separated column of a whole file
+    :param file: String type, file name
+    :param column: int type, index of the column
+    :param decode: bool type, decode the fields, else return the bytes
+    :param strict: bool type, raise ValueError on a line without the column
+    :return fields: list type, fields of the lines which have the column
+    """
+    fields = list()
+    for batch in iter_column(file, column, decode=decode, strict=strict):
+        fields.extend(batch)
+    return fields
+
+
+def iter_line_batches(file, chunkSize=READ_CHUNK_SIZE, start=0, stop=None):
+    """
+    stream the lines of a file in batches, as bytes without their newline
+    :param file: String type, file name
+    :param chunkSize: int type, number of bytes read at a time
+    :param start: int type, byte offset to start at, on a line boundary
+    :param stop: int type, byte offset to stop at, on a line boundary, None for the end
+    :return lines: generator type, list of lines of each chunk
+    """
+    for chunk in iter_chunks(file, chunkSize, start, stop):
+        lines = chunk.split(b'\n')
+        if chunk.endswith(b'\n'):
+            lines.pop()
+        yield lines
@@ -0,0 +1,69 @@
+import numpy as np
+
+PAD_ID = 0
+
+
+def encode_corpus(corpus):
+    """
+    map the tokens of a corpus to integer ids once, the id 0 is kept for the padding
+    :param corpus: list type, sentences as lines or lists of tokens
+    :return ids: numpy array type, token ids of all sentences concatenated
+    :return lengths: numpy array type, number of tokens of each sentence
+    """
+    sentences = [sentence.split() if isinstance(sentence, str) else sentence for sentence in corpus]
+    lengths = np.array([len(tokens) for tokens in sentences], dtype=np.int64)
+    tokens = [token for sentence in sentences for token in sentence]
+    vocab = dict((token, i) for i, token in enumerate(dict.fromkeys(tokens), 1))
+    ids = np.fromiter(map(vocab.__getitem__, tokens), dtype=np.int64, count=len(tokens))
+    return ids, lengths
+
+
+def ngram_keys(ids, lengths, n):
+    """
+    give every right-padded n-gram of the corpus an integer key, equal n-grams get equal keys,
+    the n-gram at a token position continues with the padding past the end of its sentence,
+    as nltk.ngrams(tokens, n, pad_right=True) does
+    :param ids: numpy array type, token ids of all sentences concatenated
+    :param lengths: numpy array type, number of tokens of each sentence
+    :param n: int type, n for the n-grams
+    :return keys: numpy array type, key of the n-gram starting at each token position
+    :return numberKeys: int type, number of distinct n-grams, the keys are 0 to numberKeys - 1
+    """
+    ends = np.repeat(np.cumsum(lengths), lengths)
+    positions = np.arange(len(ids))
+    keys = ids - 1
+    numberKeys = int(ids.max()) if len(ids) > 0 else 0
+    padded = np.concatenate((ids, np.zeros(n, dtype=np.int64)))
+    base = numberKeys + 1
+    for k in range(1, n):
+        nextIds = np.where(positions + k < ends, padded[k:k + len(ids)], PAD_ID)
+        # compress the keys to their rank, so they never overflow when more tokens are added
+        uniqueKeys, keys = np.unique(keys * base + nextIds, return_inverse=True)
+        keys = keys.astype(np.int64)
+        numberKeys = len(uniqueKeys)
+    return keys, numberKeys
+
+
+def batch_distinct_n(corpus, ns):
+    """
+    calculate the distinct-n of all sentences together, and the corpus level distinct-n
+    :param corpus: list type, sentences as lines or lists of tokens
+    :param ns: list type, all n for the distinct n
+    :return sentenceDistinctN: dict type, n to the distinct-n of each sentence, 0 for empty sentences
+    :return corpusDistinctN: dict type, n to the unique n-grams of the corpus over its n-grams
+    """
+    ids, lengths = encode_corpus(corpus)
+    sentences = np.repeat(np.arange(len(lengths)), lengths)
+    sentenceDistinctN = dict()
+    corpusDistinctN = dict()
+    for n in ns:
+        # the keys are ranks, so every key below numberKeys is used by some n-gram
+        keys, numberKeys = ngram_keys(ids, lengths, n)
+        sentenceKeys = np.sort(sentences * numberKeys + keys)
+        firsts = np.ones(len(sentenceKeys), dtype=bool)
+        firsts[1:] = sentenceKeys[1:] != sentenceKeys[:-1]
+        counts = np.bincount(sentences[firsts], minlength=len(lengths))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sentenceDistinctN[n] = np.where(lengths > 0, counts / lengths, 0.0)
+        corpusDistinctN[n] = numberKeys / len(ids) if len(ids) > 0 else 0.0
+    return sentenceDistinctN, corpusDistinctN
@@ -1,11 +1,42 @@
 import os
-import re
-import string
-import nltk
-from nltk.tokenize import word_tokenize
-import tqdm
-import json
 import sys
+from multiprocessing import Pool
+from functools import partial
+from unique_counter import new_counter, describe_counter
+from token_frequency import new_frequency, describe_frequency, save_vocabulary
+from tokenizer import PUNCTUATION_PATTERN, get_tokenizer, parity
+from corpus_index import CorpusIndex
+from corpus_reader import iter_dialogues, iter_dialogue_utterances, iter_column, read_column
+from token_cache import TokenCache
+
+CORPORA = ['json', 'twitter', 'ubuntu']
+
+def progress_bar(total=None):
+    """
+    Create a progress bar, tqdm is imported with the first bar so a run which never shows one never loads it
+    :param total: int type, number of steps, None if unknown
+    :return par: tqdm type, the progress bar
+    """
+    import tqdm
+    return tqdm.tqdm(total=total)
+
+def corpus_kind(inputs, corpus=None):
+    """
+    Tell the kind of a corpus from its path, a .json file is a json corpus, a .out file a twitter corpus
+    and anything else the root dir of an ubuntu corpus
+    :param inputs: String type, path of the corpus
+    :param corpus: String type, kind given on the command line, None to tell it from the path
+    :return corpus: String type, one of json, twitter, ubuntu
+    """
+    if corpus is not None:
+        if corpus not in CORPORA:
+            raise ValueError('unknown corpus: {}, expected one of {}'.format(corpus, CORPORA))
+        return corpus
+    if ".json" in inputs:
+        return 'json'
+    elif ".out" in inputs:
+        return 'twitter'
+    return 'ubuntu'
 
 def normalize(utterance):
     """
@@ -13,168 +44,517 @@ def normalize(utterance):
     :param utterance: String type, a line of sentence, which need to be normalized
     :return tokens: List type, normalized tokens
     """
-    p = re.compile(r"[!\"#$%&\'()*+,-./:;<=>?@\\\[\]^_`{|}~]")
-    uttWithoutPun = p.sub(' ', utterance.lower())
+    from nltk.tokenize import word_tokenize
+    uttWithoutPun = PUNCTUATION_PATTERN.sub(' ', utterance.lower())
     tokens = word_tokenize(uttWithoutPun)
     return tokens
 
-def process_ubuntu(root):
+def process_ubuntu(root, workers=1, mode='exact', error=0.01, tokenizer='nltk', index=None,
+                   frequency='exact', frequencyError=0.0001, tokenCache=None):
     """
     Process the ubuntu corpus, statistic the utterance, tokens
     :param toot: String type, root dir of corpus
+    :param workers: int type, number of worker processes, 1 means serial
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param index: String type, file path of the on-disk index, None means no index
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
     :return totalUtterance: total number of utterances
     :return totalToken: total number of tokens
-    :return dictUtterance: a dict of unique utterances
-    :return dictToken: a dict of unique tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
+    """
+    if index is not None:
+        result = process_ubuntu_incremental(root, index, workers, mode, error, tokenizer,
+                                            frequency=frequency, frequencyError=frequencyError, tokenCache=tokenCache)
+    elif workers > 1:
+        result = process_ubuntu_parallel(root, workers, mode, error, tokenizer,
+                                         frequency=frequency, frequencyError=frequencyError, tokenCache=tokenCache)
+    else:
+        result = process_ubuntu_serial(root, mode, error, tokenizer, frequency, frequencyError, tokenCache)
+    if tokenCache is not None:
+        # the entries of the files are written without eviction, the cache is trimmed once
+        tokenCache.evict()
+    return result
+
+def process_ubuntu_serial(root, mode='exact', error=0.01, tokenizer='nltk', frequency='exact', frequencyError=0.0001,
+                          tokenCache=None):
+    """
+    Process the ubuntu corpus one file after the other
+    :param root: String type, root dir of corpus
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return totalUtterance: total number of utterances
+    :return totalToken: total number of tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
     """
     totalUtterance=0
     totalToken=0
-    dictUtterance=dict() 
-    dictToken=dict()
-    par = tqdm.tqdm()
+    uniqueUtterance=new_counter(mode, error) 
+    tokenFrequency=new_frequency(frequency, frequencyError)
+    par = progress_bar()
     for dirName, subdirList, fileList in os.walk(root):
         par.update(1)
         for fname in fileList:
             if ".tsv" in fname:
                 file = os.path.join(dirName, fname)
-                totalUtterance, totalToken, dictUtterance, dictToken = statistics_ubuntu(file, \
-                    totalUtterance, totalToken, dictUtterance, dictToken)
-    return totalUtterance, totalToken, dictUtterance, dictToken
+                totalUtterance, totalToken, uniqueUtterance, tokenFrequency = statistics_ubuntu(file, \
+                    totalUtterance, totalToken, uniqueUtterance, tokenFrequency, tokenizer, tokenCache)
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
+
+def list_ubuntu_files(root):
+    """
+    Collect all the .tsv files of the ubuntu corpus
+    :param root: String type, root dir of corpus
+    :return files: list type, file paths of the corpus
+    """
+    files = list()
+    for dirName, subdirList, fileList in os.walk(root):
+        for fname in fileList:
+            if ".tsv" in fname:
+                files.append(os.path.join(dirName, fname))
+    return files
+
+def statistics_ubuntu_shard(files, mode='exact', error=0.01, tokenizer='nltk', frequency='exact', frequencyError=0.0001,
+                            tokenCache=None):
+    """
+    Process a shard of files of ubuntu corpus in a worker process
+    :param files: list type, file paths of the shard
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return totalUtterance: number of utterances in the shard
+    :return totalToken: number of tokens in the shard
+    :return uniqueUtterance: a counter of unique utterances in the shard
+    :return tokenFrequency: a counter of token frequencies in the shard
+    """
+    totalUtterance=0
+    totalToken=0
+    uniqueUtterance=new_counter(mode, error)
+    tokenFrequency=new_frequency(frequency, frequencyError)
+    for file in files:
+        totalUtterance, totalToken, uniqueUtterance, tokenFrequency = statistics_ubuntu(file, \
+            totalUtterance, totalToken, uniqueUtterance, tokenFrequency, tokenizer, tokenCache)
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
+
+def merge_statistics(partials, mode='exact', error=0.01, frequency='exact', frequencyError=0.0001):
+    """
+    Reduce the partial statistics returned by the workers
+    :param partials: iterable type, (totalUtterance, totalToken, uniqueUtterance, tokenFrequency) tuples
+    :param mode: String type, unique utterance counting mode of the partials
+    :param error: float type, relative standard error of the hll mode
+    :param frequency: String type, token frequency counting mode of the partials
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :return totalUtterance: total number of utterances
+    :return totalToken: total number of tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
+    """
+    totalUtterance=0
+    totalToken=0
+    uniqueUtterance=new_counter(mode, error)
+    tokenFrequency=new_frequency(frequency, frequencyError)
+    for ucount, tcount, partUtterance, partToken in partials:
+        totalUtterance += ucount
+        totalToken += tcount
+        uniqueUtterance.merge(partUtterance)
+        tokenFrequency.merge(partToken)
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
+
+def process_ubuntu_parallel(root, workers, mode='exact', error=0.01, tokenizer='nltk', shardsPerWorker=4,
+                            frequency='exact', frequencyError=0.0001, tokenCache=None):
+    """
+    Process the ubuntu corpus with a pool of worker processes, each worker
+    statistics a shard of files and the partial results are merged afterwards
+    :param root: String type, root dir of corpus
+    :param workers: int type, number of worker processes
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param shardsPerWorker: int type, number of shards per worker, for load balancing
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return totalUtterance: total number of utterances
+    :return totalToken: total number of tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
+    """
+    files = list_ubuntu_files(root)
+    numberShards = max(1, min(len(files), workers * shardsPerWorker))
+    shards = [files[i::numberShards] for i in range(numberShards)]
+    par = progress_bar(total=len(files))
+    partials = list()
+    worker = partial(statistics_ubuntu_shard, mode=mode, error=error, tokenizer=tokenizer,
+                     frequency=frequency, frequencyError=frequencyError, tokenCache=tokenCache)
+    with Pool(workers) as pool:
+        for shard, partialResult in zip(shards, pool.imap(worker, shards)):
+            par.update(len(shard))
+            partials.append(partialResult)
+    par.close()
+    return merge_statistics(partials, mode, error, frequency, frequencyError)
 
-def statistics_ubuntu(file, totalUtterance, totalToken, dictUtterance, dictToken):
+def statistics_ubuntu_file(file, mode='exact', error=0.01, tokenizer='nltk', tokenCache=None):
+    """
+    Process a single file of ubuntu corpus on its own, for the on-disk index
+    :param file: String type, file path
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return file: String type, file path
+    :return size: int type, file size in bytes
+    :return mtime: int type, modification time in nanoseconds
+    :return ucount: number of utterances of the file
+    :return tcount: number of tokens of the file
+    :return uniqueUtterance: a counter of unique utterances of the file
+    :return tokenFrequency: an exact counter of token frequencies of the file
+    """
+    st = os.stat(file)
+    ucount, tcount, uniqueUtterance, tokenFrequency = statistics_ubuntu(file, 0, 0, \
+        new_counter(mode, error), new_frequency('exact'), tokenizer, tokenCache)
+    return file, st.st_size, st.st_mtime_ns, ucount, tcount, uniqueUtterance, tokenFrequency
+
+def process_ubuntu_incremental(root, indexFile, workers=1, mode='exact', error=0.01, tokenizer='nltk', commitEvery=1000,
+                               frequency='exact', frequencyError=0.0001, tokenCache=None):
+    """
+    Process the ubuntu corpus incrementally, only the new or changed files are processed
+    and stored in the on-disk index, the totals are merged from all the indexed files
+    :param root: String type, root dir of corpus
+    :param indexFile: String type, file path of the on-disk index
+    :param workers: int type, number of worker processes, 1 means serial
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param commitEvery: int type, number of files processed between two commits of the index
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return totalUtterance: total number of utterances
+    :return totalToken: total number of tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
+    """
+    index = CorpusIndex(indexFile, mode, error, tokenizer)
+    files = list_ubuntu_files(root)
+    index.prune(files)
+    staleFiles = index.stale_files(files)
+    print('{} of {} files are new or changed'.format(len(staleFiles), len(files)))
+    worker = partial(statistics_ubuntu_file, mode=mode, error=error, tokenizer=tokenizer, tokenCache=tokenCache)
+    pool = None
+    if workers > 1 and len(staleFiles) > 0:
+        pool = Pool(workers)
+        results = pool.imap_unordered(worker, staleFiles, chunksize=64)
+    else:
+        results = map(worker, staleFiles)
+    par = progress_bar(total=len(staleFiles))
+    for count, result in enumerate(results, 1):
+        index.put(*result)
+        par.update(1)
+        if count % commitEvery == 0:
+            index.commit()
+    par.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    index.commit()
+    result = index.totals(new_counter(mode, error), new_frequency(frequency, frequencyError))
+    index.close()
+    return result
+
+def open_cached_tokens(tokenCache, file, tokenizer):
+    """
+    Find the tokens of a corpus file in the token cache, or start its entry
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :param file: String type, file path of corpus
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :return cached: TokenizedCorpus type, tokens of each utterance of the file, None if not cached
+    :return writer: TokenizedWriter type, writer of the new entry, None if cached or no cache
+    """
+    if tokenCache is None:
+        return None, None
+    key = tokenCache.key(file, 'normalize:' + tokenizer)
+    cached = tokenCache.load(key)
+    return cached, tokenCache.writer(key) if cached is None else None
+
+def tokenize_cached(utterances, engine, position, cached, writer):
+    """
+    Tokenize a batch of utterances, or read their tokens from the token cache
+    :param utterances: list type, utterances of the batch
+    :param engine: tokenizer backend returned by get_tokenizer
+    :param position: int type, number of utterances of the file before the batch
+    :param cached: TokenizedCorpus type, tokens of each utterance of the file, None to tokenize
+    :param writer: TokenizedWriter type, writer of the new cache entry, None for no entry
+    :return tokensList: list type, list of tokens of each utterance
+    """
+    if cached is not None:
+        return cached.slice(position, position + len(utterances))
+    tokensList = engine.tokenize_batch(utterances)
+    if writer is not None:
+        writer.add(tokensList)
+    return tokensList
+
+def statistics_batch(utterances, engine, uniqueUtterance, tokenFrequency, tokensList=None):
+    """
+    Statistic a batch of utterances, which are tokenized together
+    :param utterances: list type, utterances of the batch
+    :param engine: tokenizer backend returned by get_tokenizer
+    :param uniqueUtterance: a counter of unique utterances
+    :param tokenFrequency: a counter of token frequencies
+    :param tokensList: list type, tokens of each utterance if already tokenized, None to tokenize
+    :return tcount: number of tokens in the batch
+    """
+    if tokensList is None:
+        tokensList = engine.tokenize_batch(utterances)
+    tcount = 0
+    batchTokens = list()
+    for utterance, tokens in zip(utterances, tokensList):
+        uniqueUtterance.add(utterance)
+        tcount += len(tokens)
+        batchTokens.extend(tokens)
+    tokenFrequency.add_tokens(batchTokens)
+    return tcount
+
+
+def statistics_ubuntu(file, totalUtterance, totalToken, uniqueUtterance, tokenFrequency, tokenizer='nltk', tokenCache=None):
     """
     Process a sigle file of ubuntu corpus, statistic the utterance, tokens
     :param file: String type, root dir of corpus
     :param totalUtterance: total number of utterances
     :param totalToken: total number of tokens
-    :param dictUtterance: a dict of unique utterances
-    :param dictToken:  a dict of unique tokens
+    :param uniqueUtterance: a counter of unique utterances
+    :param tokenFrequency: a counter of token frequencies
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
     :return totalUtterance: updated total number of utterances
     :return totalToken: updated total number of tokens
-    :return dictUtterance: updated dict of unique utterances
-    :return dictToken: updated dict of unique tokens
+    :return uniqueUtterance: updated counter of unique utterances
+    :return tokenFrequency: updated counter of token frequencies
     """
-    ucount = 0
-    tcount = 0
-    with open(file, 'r') as f:
-        for line in f:
-            utterance =  line.split('\t')[3]
-            ucount += 1
-            if utterance not in dictUtterance:
-                dictUtterance[utterance] = 1
-            tokens = normalize(utterance)
-            tcount += len(tokens)
-            for token in tokens:
-                if token not in dictToken:
-                    dictToken[token] = 1
+    engine = get_tokenizer(tokenizer)
+    # a line without the utterance column raises, as line.split('\t')[3] did
+    utterances = read_column(file, 3, strict=True)
+    cached, writer = open_cached_tokens(tokenCache, file, tokenizer)
+    tokensList = tokenize_cached(utterances, engine, 0, cached, writer)
+    if writer is not None:
+        writer.close(evict=False)
+    ucount = len(utterances)
+    tcount = statistics_batch(utterances, engine, uniqueUtterance, tokenFrequency, tokensList)
     totalUtterance += ucount
     totalToken += tcount
-    return totalUtterance, totalToken, dictUtterance, dictToken
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
 
-def statistics_twitter(file):
+
+def statistics_twitter(file, mode='exact', error=0.01, tokenizer='nltk', batchSize=10000,
+                       frequency='exact', frequencyError=0.0001, tokenCache=None):
     """
     Process the twitter corpus, statistic the utterance, tokens
     :param file: String type, file path of corpus
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param batchSize: int type, number of utterances tokenized together
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
     :return totalUtterance: total number of utterances
     :return totalToken: total number of tokens
-    :return dictUtterance: a dict of unique utterances
-    :return dictToken: a dict of unique tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
     """
     totalUtterance=0
     totalToken=0
-    dictUtterance=dict() 
-    dictToken=dict()
+    uniqueUtterance=new_counter(mode, error) 
+    tokenFrequency=new_frequency(frequency, frequencyError)
+    engine = get_tokenizer(tokenizer)
     ucount = 0
     tcount = 0
-    with open(file, 'r') as f:
-        par = tqdm.tqdm()
-        for line in f:
-            par.update(1)
-            utterance =  line.split('\t')
-            if len(utterance)>1:
-                utterance = utterance[1]
-                ucount += 1
-                if utterance not in dictUtterance:
-                    dictUtterance[utterance] = 1
-                tokens = normalize(utterance)
-                tcount += len(tokens)
-                for token in tokens:
-                    if token not in dictToken:
-                        dictToken[token] = 1
+    cached, writer = open_cached_tokens(tokenCache, file, tokenizer)
+    par = progress_bar()
+    for fields in iter_column(file, 1):
+        for start in range(0, len(fields), batchSize):
+            utterances = fields[start:start + batchSize]
+            par.update(len(utterances))
+            tokensList = tokenize_cached(utterances, engine, ucount, cached, writer)
+            ucount += len(utterances)
+            tcount += statistics_batch(utterances, engine, uniqueUtterance, tokenFrequency, tokensList)
+    if writer is not None:
+        writer.close()
     totalUtterance += ucount
     totalToken += tcount
-    return totalUtterance, totalToken, dictUtterance, dictToken
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
 
-def statistics_json(file):
+def statistics_json(file, mode='exact', error=0.01, tokenizer='nltk', frequency='exact', frequencyError=0.0001,
+                    tokenCache=None):
     """
-    Process the json corpus, statistic the utterance, tokens
+    Process the json corpus, statistic the utterance, tokens, the dialogues are streamed
+    one at a time, from a JSON object of dialogues or a JSON Lines file
     :param file: String type, file path of corpus
+    :param mode: String type, unique utterance counting mode, one of raw, exact, hll
+    :param error: float type, relative standard error of the hll mode
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param frequency: String type, token frequency counting mode, one of exact, sketch
+    :param frequencyError: float type, error bound of the sketch mode relative to the number of tokens
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
     :return totalUtterance: total number of utterances
     :return totalToken: total number of tokens
-    :return dictUtterance: a dict of unique utterances
-    :return dictToken: a dict of unique tokens
+    :return uniqueUtterance: a counter of unique utterances
+    :return tokenFrequency: a counter of token frequencies
     """
     totalUtterance=0
     totalToken=0
-    dictUtterance=dict() 
-    dictToken=dict()
+    uniqueUtterance=new_counter(mode, error) 
+    tokenFrequency=new_frequency(frequency, frequencyError)
+    engine = get_tokenizer(tokenizer)
     ucount = 0
     tcount = 0
-    with open(file, 'r') as f:
-        dialogues = json.load(f)
-        par = tqdm.tqdm()
-        for dia in dialogues:
-            par.update(1)
-            for turn in dialogues[dia]:
-                for key in ["sys", "usr"]:
-                    if key in turn :
-                        utterance = turn[key]
-                    if len(utterance)>=1:
-                        ucount += 1
-                        if utterance not in dictUtterance:
-                            dictUtterance[utterance] = 1
-                        tokens = normalize(utterance)
-                        tcount += len(tokens)
-                        for token in tokens:
-                            if token not in dictToken:
-                                dictToken[token] = 1
+    cached, writer = open_cached_tokens(tokenCache, file, tokenizer)
+    par = progress_bar()
+    for utterances in iter_dialogue_utterances(iter_dialogues(file)):
+        par.update(1)
+        tokensList = tokenize_cached(utterances, engine, ucount, cached, writer)
+        ucount += len(utterances)
+        tcount += statistics_batch(utterances, engine, uniqueUtterance, tokenFrequency, tokensList)
+    if writer is not None:
+        writer.close()
 
     totalUtterance += ucount
     totalToken += tcount
-    return totalUtterance, totalToken, dictUtterance, dictToken
+    return totalUtterance, totalToken, uniqueUtterance, tokenFrequency
+
+def sample_utterances(inputs, size, corpus=None):
+    """
+    Read the first utterances of a corpus, as the sample for the tokenizer parity test
+    :param inputs: String type, path of the corpus
+    :param size: int type, number of utterances in the sample
+    :param corpus: String type, one of json, twitter, ubuntu, None to tell it from the path
+    :return utterances: list type, sampled utterances
+    """
+    utterances = list()
+    corpus = corpus_kind(inputs, corpus)
+    if corpus == 'json':
+        for name, turns in iter_dialogues(inputs):
+            for turn in turns:
+                for key in ["sys", "usr"]:
+                    if key in turn and len(turn[key])>=1:
+                        utterances.append(turn[key])
+            if len(utterances) >= size:
+                break
+    elif corpus == 'twitter':
+        for fields in iter_column(inputs, 1):
+            utterances.extend(fields)
+            if len(utterances) >= size:
+                break
+    else:
+        for file in list_ubuntu_files(inputs):
+            utterances.extend(read_column(file, 3, strict=True))
+            if len(utterances) >= size:
+                break
+    return utterances[:size]
+
+def parse_args(args):
+    """
+    Parse the command line arguments given as -name value pairs, --name is the same as -name
+    :param args: list type, command line arguments
+    :return options: dict type, option name to option value
+    """
+    options = dict()
+    for i in range(0, len(args)-1, 2):
+        if args[i].startswith('-'):
+            options[args[i].lstrip('-')] = args[i+1]
+    return options
 
 def main():
     """
        The main function
     """
     args = sys.argv[1:]
-    if len(args) == 2 and args[0] == '-path':
-        inputs = args[1]
+    options = parse_args(args)
+    if 'manifest' in options:
+        # the corpora of the manifest are run concurrently, with -workers, -unique, -error, -tokenizer,
+        # -frequency, -frequencyError and -top as below, and the options of the pipeline:
+        # -batch utterances per batch, -queue batches of a corpus in flight before its reader waits,
+        # -interval seconds between the progress lines on stderr, 0 for none, -output JSON report file
+        from corpus_pipeline import run_manifest
+        run_manifest(options)
+        return
+    if 'path' in options:
+        inputs = options['path']
     else: 
         print('please input the path of the corpus')
         inputs = input("input:")
+    workers = int(options.get('workers', 1))
+    mode = options.get('unique', 'exact')
+    error = float(options.get('error', 0.01))
+    tokenizer = options.get('tokenizer', 'nltk')
+    index = options.get('index', None)
+    frequency = options.get('frequency', 'exact')
+    frequencyError = float(options.get('frequencyError', 0.0001))
+    top = int(options.get('top', 10))
+    kind = corpus_kind(inputs, options.get('corpus', None))
+    tokenCache = None
+    if 'cache' in options:
+        tokenCache = TokenCache(options['cache'], int(float(options.get('cacheSize', 1024)) * (1 << 20)))
+    if 'parity' in options:
+        report = parity(sample_utterances(inputs, int(options['parity']), kind), 'nltk', tokenizer)
+        print("\n\nTokenizer parity of {} against nltk\n \
+    utterances:{}\n \
+    differing utterances:{}\n \
+    reference tokens:{}\n \
+    candidate tokens:{}\n \
+    differing tokens:{}\n".format(tokenizer,report['utterances'],report['differingUtterances'],\
+        report['referenceTokens'],report['candidateTokens'],report['differingTokens']))
+        for utterance, refTokens, candTokens in report['examples']:
+            print('{!r}\n    nltk: {}\n    {}: {}'.format(utterance, refTokens, tokenizer, candTokens))
+        return
+    if 'export' in options:
+        from utterance_export import export_corpus
+        numberRecords, vocabularySize = export_corpus(inputs, options['export'], tokenizer, options.get('vocab', None),
+            corpus=kind)
+        print("\n\nExported {} utterances to {}, vocabulary of {} tokens".format(numberRecords, options['export'], vocabularySize))
+        return
     
     corpus=""
-    if ".json" in inputs:
-        totalUtterance, totalToken, dictUtterance, dictToken = statistics_json(inputs)
+    if kind == 'json':
+        totalUtterance, totalToken, uniqueUtterance, tokenFrequency = statistics_json(inputs, mode, error, tokenizer,
+            frequency=frequency, frequencyError=frequencyError, tokenCache=tokenCache)
         corpus = 'Json corpus'
 
-    elif ".out" in inputs:
-        totalUtterance, totalToken, dictUtterance, dictToken = statistics_twitter(inputs)
+    elif kind == 'twitter':
+        totalUtterance, totalToken, uniqueUtterance, tokenFrequency = statistics_twitter(inputs, mode, error, tokenizer,
+            frequency=frequency, frequencyError=frequencyError, tokenCache=tokenCache)
         corpus = 'Twitter corpus'
     else:
-        totalUtterance, totalToken, dictUtterance, dictToken = process_ubuntu(inputs)
+        totalUtterance, totalToken, uniqueUtterance, tokenFrequency = process_ubuntu(inputs, workers, mode, error, tokenizer, index,
+            frequency, frequencyError, tokenCache)
         corpus = 'Ubuntu corpus'
-    uniqueToken = len(dictToken)
-    uniqueUtterance = len(dictUtterance)
+    uniqueToken = len(tokenFrequency)
     averageUtterance = totalToken/totalUtterance
     print("\n\nFor the {}\n \
     Number of utterances:{}\n \
     average utterance length (in tokens):{}\n \
     number of tokens:{}\n \
-    number of unique utterances:{}\n \
-    number of unique tokens:{}\n".format(corpus,totalUtterance,\
-        averageUtterance,totalToken,uniqueUtterance,uniqueToken))
+    number of unique utterances ({}):{}\n \
+    number of unique tokens:{}\n \
+    token frequencies ({}), top {}:".format(corpus,totalUtterance,\
+        averageUtterance,totalToken,describe_counter(uniqueUtterance),len(uniqueUtterance),uniqueToken,\
+        describe_frequency(tokenFrequency),top))
+    for token, count in tokenFrequency.top(top):
+        print('        {}\t{}'.format(token, count))
+    if 'frequencies' in options:
+        size = save_vocabulary(tokenFrequency, options['frequencies'], int(options.get('minCount', 1)))
+        print("\nSaved {} token frequencies to {}".format(size, options['frequencies']))
 
 if __name__ == '__main__':
     main()
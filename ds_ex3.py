@@ -1,11 +1,19 @@
 import re
 import numpy as np
-import sacrebleu
 import sys
 import os
 import warnings
-from rouge_metric import PyRouge
-import nltk
+import gc
+import multiprocessing
+import time
+from ngram_stats import NgramStatistics, HypothesisStatistics, corpus_bleu, tokenize_13a, sentence_bleu_statistics
+from corpus_pack import AlignedCorpus
+from distinct_ngrams import batch_distinct_n
+from rouge_scorer import RougeReferences, corpus_rouge, tokenize_split, sentence_rouge
+from token_cache import TokenCache
+from significance import SufficientStatistics, analyze, write_analysis, CONFIDENCE
+from sentence_scores import write_sentence_scores, SENTENCE_BATCH_SIZE
+from stage_profiler import StageProfiler
 
 warnings.filterwarnings('ignore')
 
@@ -38,41 +46,117 @@ def average_utterances_rating_without_polar(line):
     return averageRatingWithoutPolar
 
 
+SYSTEM_PATTERN = re.compile(r'^S_\d+')
+RATE_PATTERN = re.compile(r'(?<=\[|,)\d+')
+UTTERANCE_PATTERN = re.compile(r'\tU_(\d+)')
+
+
+def parse_human_rating(file):
+    """
+    parse the whole human rating file once into a packed ratings matrix, the lines
+    with fewer raters are padded and the valid ratings are marked by the mask
+    :param file: String type, human rating file name
+    :return systemIds: list type, system ids in order of appearance
+    :return rowSystem: numpy array type, index into systemIds for each rated line
+    :return ratings: numpy array type, (lines x max raters) ratings matrix, padded with 0
+    :return mask: numpy array type, (lines x max raters) True for the valid ratings
+    :return rowUtterance: numpy array type, rated utterance number of each rated line, -1 if missing
+    """
+    systemIds = list()
+    systemIndex = dict()
+    rowSystem = list()
+    rowUtterance = list()
+    lengths = list()
+    rates = list()
+    with open(file, 'r') as hf:
+        lines = hf.read().splitlines()
+    for line in lines:
+        systemId = SYSTEM_PATTERN.match(line)
+        if systemId is not None:
+            systemId = systemId.group(0)
+            if systemId not in systemIndex:
+                systemIndex[systemId] = len(systemIds)
+                systemIds.append(systemId)
+            lineRates = RATE_PATTERN.findall(line)
+            rowSystem.append(systemIndex[systemId])
+            utterance = UTTERANCE_PATTERN.search(line)
+            rowUtterance.append(int(utterance.group(1)) if utterance is not None else -1)
+            lengths.append(len(lineRates))
+            rates.extend(lineRates)
+    lengths = np.array(lengths, dtype=np.int64)
+    maxRaters = int(lengths.max()) if len(lengths) > 0 else 0
+    mask = np.arange(maxRaters)[np.newaxis, :] < lengths[:, np.newaxis]
+    ratings = np.zeros(mask.shape, dtype=np.int64)
+    ratings[mask] = np.array(rates).astype(np.int64)
+    return systemIds, np.array(rowSystem, dtype=np.int64), ratings, mask, np.array(rowUtterance, dtype=np.int64)
+
+
+def batch_utterances_rating(ratings, mask):
+    """
+    calculate the average and the average without the max and min value of every line at once
+    :param ratings: numpy array type, (lines x max raters) ratings matrix
+    :param mask: numpy array type, (lines x max raters) True for the valid ratings
+    :return averageRating: numpy array type, average rating of each line
+    :return averageRatingWithoutPolar: numpy array type, average rating of each line without
+        one max and one min value, nan for lines with fewer than three ratings
+    """
+    counts = mask.sum(axis=1)
+    sums = np.where(mask, ratings, 0).sum(axis=1)
+    maxRates = np.where(mask, ratings, np.iinfo(np.int64).min).max(axis=1, initial=np.iinfo(np.int64).min)
+    minRates = np.where(mask, ratings, np.iinfo(np.int64).max).min(axis=1, initial=np.iinfo(np.int64).max)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        averageRating = sums / counts
+        averageRatingWithoutPolar = np.where(counts > 2, (sums - maxRates - minRates) / (counts - 2), np.nan)
+    return averageRating, averageRatingWithoutPolar
+
+
 def average_human_rating(file):
     """
     calculate the average human rating of  the corpus
     :param file: String type, human rating file name
     :return averageRating: dict type, average human rating for corpus level
     """
-    humanScore = dict()
-    humanScoreWithoutPolar = dict()
     averageHumanRating = dict()
-    for ids in range(1, 22):
-        systemId = 'S_' + str(ids)
-        humanScore[systemId] = list()
-        humanScoreWithoutPolar[systemId] = list()
+    systemIds, rowSystem, ratings, mask, rowUtterance = parse_human_rating(file)
+    averageRating, averageRatingWithoutPolar = batch_utterances_rating(ratings, mask)
+    for index in sorted(range(0, len(systemIds)), key=lambda index: natural_key(systemIds[index])):
+        systemId = systemIds[index]
         averageHumanRating[systemId] = list()
-    pattern = re.compile(r'^S_\d+')
-
-    with open(file, 'r') as hf:
-        for line in hf:
-            systemId = pattern.findall(line)
-            if len(systemId) > 0:
-                averageUtterancesRating = average_utterances_rating(line)
-                humanScore[systemId[0]].append(averageUtterancesRating)
-                averageUtterancesRatingWithoutPolar = average_utterances_rating_without_polar(line)
-                humanScoreWithoutPolar[systemId[0]].append(averageUtterancesRatingWithoutPolar)
-
-    for ids in humanScore:
-        npRates = np.array(humanScore[ids])
-        averageRating = npRates.mean()
-        npRatesWithoutPolar = np.array(humanScoreWithoutPolar[ids])
-        averageRatingWithoutPolar = npRatesWithoutPolar.mean()
-        averageHumanRating[ids].append(averageRating)
-        averageHumanRating[ids].append(averageRatingWithoutPolar)
+        rows = rowSystem == index
+        averageHumanRating[systemId].append(averageRating[rows].mean())
+        averageHumanRating[systemId].append(averageRatingWithoutPolar[rows].mean())
     return averageHumanRating
 
 
+def natural_key(name):
+    """
+    the sort key which orders the numbers in a name by value, S_2 before S_10
+    :param name: String type, system or reference name
+    :return key: list type, sort key
+    """
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def list_systems(path):
+    """
+    discover the systems from the hypotheses file path, one .txt file per system
+    :param path: String type, hypotheses file path
+    :return systemIds: list type, system ids in natural order
+    """
+    systemIds = [os.path.splitext(fname)[0] for fname in os.listdir(path) if fname.endswith('.txt')]
+    return sorted(systemIds, key=natural_key)
+
+
+def list_references(path):
+    """
+    discover the references from the references file path, one .txt file per reference,
+    the original references first and the others in natural order
+    :param path: String type, references file path
+    :return referenceNames: list type, reference names
+    """
+    referenceNames = [os.path.splitext(fname)[0] for fname in os.listdir(path) if fname.endswith('.txt')]
+    return sorted(referenceNames, key=lambda name: (name != 'original_refs', natural_key(name)))
+
 
 def get_hypotheses(path):
     """
@@ -80,19 +164,13 @@ def get_hypotheses(path):
     :param path: String type, hypotheses file path
     :return hypotheses: dict type, hypotheses data for each system 
     """
-    fileList = os.listdir(path)
     hypotheses = dict()
-    for ids in range(1, 21):
-        systemId = 'S_' + str(ids)
+    for systemId in list_systems(path):
         hypotheses[systemId] = list()
-
-    for fname in fileList:
-        if ".txt" in fname:
-            systemId = re.findall(r'^S_\d+', fname)[0]
-            file = os.path.join(path, fname)
-            with open(file, 'r') as sh:
-                for line in sh:
-                    hypotheses[systemId].append(line)
+        file = os.path.join(path, systemId + '.txt')
+        with open(file, 'r') as sh:
+            for line in sh:
+                hypotheses[systemId].append(line)
     return hypotheses
 
 
@@ -102,47 +180,95 @@ def get_references(path):
     :param path: String type, references file path
     :return references: dict type, references data 
     """
-    fileList = os.listdir(path)
-    references = dict()
     referencesList = list()
-    references['original_refs'] = list()
-    for ids in range(1, 11):
-        resultId = 'refgen_result' + str(ids)
-        references[resultId] = list()
-
-    for fname in fileList:
-        if ".txt" in fname:
-            resultId = re.split(r'\.', fname)[0]
-            file = os.path.join(path, fname)
-            with open(file, 'r') as sh:
-                for line in sh:
-                    references[resultId].append(line)
-    for rid in references:
-        referencesList.append(references[rid])
+    for resultId in list_references(path):
+        file = os.path.join(path, resultId + '.txt')
+        with open(file, 'r') as sh:
+            referencesList.append(sh.readlines())
     return referencesList
 
 
-def set_ref_weight(numberUtterances):
+def cached_references(tokenCache, files, references, metrics=None):
+    """
+    get the tokens of the references for bleu and for rouge from the token cache,
+    an unchanged reference file is read from the cache instead of tokenized again
+    :param tokenCache: TokenCache type, cache of the tokenized files
+    :param files: list type, file of each reference, whose content identifies its lines
+    :param references: list type, one list of lines for each reference
+    :param metrics: list type, selected metrics of METRICS, None for all
+    :return bleuTokens: list type, tokens of each line of each reference for bleu, None without bleu
+    :return rougeTokens: list type, tokens of each line of each reference for rouge, None without rouge
+    """
+    if metrics is None:
+        metrics = METRICS
+    bleuTokens = None
+    rougeTokens = None
+    if 'bleu' in metrics:
+        import sacrebleu
+        bleuConfig = 'sacrebleu-{}:13a'.format(sacrebleu.__version__)
+        bleuTokens = [list(tokenCache.tokenize(file, bleuConfig, lines, tokenize_13a))
+                      for file, lines in zip(files, references)]
+    if 'rouge' in metrics:
+        rougeTokens = [list(tokenCache.tokenize(file, 'split', lines, tokenize_split))
+                       for file, lines in zip(files, references)]
+    return bleuTokens, rougeTokens
+
+
+DEFAULT_GLOBAL_WEIGHT = [0.3, 0.9, -0.2, 0.5, -0.8, 0.4, 0.4, -0.1, 0, 0.7, 0]
+
+
+def read_ref_weight(file, referenceNames):
     """
-    set the ref_weight for calculating the delta BLEU
+    read the global deltaBLEU weight of each reference from a weight file, each line
+    holds a reference name and its weight separated by whitespace
+    :param file: String type, weight file name
+    :param referenceNames: list type, reference names in the order of the references
+    :return globalWeight: list type, weight of each reference
+    """
+    weights = dict()
+    with open(file, 'r') as wf:
+        for line in wf:
+            fields = line.split()
+            if len(fields) == 2 and not fields[0].startswith('#'):
+                weights[os.path.splitext(fields[0])[0]] = float(fields[1])
+    missing = [name for name in referenceNames if name not in weights]
+    if len(missing) > 0:
+        raise ValueError('no weight for the references {} in {}'.format(missing, file))
+    return [weights[name] for name in referenceNames]
+
+
+def set_ref_weight(numberUtterances, globalWeight=None):
+    """
+    set the ref_weight for calculating the delta BLEU, the weights are (references x utterances)
+    arrays broadcast from one weight per reference, so no memory is used per utterance
     :param numberUtterances: int type, number of utterances for each systems
+    :param globalWeight: list type, global weight of each reference, None for the default weights
     :return normalBleuWeight: defualt None
-    :return deltaBleuUniformWeight: list type, Uniform Weight for the ref_weight
-    :return deltaBleuGlobalWeight: list type, Global Weight for the ref_weight
+    :return deltaBleuUniformWeight: numpy array type, Uniform Weight for the ref_weight
+    :return deltaBleuGlobalWeight: numpy array type, Global Weight for the ref_weight
     """
+    if globalWeight is None:
+        globalWeight = DEFAULT_GLOBAL_WEIGHT
+    globalWeight = np.asarray(globalWeight, dtype=np.float64)[:, np.newaxis]
+    shape = (len(globalWeight), numberUtterances)
     normalBleuWeight = None
-    deltaBleuUniformWeight = [[1], [1], [1], [
-        1], [1], [1], [1], [1], [1], [1], [1]]
-    deltaBleuGlobalWeight = [[0.3], [0.9], [-0.2], [0.5],
-                             [-0.8], [0.4], [0.4], [-0.1], [0], [0.7], [0]]
-    pad = [0.3, 0.9, -0.2, 0.5, -0.8, 0.4, 0.4, -0.1, 0, 0.7, 0]
-    for i in range(0, numberUtterances-1):
-        for j in range(0, len(deltaBleuUniformWeight)):
-            deltaBleuUniformWeight[j].append(1)
-            deltaBleuGlobalWeight[j].append(pad[j])
+    deltaBleuUniformWeight = np.broadcast_to(np.ones_like(globalWeight), shape)
+    deltaBleuGlobalWeight = np.broadcast_to(globalWeight, shape)
     return normalBleuWeight, deltaBleuUniformWeight, deltaBleuGlobalWeight
 
 
+def check_ref_weight(references, globalWeight=None):
+    """
+    check that there is a global weight for every reference
+    :param references: list type, references data
+    :param globalWeight: list type, global weight of each reference, None for the default weights
+    """
+    numberWeights = len(DEFAULT_GLOBAL_WEIGHT if globalWeight is None else globalWeight)
+    if numberWeights != len(references):
+        raise ValueError('{} references but {} deltaBLEU weights, '
+                         'give a weight file with -weights'.format(len(references), numberWeights))
+
+
 def get_data(hPath, rPath):
     """
     get the hypotheses, references data from the file pathes
@@ -156,52 +282,53 @@ def get_data(hPath, rPath):
     return hypotheses, references
 
 
-def bleu(hypotheses, references):
+def bleu(hypotheses, references, cache=None, globalWeight=None):
     """
     calculate the bleu score for each system
     :param hypotheses: dict type, hypotheses data 
     :param references: dict type, references data 
+    :param cache: NgramStatistics type, n-gram statistics shared by the metrics, None to build one
+    :param globalWeight: list type, global deltaBLEU weight of each reference, None for the default weights
     :return bleuScore: dict type, including BLER-4, BLEU-4 Uniformed,  BLEU-4 Global
     """
     bleuScore = dict()
-    for ids in range(1, 21):
-        systemId = 'S_' + str(ids)
+    for systemId in hypotheses:
         bleuScore[systemId] = list()
+    if cache is None:
+        cache = NgramStatistics(references)
 
     numberUtterances = len(references[0])
+    check_ref_weight(references, globalWeight)
     normalBleuWeight, deltaBleuUniformWeight, deltaBleuGlobalWeight = set_ref_weight(
-        numberUtterances)
+        numberUtterances, globalWeight)
     for systemId in hypotheses:
-        pred = hypotheses[systemId]
-        normalBleu = sacrebleu.corpus_bleu(
-            pred, references, force=True, ref_weights=normalBleuWeight)
+        hypStats = cache.hypothesis(systemId, hypotheses[systemId])
+        normalBleu = corpus_bleu(hypStats, normalBleuWeight)
         bleuScore[systemId].append(normalBleu)
-        deltaBleuUniform = sacrebleu.corpus_bleu(
-            pred, references, force=True, ref_weights=deltaBleuUniformWeight)
+        deltaBleuUniform = corpus_bleu(hypStats, deltaBleuUniformWeight)
         bleuScore[systemId].append(deltaBleuUniform)
-        deltaBleuGlobal = sacrebleu.corpus_bleu(
-            pred, references, force=True, ref_weights=deltaBleuGlobalWeight)
+        deltaBleuGlobal = corpus_bleu(hypStats, deltaBleuGlobalWeight)
         bleuScore[systemId].append(deltaBleuGlobal)
     return bleuScore
 
 
-def rouge(hypotheses, references):
+def rouge(hypotheses, references, rougeRefs=None):
     """
     calculate the rouge score for each system
     :param hypotheses: dict type, hypotheses data 
     :param references: dict type, references data 
+    :param rougeRefs: RougeReferences type, rouge statistics of the references, None to build them
     :return rougeScore: dict type, including rouge-1, rouge-2, rouge-L
     """
     rougeScore = dict()
-    for ids in range(1, 21):
-        systemId = 'S_' + str(ids)
+    for systemId in hypotheses:
         rougeScore[systemId] = list()
-    r_references = list(map(list, zip(*references)))
+    if rougeRefs is None:
+        rougeRefs = RougeReferences(references)
 
-    rouge = PyRouge(rouge_n=2, rouge_l=True)
     for systemId in hypotheses:
         pred = hypotheses[systemId]
-        scores = rouge.evaluate(pred, r_references)
+        scores = corpus_rouge(pred, rougeRefs)
         rougeScore[systemId].append(scores)
     return rougeScore
 
@@ -213,6 +340,7 @@ def n_gram(tokens, n):
     :param n: int type, n for n-grams 
     :return nGram: list type, list for the n-grams 
     """
+    import nltk
     nGram = list(nltk.ngrams(tokens, n, pad_right=True))
     return nGram
 
@@ -220,11 +348,11 @@ def n_gram(tokens, n):
 def sentence_distinct_n(sentence, n):
     """
     calculate the distinct_n score for the sentence level 
-    :param sentence: sentence which needed to be calculate
+    :param sentence: sentence which needed to be calculate, or its list of tokens
     :param n: int type, n for distinct_n
     :return distinctN: float type, distinct_n score
     """
-    tokens = sentence.split()
+    tokens = sentence.split() if isinstance(sentence, str) else sentence
     distinctN = 0
     if len(tokens) == 0:
         distinctN = 0
@@ -234,41 +362,277 @@ def sentence_distinct_n(sentence, n):
     return distinctN
 
 
-def corpus_distinct_n(corpus, ns):
+def corpus_distinct_n(corpus, ns, corpusLevel=False):
     """
     calculate the distinct_n score for the corpus level 
-    :param corpus: hypotheses for each system
+    :param corpus: hypotheses for each system, as lines or lists of tokens
     :param ns: list type, all n for the distinct n
+    :param corpusLevel: bool type, also return the unique n-grams of the corpus over its n-grams
     :return corpusDistinctN: list type, all distinct_n scores for the corpus
+    :return corpusLevelDistinctN: list type, all corpus level distinct_n scores, only with corpusLevel
     """
-    corpusDistinctNDict = dict()
-    corpusDistinctN = list()
-    for n in ns:
-        corpusDistinctNDict[n] = list()
-    for sentence in corpus:
-        for n in ns:
-            sentenceDistinctN = sentence_distinct_n(sentence, n)
-            corpusDistinctNDict[n].append(sentenceDistinctN)
-    for n in corpusDistinctNDict:
-        DistinctN = np.array(corpusDistinctNDict[n]).mean()
-        corpusDistinctN.append(DistinctN)
+    sentenceDistinctN, corpusLevelDistinctN = batch_distinct_n(corpus, ns)
+    corpusDistinctN = [sentenceDistinctN[n].mean() for n in ns]
+    if corpusLevel:
+        return corpusDistinctN, [corpusLevelDistinctN[n] for n in ns]
     return corpusDistinctN
 
 
-def distinct_n(hypotheses, ns):
+def distinct_n(hypotheses, ns, cache=None, corpusLevel=False):
     """
     calculate the distinct_n score for all system
     :param corpus: hypotheses for each system
     :param ns: list type, all n for the distinct n
+    :param cache: NgramStatistics type, reuse the tokenized hypotheses of the bleu, None to split again
+    :param corpusLevel: bool type, also return the corpus level distinct_n scores
     :return distinctN: dict type, all distinct_n scores for the each system
+    :return corpusLevelDistinctN: dict type, corpus level distinct_n scores for each system, only with corpusLevel
     """
     distinctN = dict()
-    for ids in range(1, 21):
-        systemId = 'S_' + str(ids)
-        distinctN[systemId] = corpus_distinct_n(hypotheses[systemId], ns)
+    corpusLevelDistinctN = dict()
+    for systemId in hypotheses:
+        corpus = hypotheses[systemId]
+        if cache is not None:
+            corpus = cache.hypothesis(systemId, corpus).words
+        distinctN[systemId], corpusLevelDistinctN[systemId] = corpus_distinct_n(corpus, ns, True)
+    if corpusLevel:
+        return distinctN, corpusLevelDistinctN
     return distinctN
 
 
+# the metrics which can be selected on the command line, in the order they are computed
+METRICS = ['bleu', 'rouge', 'distinct']
+
+
+def select_metrics(names=None):
+    """
+    check the metrics selected on the command line
+    :param names: String type, comma separated metrics of METRICS, None for all
+    :return metrics: list type, selected metrics in the order of METRICS
+    """
+    if names is None:
+        return list(METRICS)
+    selected = [name.strip() for name in names.split(',') if len(name.strip()) > 0]
+    for name in selected:
+        if name not in METRICS:
+            raise ValueError('unknown metric: {}, expected one of {}'.format(name, METRICS))
+    return [name for name in METRICS if name in selected]
+
+
+METRIC_NAMES = ['BLEU-4', 'deltaBLEU-4_Uniformed', 'deltaBLEU-4_Global', 'ROUGE-2', 'ROUGE-L',
+                'Distinct-1', 'Distinct-2', 'Distinct-3']
+
+HUMAN_NAMES = ['Averaged_Human_Rating', 'Averaged_Human_Rating_Without_polar']
+
+
+def metric_statistics(hypotheses, references, cache, rougeRefs, globalWeight=None, metrics=None):
+    """
+    collect the per-utterance sufficient statistics of every metric of output.csv, from which
+    the score of any resample of the utterances is computed without scoring the system again
+    :param hypotheses: dict type, hypotheses data
+    :param references: dict type, references data
+    :param cache: NgramStatistics type, n-gram statistics shared by the metrics
+    :param rougeRefs: RougeReferences type, rouge statistics of the references
+    :param globalWeight: list type, global deltaBLEU weight of each reference, None for the default weights
+    :param metrics: list type, selected metrics of METRICS, None for all
+    :return statistics: SufficientStatistics type, statistics of the metrics over the utterances
+    """
+    if metrics is None:
+        metrics = METRICS
+    refWeights = set_ref_weight(len(references[0]), globalWeight)
+    statistics = SufficientStatistics(len(references[0]))
+    for systemId in hypotheses:
+        if 'bleu' in metrics:
+            hypStats = cache.hypothesis(systemId, hypotheses[systemId])
+            for name, weights in zip(METRIC_NAMES[:3], refWeights):
+                statistics.add(name, systemId, sentence_bleu_statistics(hypStats, weights), 'bleu')
+        if 'rouge' in metrics:
+            precisions, recalls = sentence_rouge(hypotheses[systemId], rougeRefs)
+            statistics.add('ROUGE-2', systemId, recalls['rouge-2'])
+            statistics.add('ROUGE-L', systemId, recalls['rouge-l'])
+        if 'distinct' in metrics:
+            words = hypStats.words if 'bleu' in metrics else hypotheses[systemId]
+            sentenceDistinctN, _ = batch_distinct_n(words, [1, 2, 3])
+            for n in [1, 2, 3]:
+                statistics.add(METRIC_NAMES[4 + n], systemId, sentenceDistinctN[n])
+    return statistics
+
+
+def human_statistics(file):
+    """
+    collect the sums and counts of the rated lines of every system for each rated utterance,
+    the average human ratings of any resample of the rated utterances are their ratios
+    :param file: String type, human rating file name
+    :return statistics: SufficientStatistics type, statistics of the ratings over the rated utterances
+    """
+    systemIds, rowSystem, ratings, mask, rowUtterance = parse_human_rating(file)
+    averages = batch_utterances_rating(ratings, mask)
+    utterances, rowItem = np.unique(rowUtterance, return_inverse=True)
+    statistics = SufficientStatistics(len(utterances))
+    for index in sorted(range(0, len(systemIds)), key=lambda index: natural_key(systemIds[index])):
+        rows = rowSystem == index
+        counts = np.bincount(rowItem[rows], minlength=len(utterances))
+        for name, average in zip(HUMAN_NAMES, averages):
+            sums = np.bincount(rowItem[rows], weights=average[rows], minlength=len(utterances))
+            statistics.add(name, systemIds[index], np.column_stack([sums, counts]), 'ratio')
+    return statistics
+
+
+# data shared with the evaluation workers, set before the pool is forked so the
+# workers read it copy-on-write instead of receiving it pickled with every job
+SHARED = dict()
+
+
+def init_shared(shared):
+    """
+    set the shared data in a worker which is not forked from the main process
+    :param shared: dict type, data shared by all jobs
+    """
+    SHARED.update(shared)
+
+
+def evaluate_job(job):
+    """
+    calculate one metric for one system in a worker
+    :param job: tuple type, (systemId, metric), metric is one of bleu, rouge, distinct
+    :return systemId: String type, system id
+    :return metric: String type, metric name
+    :return score: list type, scores in the layout of bleu, rouge and distinct_n
+    :return timing: tuple type, wall time and cpu time of the job in seconds
+    :return hypStats: HypothesisStatistics type, statistics of a bleu job when they are kept, None otherwise
+    """
+    systemId, metric = job
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    pred = SHARED['hypotheses'][systemId]
+    hypStats = None
+    if metric == 'bleu':
+        hypStats = HypothesisStatistics(pred, SHARED['cache'].references)
+        score = [corpus_bleu(hypStats, weight) for weight in SHARED['refWeights']]
+        if not SHARED['keepStatistics']:
+            hypStats = None
+    elif metric == 'rouge':
+        score = [corpus_rouge(pred, SHARED['rougeRefs'])]
+    else:
+        score = corpus_distinct_n(pred, SHARED['ns'])
+    return systemId, metric, score, (time.perf_counter() - wall, time.process_time() - cpu), hypStats
+
+
+def evaluate_parallel(hypotheses, references, ns, workers, cache=None, globalWeight=None, timings=None,
+                      rougeRefs=None, metrics=None, keepStatistics=False):
+    """
+    calculate bleu, rouge and distinct_n for all systems with a pool of worker processes,
+    every (system, metric) pair is an independent job
+    :param hypotheses: dict type, hypotheses data
+    :param references: dict type, references data
+    :param ns: list type, all n for the distinct n
+    :param workers: int type, number of worker processes
+    :param cache: NgramStatistics type, n-gram statistics of the references, None to build one
+    :param globalWeight: list type, global deltaBLEU weight of each reference, None for the default weights
+    :param timings: dict type, filled with (metric, systemId) -> (wall, cpu) of each job if given
+    :param rougeRefs: RougeReferences type, rouge statistics of the references, None to build them
+    :param metrics: list type, selected metrics of METRICS, None for all, the others are left empty
+    :param keepStatistics: bool type, send the statistics of the systems back from the bleu jobs and keep
+        them in cache, for the sentence scores and the bootstrap
+    :return bleuScore: dict type, bleu scores for each system
+    :return rougeScore: dict type, rouge scores for each system
+    :return distinctN: dict type, distinct-n scores for each system
+    """
+    if metrics is None:
+        metrics = METRICS
+    if cache is None and 'bleu' in metrics:
+        cache = NgramStatistics(references)
+    if rougeRefs is None and 'rouge' in metrics:
+        rougeRefs = RougeReferences(references)
+    check_ref_weight(references, globalWeight)
+    scores = {'bleu': dict(), 'rouge': dict(), 'distinct': dict()}
+    # the systems keep the order of the hypotheses, whatever order their jobs end in
+    for metric in metrics:
+        for systemId in hypotheses:
+            scores[metric][systemId] = list()
+    shared = dict()
+    shared['hypotheses'] = hypotheses
+    shared['cache'] = cache
+    shared['refWeights'] = set_ref_weight(len(references[0]), globalWeight)
+    shared['rougeRefs'] = rougeRefs
+    shared['ns'] = ns
+    shared['keepStatistics'] = keepStatistics
+    # the slowest metric first, so the pool is not left waiting on a bleu job at the end
+    jobs = [(systemId, metric) for metric in metrics for systemId in hypotheses]
+
+    if 'fork' in multiprocessing.get_all_start_methods():
+        SHARED.clear()
+        SHARED.update(shared)
+        gc.freeze()
+        pool = multiprocessing.get_context('fork').Pool(workers)
+    else:
+        pool = multiprocessing.Pool(workers, initializer=init_shared, initargs=(shared,))
+    try:
+        with pool:
+            for systemId, metric, score, timing, hypStats in pool.imap_unordered(evaluate_job, jobs):
+                scores[metric][systemId] = score
+                if hypStats is not None:
+                    cache.systems[systemId] = hypStats
+                if timings is not None:
+                    timings[(metric, systemId)] = timing
+    finally:
+        gc.unfreeze()
+        SHARED.clear()
+    return scores['bleu'], scores['rouge'], scores['distinct']
+
+
+def evaluate_systems(metric, hypotheses, profiler, *args):
+    """
+    calculate a metric one system at a time, so the profiler records each system
+    :param metric: function type, bleu, rouge or distinct_n
+    :param hypotheses: dict type, hypotheses data
+    :param profiler: StageProfiler type, profiler of the run
+    :param args: arguments of the metric after the hypotheses
+    :return scores: dict type, scores for each system
+    """
+    scores = dict()
+    for systemId in hypotheses:
+        with profiler.system(systemId):
+            scores.update(metric({systemId: hypotheses[systemId]}, *args))
+    return scores
+
+
+OUTPUT_HEADER = 'System,Averaged_Human_Rating,Averaged_Human_Rating_Without_polar,BLEU-4,deltaBLEU-4_Uniformed,deltaBLEU-4_Global,ROUGE-2,ROUGE-L,Distinct-1,Distinct-2,Distinct-3'
+
+
+def output_row(systemId, averageHumanRating, bleuScore, rougeScore, distinctN):
+    """
+    format the results of a system as a line of the output file
+    :param systemId: String type, system id
+    :param averageHumanRating: dict type, average human rating for each system
+    :param bleuScore: dict type, bleu scores for each system
+    :param rougeScore: dict type, rouge scores for each system
+    :param distinctN: dict type, distinct-n scores for  each system
+    :return row: String type, line of the system with its newline
+    """
+    row = ''
+    if systemId in averageHumanRating:
+        row += systemId+','+str(averageHumanRating[systemId][0])+','+str(averageHumanRating[systemId][1])+','
+    else:
+        row += systemId+','+'nan'+','+'nan'+','
+    if systemId in bleuScore:
+        row += str(bleuScore[systemId][0][0])+','+str(
+            bleuScore[systemId][1][0])+','+str(bleuScore[systemId][2][0])+','
+    else:
+        row += 'nan'+','+'nan'+','+'nan'+','
+    if systemId in rougeScore:
+        row += str(rougeScore[systemId][0]['rouge-2']['r']) + \
+            ','+str(rougeScore[systemId][0]['rouge-l']['r'])+','
+    else:
+        row += 'nan'+','+'nan'+','
+    if systemId in distinctN:
+        row += str(distinctN[systemId][0])+','+str(
+            distinctN[systemId][1])+','+str(distinctN[systemId][2])+'\n'
+    else:
+        row += 'nan'+','+'nan'+','+'nan'+'\n'
+    return row
+
+
 def output_file(averageHumanRating, bleuScore, rougeScore, distinctN, file):
     """
     write all results to the output file
@@ -278,26 +642,26 @@ def output_file(averageHumanRating, bleuScore, rougeScore, distinctN, file):
     :param distinctN: dict type, distinct-n scores for  each system
     :param file: string type, output file path
     """
-    firstLine = 'System,Averaged_Human_Rating,Averaged_Human_Rating_Without_polar,BLEU-4,deltaBLEU-4_Uniformed,deltaBLEU-4_Global,ROUGE-2,ROUGE-L,Distinct-1,Distinct-2,Distinct-3'
+    systemIds = list(averageHumanRating)
+    for scores in [bleuScore, rougeScore, distinctN]:
+        systemIds.extend(systemId for systemId in scores if systemId not in systemIds)
     with open(file, 'w') as outf:
-        outf.write(firstLine+'\n')
-        for systemId in averageHumanRating:
-            outf.write(systemId+','+str(averageHumanRating[systemId][0])+','+str(averageHumanRating[systemId][1])+',')
-            if systemId in bleuScore:
-                outf.write(str(bleuScore[systemId][0][0])+','+str(
-                    bleuScore[systemId][1][0])+','+str(bleuScore[systemId][2][0])+',')
-            else:
-                outf.write('nan'+','+'nan'+','+'nan'+',')
-            if systemId in rougeScore:
-                outf.write(str(rougeScore[systemId][0]['rouge-2']['r']) +
-                           ','+str(rougeScore[systemId][0]['rouge-l']['r'])+',')
-            else:
-                outf.write('nan'+','+'nan'+',')
-            if systemId in distinctN:
-                outf.write(str(distinctN[systemId][0])+','+str(
-                    distinctN[systemId][1])+','+str(distinctN[systemId][2])+'\n')
-            else:
-                outf.write('nan'+','+'nan'+','+'nan'+'\n')
+        outf.write(OUTPUT_HEADER+'\n')
+        for systemId in systemIds:
+            outf.write(output_row(systemId, averageHumanRating, bleuScore, rougeScore, distinctN))
+
+
+def parse_args(args):
+    """
+    parse the command line arguments given as -name value pairs, --name is the same as -name
+    :param args: list type, command line arguments
+    :return options: dict type, option name to option value
+    """
+    options = dict()
+    for i in range(0, len(args)-1, 2):
+        if args[i].startswith('-'):
+            options[args[i].lstrip('-')] = args[i+1]
+    return options
 
 
 def main():
@@ -305,25 +669,105 @@ def main():
     The main function
     """
     args = sys.argv[1:]
-    if len(args) == 2 and args[0] == '-path':
-        inputs = args[1]
+    options = parse_args(args)
+    if 'path' in options:
+        inputs = options['path']
     else:
         print('please input the path of the corpus')
         inputs = input("input:")
+    workers = int(options.get('workers', 1))
+    weightFile = options.get('weights', None)
+    packedPath = options.get('packed', None)
+    samples = int(options.get('bootstrap', 0))
+    metrics = select_metrics(options.get('metrics', None))
+    tokenCache = None
+    if 'cache' in options:
+        tokenCache = TokenCache(options['cache'], int(float(options.get('cacheSize', 1024)) * (1 << 20)))
+    profiler = StageProfiler(options.get('profile', '0') == '1', options.get('tracemalloc', '0') == '1',
+                             options.get('cprofile', '0') == '1')
     # get all data
     humanRatingFile = os.path.join(inputs, 'human_rating_scores.txt')
     hypothesesPath = os.path.join(inputs, 'hypotheses')
     referencesPath = os.path.join(inputs, 'references')
     outputFile = os.path.join(inputs, 'output.csv')
     # calculate all metrics
-    hypotheses, references = get_data(hypothesesPath, referencesPath)
-    averageHumanRating = average_human_rating(humanRatingFile)
-    bleuScore = bleu(hypotheses, references)
-    rougeScore = rouge(hypotheses, references)
-    distinctN = distinct_n(hypotheses, [1, 2, 3])
+    with profiler.stage('get_data'):
+        if packedPath is not None:
+            corpus = AlignedCorpus(packedPath)
+            hypotheses, references = corpus.hypotheses, corpus.references
+            referenceNames = corpus.referenceNames
+            referenceFiles = [stream.prefix + '.bin' for stream in references]
+        else:
+            hypotheses, references = get_data(hypothesesPath, referencesPath)
+            referenceNames = list_references(referencesPath)
+            referenceFiles = [os.path.join(referencesPath, name + '.txt') for name in referenceNames]
+    globalWeight = None
+    if weightFile is not None:
+        globalWeight = read_ref_weight(weightFile, referenceNames)
+    averageHumanRating = dict()
+    with profiler.stage('average_human_rating'):
+        if os.path.exists(humanRatingFile):
+            averageHumanRating = average_human_rating(humanRatingFile)
+    bleuTokens = None
+    rougeTokens = None
+    if tokenCache is not None:
+        with profiler.stage('token_cache'):
+            bleuTokens, rougeTokens = cached_references(tokenCache, referenceFiles, references, metrics)
+    # only the stages of the selected metrics run, the others are written as nan
+    cache = None
+    rougeRefs = None
+    bleuScore, rougeScore, distinctN = dict(), dict(), dict()
+    if 'bleu' in metrics:
+        with profiler.stage('reference_statistics'):
+            cache = NgramStatistics(references, tokenized=bleuTokens)
+    if workers > 1:
+        timings = dict()
+        with profiler.stage('evaluate_parallel'):
+            if 'rouge' in metrics:
+                rougeRefs = RougeReferences(references, tokenized=rougeTokens)
+            # the sentence scores and the bootstrap reuse the statistics of the systems
+            keepStatistics = 'sentences' in options or samples > 0
+            bleuScore, rougeScore, distinctN = evaluate_parallel(
+                hypotheses, references, [1, 2, 3], workers, cache, globalWeight, timings, rougeRefs, metrics,
+                keepStatistics)
+        for (metric, systemId), (wall, cpu) in timings.items():
+            profiler.add_system(metric + ':' + systemId, wall, cpu, 'evaluate_parallel')
+    else:
+        if 'bleu' in metrics:
+            with profiler.stage('bleu'):
+                bleuScore = evaluate_systems(bleu, hypotheses, profiler, references, cache, globalWeight)
+        if 'rouge' in metrics:
+            with profiler.stage('rouge'):
+                rougeRefs = RougeReferences(references, tokenized=rougeTokens)
+                rougeScore = evaluate_systems(rouge, hypotheses, profiler, references, rougeRefs)
+        if 'distinct' in metrics:
+            with profiler.stage('distinct_n'):
+                distinctN = evaluate_systems(distinct_n, hypotheses, profiler, [1, 2, 3], cache)
     # output to the file
-    output_file(averageHumanRating, bleuScore,
-                rougeScore, distinctN, outputFile)
+    with profiler.stage('output_file'):
+        output_file(averageHumanRating, bleuScore,
+                    rougeScore, distinctN, outputFile)
+    if 'sentences' in options:
+        with profiler.stage('sentence_scores'):
+            write_sentence_scores(hypotheses, metrics, options['sentences'], cache, rougeRefs,
+                                  options.get('sentenceFormat', None),
+                                  int(options.get('sentenceBatch', SENTENCE_BATCH_SIZE)))
+    if samples > 0:
+        with profiler.stage('sufficient_statistics'):
+            metricStats = metric_statistics(hypotheses, references, cache, rougeRefs, globalWeight, metrics)
+            metricStats.save(os.path.join(inputs, 'output_statistics.npz'))
+            humanStats = None
+            if os.path.exists(humanRatingFile):
+                humanStats = human_statistics(humanRatingFile)
+                humanStats.save(os.path.join(inputs, 'output_human_statistics.npz'))
+        with profiler.stage('bootstrap'):
+            intervals, pairs, correlations = analyze(metricStats, humanStats, samples,
+                                                     float(options.get('confidence', CONFIDENCE)),
+                                                     int(options.get('seed', 0)))
+            write_analysis(intervals, pairs, correlations, os.path.join(inputs, 'output'))
+    if profiler.enabled:
+        profileFile = os.path.join(inputs, 'output_profile.prof') if profiler.profileStages else None
+        profiler.write(os.path.join(inputs, 'output_profile.json'), profileFile)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,401 @@
+import os
+import sys
+import gc
+import json
+import math
+import time
+import asyncio
+import multiprocessing
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+import ds_ex3
+from ngram_stats import NgramStatistics, HypothesisStatistics, corpus_bleu
+from rouge_scorer import RougeReferences, corpus_rouge
+from corpus_pack import AlignedCorpus
+from token_cache import TokenCache
+
+MAX_BODY_SIZE = 1 << 28
+
+STATUS_TEXTS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+# the warm references of the server, set before the pool is forked so the
+# workers read them copy-on-write
+WARM = dict()
+
+
+def load_references(inputs, weightFile=None, packedPath=None, tokenCache=None):
+    """
+    load the references of an evaluation directory once, with their n-gram and rouge statistics,
+    the deltaBLEU weights and the average human ratings of the rated systems
+    :param inputs: String type, evaluation directory, with references and human_rating_scores.txt
+    :param weightFile: String type, deltaBLEU weight file, None for the default weights
+    :param packedPath: String type, directory of a packed corpus to read the references from, None for inputs
+    :param tokenCache: TokenCache type, cache of the tokenized files, None means no cache
+    :return state: dict type, warm data of the server
+    """
+    if packedPath is not None:
+        corpus = AlignedCorpus(packedPath)
+        references = corpus.references
+        referenceNames = corpus.referenceNames
+        referenceFiles = [stream.prefix + '.bin' for stream in references]
+    else:
+        referencesPath = os.path.join(inputs, 'references')
+        references = ds_ex3.get_references(referencesPath)
+        referenceNames = ds_ex3.list_references(referencesPath)
+        referenceFiles = [os.path.join(referencesPath, name + '.txt') for name in referenceNames]
+    globalWeight = None
+    if weightFile is not None:
+        globalWeight = ds_ex3.read_ref_weight(weightFile, referenceNames)
+    ds_ex3.check_ref_weight(references, globalWeight)
+    bleuTokens = None
+    rougeTokens = None
+    if tokenCache is not None:
+        bleuTokens, rougeTokens = ds_ex3.cached_references(tokenCache, referenceFiles, references)
+    humanRatingFile = os.path.join(inputs, 'human_rating_scores.txt')
+    state = dict()
+    state['referenceNames'] = referenceNames
+    state['numberUtterances'] = len(references[0])
+    state['cache'] = NgramStatistics(references, tokenized=bleuTokens)
+    state['rougeRefs'] = RougeReferences(references, tokenized=rougeTokens)
+    state['refWeights'] = ds_ex3.set_ref_weight(len(references[0]), globalWeight)
+    state['averageHumanRating'] = dict()
+    if os.path.exists(humanRatingFile):
+        state['averageHumanRating'] = ds_ex3.average_human_rating(humanRatingFile)
+    return state
+
+
+def init_warm(state):
+    """
+    set the warm data in a worker which is not forked from the server
+    :param state: dict type, warm data of the server
+    """
+    WARM.update(state)
+
+
+def score_lines(systemId, lines):
+    """
+    score the hypotheses of one system against the warm references, in a worker
+    :param systemId: String type, system id
+    :param lines: list type, one hypothesis per utterance
+    :return result: dict type, the system, the line of the output file and its columns
+    """
+    wall = time.perf_counter()
+    if len(lines) != WARM['numberUtterances']:
+        raise ValueError('{} hypotheses for {} utterances'.format(len(lines), WARM['numberUtterances']))
+    hypStats = HypothesisStatistics(lines, WARM['cache'].references)
+    bleuScore = {systemId: [corpus_bleu(hypStats, weight) for weight in WARM['refWeights']]}
+    rougeScore = {systemId: [corpus_rouge(lines, WARM['rougeRefs'])]}
+    distinctN = {systemId: ds_ex3.corpus_distinct_n(hypStats.words, [1, 2, 3])}
+    row = ds_ex3.output_row(systemId, WARM['averageHumanRating'], bleuScore, rougeScore, distinctN)
+    result = dict()
+    result['system'] = systemId
+    result['header'] = ds_ex3.OUTPUT_HEADER
+    result['row'] = row
+    result['scores'] = dict(zip(ds_ex3.OUTPUT_HEADER.split(',')[1:], [float(value) for value in row.split(',')[1:]]))
+    result['wall'] = time.perf_counter() - wall
+    return result
+
+
+def read_lines(file):
+    """
+    read the hypotheses of a system file, as get_hypotheses does
+    :param file: String type, hypotheses file name
+    :return lines: list type, lines of the file
+    """
+    with open(file, 'r') as sh:
+        return sh.readlines()
+
+
+def split_lines(text):
+    """
+    split the hypotheses of a text body into lines as read_lines does: only \n, \r\n and \r
+    end a line, unlike str.splitlines, and a final line break does not start another line
+    :param text: String type, body of the request
+    :return lines: list type, lines of the body without their line breaks
+    """
+    if len(text) == 0:
+        return list()
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if text.endswith('\n'):
+        text = text[:-1]
+    return text.split('\n')
+
+
+def score_file(systemId, file):
+    """
+    read the hypotheses of a system file and score them, in a worker so that the
+    event loop never waits for the file
+    :param systemId: String type, system id
+    :param file: String type, hypotheses file name, resolved by EvaluationServer.resolve_file
+    :return result: dict type, as given by score_lines
+    """
+    return score_lines(systemId, read_lines(file))
+
+
+def json_safe(value):
+    """
+    replace the non-finite floats of a response by None, so that it is written as strict JSON
+    :param value: response or a part of it
+    :return value: the same value with null for nan and infinity
+    """
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: json_safe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_safe(item) for item in value]
+    return value
+
+
+class RequestError(Exception):
+    """
+    a request which cannot be served, answered with its HTTP status
+    """
+
+    def __init__(self, status, message):
+        super(RequestError, self).__init__(message)
+        self.status = status
+
+
+class EvaluationServer(object):
+    """
+    an HTTP server which scores hypotheses against warm references, the requests are
+    read by the event loop and scored concurrently by a pool of workers
+    """
+
+    def __init__(self, state, workers=None, hypothesesPath=None):
+        """
+        :param state: dict type, warm data given by load_references
+        :param workers: int type, number of worker processes, None for one per cpu, 1 scores in a thread
+            of the server, one request at a time
+        :param hypothesesPath: String type, directory of the hypotheses files the clients may name,
+            None to accept the hypotheses as lines only
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.state = state
+        self.workers = workers
+        self.hypothesesPath = None
+        if hypothesesPath is not None:
+            self.hypothesesPath = os.path.realpath(hypothesesPath)
+        self.requests = 0
+        WARM.clear()
+        WARM.update(state)
+        if workers <= 1:
+            self.executor = ThreadPoolExecutor(1)
+        elif 'fork' in multiprocessing.get_all_start_methods():
+            gc.freeze()
+            self.executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self.executor = ProcessPoolExecutor(workers, initializer=init_warm, initargs=(state,))
+
+    async def read_request(self, reader):
+        """
+        read an HTTP request
+        :param reader: StreamReader type, stream of the connection
+        :return request: tuple type, (method, target, headers, body), None when the connection is closed
+        """
+        requestLine = await reader.readline()
+        if len(requestLine.strip()) == 0:
+            return None
+        parts = requestLine.decode('latin-1').split()
+        if len(parts) != 3:
+            raise RequestError(400, 'malformed request line')
+        method, target, version = parts
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if len(line.strip()) == 0:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > MAX_BODY_SIZE:
+            raise RequestError(413, 'the body is larger than {} bytes'.format(MAX_BODY_SIZE))
+        body = await reader.readexactly(length) if length > 0 else b''
+        return method, target, headers, body
+
+    def resolve_file(self, name):
+        """
+        get the path of a hypotheses file named by a client, only the files under the
+        hypotheses directory of the server can be named
+        :param name: String type, file name relative to the hypotheses directory
+        :return file: String type, path of the file
+        """
+        if self.hypothesesPath is None:
+            raise RequestError(400, 'the server has no hypotheses directory, give the hypotheses as lines')
+        if not isinstance(name, str) or len(name) == 0 or os.path.isabs(name) or \
+                '..' in name.replace('\\', '/').split('/'):
+            raise RequestError(400, 'the file must be a relative name under the hypotheses directory')
+        file = os.path.realpath(os.path.join(self.hypothesesPath, name))
+        if os.path.commonpath([file, self.hypothesesPath]) != self.hypothesesPath or not os.path.isfile(file):
+            raise RequestError(400, 'no such file in the hypotheses directory: {}'.format(name))
+        return file
+
+    def parse_score(self, target, headers, body):
+        """
+        get the system and its hypotheses from a score request: a JSON body with the system
+        and a file name or a list of lines, or a text body of lines with ?system= in the target
+        :param target: String type, request target
+        :param headers: dict type, request headers
+        :param body: bytes type, request body
+        :return systemId: String type, system id
+        :return lines: list type, hypotheses, None when they are in a file
+        :return file: String type, path of the hypotheses file, None when the lines are given
+        """
+        query = parse_qs(urlsplit(target).query)
+        if headers.get('content-type', '').startswith('text/plain'):
+            return query.get('system', ['checkpoint'])[0], split_lines(body.decode('utf-8')), None
+        try:
+            request = json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise RequestError(400, 'the body is not JSON: {}'.format(e))
+        systemId = request.get('system', query.get('system', ['checkpoint'])[0])
+        if 'lines' in request:
+            return systemId, request['lines'], None
+        if 'file' in request:
+            return systemId, None, self.resolve_file(request['file'])
+        raise RequestError(400, 'give the hypotheses as lines or as a file')
+
+    async def respond(self, method, target, headers, body):
+        """
+        serve a request
+        :param method: String type, HTTP method
+        :param target: String type, request target
+        :param headers: dict type, request headers
+        :param body: bytes type, request body
+        :return status: int type, HTTP status
+        :return response: dict type, JSON response
+        """
+        path = urlsplit(target).path
+        if path == '/health':
+            return 200, {'status': 'ok', 'references': self.state['referenceNames'],
+                         'utterances': self.state['numberUtterances'], 'requests': self.requests}
+        if path != '/score':
+            raise RequestError(404, 'unknown path: {}, expected /score or /health'.format(path))
+        if method != 'POST':
+            raise RequestError(405, 'score with POST')
+        systemId, lines, file = self.parse_score(target, headers, body)
+        if lines is not None and len(lines) != self.state['numberUtterances']:
+            raise RequestError(400, '{} hypotheses for {} utterances'.format(len(lines), self.state['numberUtterances']))
+        self.requests += 1
+        loop = asyncio.get_running_loop()
+        try:
+            if file is not None:
+                return 200, await loop.run_in_executor(self.executor, score_file, systemId, file)
+            return 200, await loop.run_in_executor(self.executor, score_lines, systemId, lines)
+        except ValueError as e:
+            raise RequestError(400, str(e))
+
+    async def handle(self, reader, writer):
+        """
+        serve the requests of a connection until it is closed
+        :param reader: StreamReader type, stream of the connection
+        :param writer: StreamWriter type, stream of the connection
+        """
+        try:
+            while True:
+                keepAlive = False
+                try:
+                    request = await self.read_request(reader)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keepAlive = headers.get('connection', '').lower() != 'close'
+                    status, response = await self.respond(method, target, headers, body)
+                except RequestError as e:
+                    status, response = e.status, {'error': str(e)}
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, response = 500, {'error': '{}: {}'.format(type(e).__name__, e)}
+                data = json.dumps(json_safe(response), allow_nan=False).encode('utf-8')
+                writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n'
+                             'Connection: {}\r\n\r\n'.format(status, STATUS_TEXTS.get(status, ''), len(data),
+                                                             'keep-alive' if keepAlive else 'close').encode('latin-1'))
+                writer.write(data)
+                await writer.drain()
+                if not keepAlive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080, socketPath=None):
+        """
+        serve forever, on a TCP port or on a unix socket
+        :param host: String type, host to listen on
+        :param port: int type, port to listen on
+        :param socketPath: String type, unix socket path to listen on instead, None for TCP
+        """
+        if socketPath is not None:
+            server = await asyncio.start_unix_server(self.handle, socketPath)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown()
+        gc.unfreeze()
+
+
+def request_score(url, systemId, file=None, lines=None, timeout=600):
+    """
+    score a system with a running server, e.g. from a training job
+    :param url: String type, address of the server, e.g. http://127.0.0.1:8080
+    :param systemId: String type, system id
+    :param file: String type, hypotheses file name relative to the hypotheses directory of the server
+    :param lines: list type, hypotheses, when there is no file
+    :param timeout: float type, seconds to wait for the score
+    :return result: dict type, as given by score_lines, with null for the missing scores
+    """
+    request = {'system': systemId}
+    if file is not None:
+        request['file'] = file
+    else:
+        request['lines'] = lines
+    data = json.dumps(request).encode('utf-8')
+    httpRequest = urllib.request.Request(url.rstrip('/') + '/score', data=data,
+                                         headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(httpRequest, timeout=timeout) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+def main():
+    """
+    The main function, load the references of an evaluation directory and serve the scores
+    """
+    options = ds_ex3.parse_args(sys.argv[1:])
+    if 'path' in options:
+        inputs = options['path']
+    else:
+        print('please input the path of the corpus')
+        inputs = input("input:")
+    tokenCache = None
+    if 'cache' in options:
+        tokenCache = TokenCache(options['cache'], int(float(options.get('cacheSize', 1024)) * (1 << 20)))
+    started = time.perf_counter()
+    state = load_references(inputs, options.get('weights', None), options.get('packed', None), tokenCache)
+    hypothesesPath = options.get('hypotheses', os.path.join(inputs, 'hypotheses'))
+    if not os.path.isdir(hypothesesPath):
+        hypothesesPath = None
+    workers = int(options['workers']) if 'workers' in options else None
+    server = EvaluationServer(state, workers, hypothesesPath)
+    socketPath = options.get('socket', None)
+    address = socketPath if socketPath is not None else 'http://{}:{}'.format(
+        options.get('host', '127.0.0.1'), options.get('port', 8080))
+    print('{} references of {} utterances loaded in {:.2f}s, serving on {} with {} workers'.format(
+        len(state['referenceNames']), state['numberUtterances'], time.perf_counter() - started, address,
+        server.workers))
+    try:
+        asyncio.run(server.serve(options.get('host', '127.0.0.1'), int(options.get('port', 8080)), socketPath))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
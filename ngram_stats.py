@@ -0,0 +1,267 @@
+from collections import Counter, namedtuple
+import numpy as np
+
+# sacrebleu is imported where it is used, so a run without bleu never loads it
+MAX_NGRAM_ORDER = 4
+
+BleuScore = namedtuple('BleuScore', ['score', 'counts', 'totals', 'precisions', 'bp', 'sys_len', 'ref_len'])
+
+
+def extract_ngrams(tokens, maxOrder=MAX_NGRAM_ORDER):
+    """
+    count all the n-grams of a tokenized sentence
+    :param tokens: list type, tokens of the sentence
+    :param maxOrder: int type, maximum n-gram order
+    :return ngrams: Counter type, count of each n-gram tuple
+    """
+    ngrams = Counter()
+    for n in range(1, maxOrder + 1):
+        ngrams.update(zip(*[tokens[k:] for k in range(0, n)]))
+    return ngrams
+
+
+def tokenize_13a(lines):
+    """
+    tokenize lines as sacrebleu does for BLEU, with the 13a tokenizer split on whitespace
+    :param lines: list type, lines
+    :return tokensList: list type, list of tokens of each line
+    """
+    from sacrebleu.tokenizers.tokenizer_13a import Tokenizer13a
+    tokenizer = Tokenizer13a()
+    return [tokenizer(line.rstrip()).split() for line in lines]
+
+
+class ReferenceStatistics(object):
+    """
+    the tokenized references and their n-gram counts, computed once per run
+    """
+
+    def __init__(self, references, maxOrder=MAX_NGRAM_ORDER, tokenized=None):
+        """
+        :param references: list type, one list of lines for each reference
+        :param maxOrder: int type, maximum n-gram order
+        :param tokenized: list type, tokens of each line of each reference as given by tokenize_13a,
+            e.g. from the token cache, None to tokenize the lines
+        """
+        if tokenized is None:
+            tokenized = [tokenize_13a(lines) for lines in references]
+        self.maxOrder = maxOrder
+        self.numberReferences = len(references)
+        self.numberUtterances = len(references[0])
+        self.lengths = np.zeros((self.numberReferences, self.numberUtterances), dtype=np.int64)
+        # for each utterance, n-gram -> (max count over the references, indices of the references with it)
+        self.ngrams = list()
+        for i in range(0, self.numberUtterances):
+            merged = dict()
+            for j in range(0, self.numberReferences):
+                tokens = tokenized[j][i]
+                self.lengths[j, i] = len(tokens)
+                for ngram, count in extract_ngrams(tokens, maxOrder).items():
+                    if ngram in merged:
+                        maxCount, refIds = merged[ngram]
+                        merged[ngram] = (max(maxCount, count), refIds + (j,))
+                    else:
+                        merged[ngram] = (count, (j,))
+            self.ngrams.append(merged)
+
+    def closest_lengths(self, hypLengths):
+        """
+        find the closest reference length of each utterance, the shorter one on ties
+        :param hypLengths: numpy array type, hypothesis length of each utterance
+        :return refLengths: numpy array type, closest reference length of each utterance
+        """
+        diff = np.abs(self.lengths - hypLengths[np.newaxis, :])
+        order = np.argmin(diff * (self.lengths.max() + 1) + self.lengths, axis=0)
+        return self.lengths[order, np.arange(self.numberUtterances)]
+
+
+class HypothesisStatistics(object):
+    """
+    the n-gram matches of one system against the references, which are independent
+    of the reference weights, so BLEU and deltaBLEU are all computed from them
+    """
+
+    def __init__(self, hypotheses, refStats):
+        """
+        :param hypotheses: list type, lines of the system
+        :param refStats: ReferenceStatistics type, statistics of the references
+        """
+        from sacrebleu.tokenizers.tokenizer_13a import Tokenizer13a
+        tokenizer = Tokenizer13a()
+        maxOrder = refStats.maxOrder
+        self.words = [line.split() for line in hypotheses]
+        self.totals = np.zeros((len(hypotheses), maxOrder), dtype=np.int64)
+        hypLengths = np.zeros(len(hypotheses), dtype=np.int64)
+        matchSentence = list()
+        matchOrder = list()
+        matchCount = list()
+        matchRefs = list()
+        matchRefLengths = list()
+        for i, line in enumerate(hypotheses):
+            tokens = tokenizer(line.rstrip()).split()
+            hypLengths[i] = len(tokens)
+            refNgrams = refStats.ngrams[i]
+            for ngram, count in extract_ngrams(tokens, maxOrder).items():
+                n = len(ngram) - 1
+                self.totals[i, n] += count
+                if ngram in refNgrams:
+                    maxCount, refIds = refNgrams[ngram]
+                    matchSentence.append(i)
+                    matchOrder.append(n)
+                    matchCount.append(min(count, maxCount))
+                    matchRefs.extend(refIds)
+                    matchRefLengths.append(len(refIds))
+        self.hypLengths = hypLengths
+        self.refLengths = refStats.closest_lengths(hypLengths)
+        self.sysLen = int(hypLengths.sum())
+        self.refLen = int(self.refLengths.sum())
+        self.maxOrder = maxOrder
+        self.matchSentence = np.array(matchSentence, dtype=np.int64)
+        self.matchOrder = np.array(matchOrder, dtype=np.int64)
+        self.matchCount = np.array(matchCount, dtype=np.int64)
+        self.matchRefs = np.array(matchRefs, dtype=np.int64)
+        self.matchRefStarts = np.concatenate(([0], np.cumsum(matchRefLengths)[:-1])).astype(np.int64)
+        self.matchRefLengths = np.array(matchRefLengths, dtype=np.int64)
+
+
+def reference_weights(hypStats, refWeights):
+    """
+    get the deltaBLEU weights of the matches and of the utterances
+    :param hypStats: HypothesisStatistics type, n-gram matches of the system
+    :param refWeights: (references x utterances) weights, or one weight per reference,
+        weights broadcast along the utterances are read as one weight per reference
+    :return matchWeights: numpy array type, max weight of the references containing each match
+    :return utteranceWeights: max reference weight of each utterance, a float when it is the same for all
+    """
+    weights = np.asarray(refWeights, dtype=np.float64)
+    perReference = weights.ndim == 1 or weights.strides[1] == 0
+    if perReference and weights.ndim == 2:
+        weights = weights[:, 0]
+    matchWeights = np.zeros(0)
+    if len(hypStats.matchOrder) > 0:
+        if perReference:
+            entryWeights = weights[hypStats.matchRefs]
+        else:
+            entrySentence = np.repeat(hypStats.matchSentence, hypStats.matchRefLengths)
+            entryWeights = weights[hypStats.matchRefs, entrySentence]
+        matchWeights = np.maximum.reduceat(entryWeights, hypStats.matchRefStarts)
+    if perReference:
+        return matchWeights, weights.max()
+    return matchWeights, weights.max(axis=0)
+
+
+def corpus_bleu(hypStats, refWeights=None):
+    """
+    calculate the corpus BLEU from the cached n-gram matches, with reference weights it is the
+    deltaBLEU: a matched n-gram counts with the max weight of the references containing it and
+    every n-gram is normalized by the max reference weight of its utterance
+    :param hypStats: HypothesisStatistics type, n-gram matches of the system
+    :param refWeights: None, (references x utterances) weights, or one weight per reference,
+        weights broadcast along the utterances are read as one weight per reference
+    :return bleuScore: BleuScore type, score and sufficient statistics
+    """
+    if refWeights is None:
+        correct = np.bincount(hypStats.matchOrder, weights=hypStats.matchCount, minlength=hypStats.maxOrder)
+        total = hypStats.totals.sum(axis=0)
+        correct = [int(c) for c in correct]
+        total = [int(t) for t in total]
+    else:
+        matchWeights, utteranceWeights = reference_weights(hypStats, refWeights)
+        correct = np.zeros(hypStats.maxOrder)
+        if len(hypStats.matchOrder) > 0:
+            correct = np.bincount(hypStats.matchOrder, weights=hypStats.matchCount * matchWeights,
+                                  minlength=hypStats.maxOrder)
+        if np.ndim(utteranceWeights) == 0:
+            total = hypStats.totals.sum(axis=0) * utteranceWeights
+        else:
+            total = (hypStats.totals * utteranceWeights[:, np.newaxis]).sum(axis=0)
+        correct = [float(c) for c in correct]
+        total = [float(t) for t in total]
+    from sacrebleu.metrics.bleu import BLEU
+    score = BLEU.compute_bleu(correct, total, hypStats.sysLen, hypStats.refLen, smooth_method='exp')
+    return BleuScore(score.score, correct, total, score.precisions, score.bp, hypStats.sysLen, hypStats.refLen)
+
+
+def sentence_bleu_statistics(hypStats, refWeights=None):
+    """
+    get the sufficient statistics of the BLEU of each utterance, the corpus BLEU of any
+    subset of the utterances is bleu_from_statistics of the sum of their rows
+    :param hypStats: HypothesisStatistics type, n-gram matches of the system
+    :param refWeights: None, or the reference weights of the deltaBLEU as for corpus_bleu
+    :return statistics: numpy array type, (utterances x 2 * maxOrder + 2) matrix of the
+        correct and total n-grams of each order, the system length and the reference length
+    """
+    numberUtterances, maxOrder = hypStats.totals.shape
+    matchWeights = None
+    totals = hypStats.totals
+    if refWeights is not None:
+        matchWeights, utteranceWeights = reference_weights(hypStats, refWeights)
+        totals = totals * np.reshape(utteranceWeights, (-1, 1))
+    statistics = np.zeros((numberUtterances, 2 * maxOrder + 2))
+    cells = hypStats.matchSentence * maxOrder + hypStats.matchOrder
+    matchCount = hypStats.matchCount if matchWeights is None else hypStats.matchCount * matchWeights
+    statistics[:, :maxOrder] = np.bincount(cells, weights=matchCount,
+                                           minlength=numberUtterances * maxOrder).reshape(numberUtterances, maxOrder)
+    statistics[:, maxOrder:2 * maxOrder] = totals
+    statistics[:, 2 * maxOrder] = hypStats.hypLengths
+    statistics[:, 2 * maxOrder + 1] = hypStats.refLengths
+    return statistics
+
+
+def bleu_from_statistics(statistics, maxOrder=MAX_NGRAM_ORDER, effectiveOrder=False):
+    """
+    calculate many corpus BLEU scores at once from summed sufficient statistics, as
+    sacrebleu computes one with the exp smoothing
+    :param statistics: numpy array type, (scores x 2 * maxOrder + 2) summed rows of sentence_bleu_statistics
+    :param maxOrder: int type, maximum n-gram order
+    :param effectiveOrder: bool type, average the precisions up to the last order with n-grams only,
+        as sacrebleu does for the BLEU of a sentence
+    :return scores: numpy array type, BLEU score of each row
+    """
+    correct = statistics[:, :maxOrder]
+    total = statistics[:, maxOrder:2 * maxOrder]
+    sysLen = statistics[:, 2 * maxOrder]
+    refLen = statistics[:, 2 * maxOrder + 1]
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        bp = np.where(sysLen < refLen, np.where(sysLen > 0, np.exp(1 - refLen / sysLen), 0.0), 1.0)
+        # sacrebleu stops at the first order without n-grams, the later precisions stay 0
+        reached = np.cumprod(total != 0, axis=1).astype(bool)
+        zero = (correct == 0) & reached
+        smooth = np.power(2.0, np.cumsum(zero, axis=1))
+        precisions = np.where(zero, 100. / (smooth * total), 100. * correct / total)
+        precisions = np.where(reached, precisions, 0.0)
+        logs = np.where(precisions > 0, np.log(np.where(precisions > 0, precisions, 1.0)), -9999999999)
+        if effectiveOrder:
+            orders = reached.sum(axis=1)
+            orders = np.where(orders > 0, orders, maxOrder)
+            scores = bp * np.exp(np.where(reached, logs, 0.0).sum(axis=1) / orders)
+        else:
+            scores = bp * np.exp(logs.sum(axis=1) / maxOrder)
+    return np.where((correct != 0).any(axis=1), scores, 0.0)
+
+
+class NgramStatistics(object):
+    """
+    the n-gram statistics cache of a run, the references are tokenized and counted once,
+    each system once, and the metrics read the cached counts
+    """
+
+    def __init__(self, references, maxOrder=MAX_NGRAM_ORDER, tokenized=None):
+        """
+        :param references: list type, one list of lines for each reference
+        :param maxOrder: int type, maximum n-gram order
+        :param tokenized: list type, tokens of each line of each reference, None to tokenize the lines
+        """
+        self.references = ReferenceStatistics(references, maxOrder, tokenized)
+        self.systems = dict()
+
+    def hypothesis(self, systemId, hypotheses):
+        """
+        get the cached statistics of a system, computed on the first request
+        :param systemId: String type, system id
+        :param hypotheses: list type, lines of the system
+        :return hypStats: HypothesisStatistics type, statistics of the system
+        """
+        if systemId not in self.systems:
+            self.systems[systemId] = HypothesisStatistics(hypotheses, self.references)
+        return self.systems[systemId]
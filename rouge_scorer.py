@@ -0,0 +1,190 @@
+from collections import Counter
+
+MAX_ROUGE_ORDER = 2
+
+UNKNOWN_ID = 0
+
+
+def f_score(precision, recall, alpha=0.5):
+    """
+    combine the precision and the recall as PyRouge does, 0 when either of them is 0
+    :param precision: float type, precision
+    :param recall: float type, recall
+    :param alpha: float type, balance between the recall and the precision
+    :return fscore: float type, f score
+    """
+    if precision == 0 or recall == 0:
+        return 0.0
+    return recall * precision / (alpha * recall + (1 - alpha) * precision)
+
+
+def lcs_length(masks, length, ids):
+    """
+    length of the longest common subsequence of a reference and a hypothesis with the
+    bit-parallel algorithm, each bit of the row is a reference position, so the dynamic
+    programming row is a single int and each hypothesis token costs a few int operations
+    :param masks: dict type, token id to the bitmask of its positions in the reference
+    :param length: int type, number of tokens of the reference
+    :param ids: list type, token ids of the hypothesis
+    :return lcsLength: int type, length of the longest common subsequence
+    """
+    full = (1 << length) - 1
+    row = full
+    for tokenId in ids:
+        match = row & masks.get(tokenId, 0)
+        if match:
+            row = ((row + match) | (row - match)) & full
+    return length - bin(row).count('1')
+
+
+def tokenize_split(lines):
+    """
+    tokenize lines as ROUGE does, on whitespace
+    :param lines: list type, lines
+    :return tokensList: list type, list of tokens of each line
+    """
+    return [line.split() for line in lines]
+
+
+class RougeReferences(object):
+    """
+    the references of a run for ROUGE, their token ids, n-gram counts and LCS bitmasks
+    are computed once and reused by every system
+    """
+
+    def __init__(self, references, maxOrder=MAX_ROUGE_ORDER, tokenized=None):
+        """
+        :param references: list type, one list of lines for each reference
+        :param maxOrder: int type, maximum n-gram order of ROUGE-N
+        :param tokenized: list type, tokens of each line of each reference as given by tokenize_split,
+            e.g. from the token cache, None to split the lines
+        """
+        if tokenized is None:
+            tokenized = [tokenize_split(lines) for lines in references]
+        self.maxOrder = maxOrder
+        self.numberReferences = len(references)
+        self.vocab = dict()
+        # for each utterance and order, n-gram key -> counts in the references containing it
+        self.ngrams = list()
+        # for each utterance and order, number of n-grams summed over the references
+        self.ngramSizes = list()
+        # for each utterance, (bitmasks, length) of each reference
+        self.lcsMasks = list()
+        # the n-gram keys depend on the vocabulary size, so the vocabulary is completed first
+        utteranceIds = [[self.encode(tokens, True) for tokens in tokensList] for tokensList in zip(*tokenized)]
+        for tokenIds in utteranceIds:
+            orderNgrams = list()
+            orderSizes = list()
+            for n in range(1, maxOrder + 1):
+                merged = dict()
+                for ids in tokenIds:
+                    for key, count in self.count_ngrams(ids, n).items():
+                        merged[key] = merged.get(key, ()) + (count,)
+                orderNgrams.append(merged)
+                orderSizes.append(sum(max(len(ids) - n + 1, 0) for ids in tokenIds))
+            self.ngrams.append(orderNgrams)
+            self.ngramSizes.append(orderSizes)
+            masks = list()
+            for ids in tokenIds:
+                positions = dict()
+                for position, tokenId in enumerate(ids):
+                    positions[tokenId] = positions.get(tokenId, 0) | (1 << position)
+                masks.append((positions, len(ids)))
+            self.lcsMasks.append(masks)
+        self.numberUtterances = len(self.ngrams)
+
+    def encode(self, tokens, extend=False):
+        """
+        map tokens to their ids, the tokens missing from the references map to UNKNOWN_ID
+        :param tokens: list type, tokens of a sentence
+        :param extend: bool type, add the missing tokens to the vocabulary
+        :return ids: list type, token ids
+        """
+        if extend:
+            for token in tokens:
+                if token not in self.vocab:
+                    self.vocab[token] = len(self.vocab) + 1
+            return [self.vocab[token] for token in tokens]
+        return [self.vocab.get(token, UNKNOWN_ID) for token in tokens]
+
+    def count_ngrams(self, ids, n):
+        """
+        count the n-grams of a sentence by integer keys, the keys of n-grams with an
+        unknown token never collide with the keys of the reference n-grams
+        :param ids: list type, token ids of the sentence
+        :param n: int type, n-gram order
+        :return ngrams: Counter type, count of each n-gram key
+        """
+        if n == 1:
+            return Counter(ids)
+        base = len(self.vocab) + 1
+        keys = ids[:len(ids) - n + 1]
+        for k in range(1, n):
+            keys = [key * base + tokenId for key, tokenId in zip(keys, ids[k:])]
+        return Counter(keys)
+
+
+def sentence_rouge(hypotheses, rougeRefs, utterances=None):
+    """
+    calculate ROUGE-N up to the max order and ROUGE-L of each line of a system, the
+    matches of the references of an utterance are summed
+    :param hypotheses: list type, lines of the system
+    :param rougeRefs: RougeReferences type, statistics of the references
+    :param utterances: sequence type, utterance of each line, None when the lines are all the utterances in order
+    :return precisions: dict type, rouge-1, rouge-2, ..., rouge-l, each with the precision of each line
+    :return recalls: dict type, rouge-1, rouge-2, ..., rouge-l, each with the recall of each line
+    """
+    names = ['rouge-{}'.format(n) for n in range(1, rougeRefs.maxOrder + 1)] + ['rouge-l']
+    precisions = dict((name, list()) for name in names)
+    recalls = dict((name, list()) for name in names)
+    numberReferences = rougeRefs.numberReferences
+    numberHypotheses = 0
+    lines = enumerate(hypotheses) if utterances is None else zip(utterances, hypotheses)
+    for i, line in lines:
+        if i >= rougeRefs.numberUtterances:
+            raise ValueError('Hypotheses and references must be the same size')
+        numberHypotheses += 1
+        ids = rougeRefs.encode(line.split())
+        for n in range(1, rougeRefs.maxOrder + 1):
+            refNgrams = rougeRefs.ngrams[i][n - 1]
+            matches = 0
+            for key, count in rougeRefs.count_ngrams(ids, n).items():
+                if key in refNgrams:
+                    matches += sum(min(count, refCount) for refCount in refNgrams[key])
+            hypSize = max(len(ids) - n + 1, 0) * numberReferences
+            refSize = rougeRefs.ngramSizes[i][n - 1]
+            precisions[names[n - 1]].append(matches / hypSize if hypSize else 0.0)
+            recalls[names[n - 1]].append(matches / refSize if refSize else 0.0)
+        knownIds = [tokenId for tokenId in ids if tokenId != UNKNOWN_ID]
+        matches = 0
+        refSize = 0
+        for masks, length in rougeRefs.lcsMasks[i]:
+            matches += lcs_length(masks, length, knownIds)
+            refSize += length
+        hypSize = len(ids) * numberReferences
+        precisions['rouge-l'].append(matches / hypSize if hypSize else 0.0)
+        recalls['rouge-l'].append(matches / refSize if refSize else 0.0)
+    if utterances is None and numberHypotheses != rougeRefs.numberUtterances:
+        raise ValueError('Hypotheses and references must be the same size')
+    return precisions, recalls
+
+
+def corpus_rouge(hypotheses, rougeRefs, alpha=0.5):
+    """
+    calculate ROUGE-N up to the max order and ROUGE-L of a system, each line is one summary
+    of one sentence, the matches of the references of an utterance are summed and the
+    precisions and recalls are averaged over the utterances, as PyRouge does by default
+    :param hypotheses: list type, lines of the system
+    :param rougeRefs: RougeReferences type, statistics of the references
+    :param alpha: float type, balance between the recall and the precision
+    :return scores: dict type, rouge-1, rouge-2, ..., rouge-l, each with r, p, f
+    """
+    names = ['rouge-{}'.format(n) for n in range(1, rougeRefs.maxOrder + 1)] + ['rouge-l']
+    precisions, recalls = sentence_rouge(hypotheses, rougeRefs)
+    numberHypotheses = rougeRefs.numberUtterances
+    scores = dict()
+    for name in names:
+        precision = sum(precisions[name]) / numberHypotheses if numberHypotheses else 0.0
+        recall = sum(recalls[name]) / numberHypotheses if numberHypotheses else 0.0
+        scores[name] = {'r': recall, 'p': precision, 'f': f_score(precision, recall, alpha)}
+    return scores
@@ -0,0 +1,157 @@
+import os
+import json
+from ngram_stats import sentence_bleu_statistics, bleu_from_statistics
+from rouge_scorer import sentence_rouge
+from distinct_ngrams import batch_distinct_n
+
+# utterances scored and written at a time, the rows of a system are never all held together
+SENTENCE_BATCH_SIZE = 10000
+
+SENTENCE_FORMATS = ['csv', 'jsonl']
+
+# the columns of each metric of ds_ex3.METRICS in the sentence level output
+SENTENCE_COLUMNS = {
+    'bleu': ['BLEU-4'],
+    'rouge': ['ROUGE-2', 'ROUGE-L'],
+    'distinct': ['Distinct-1', 'Distinct-2', 'Distinct-3'],
+}
+
+
+def sentence_columns(metrics):
+    """
+    get the score columns of the selected metrics
+    :param metrics: list type, selected metrics, keys of SENTENCE_COLUMNS
+    :return columns: list type, column names in the order of the metrics
+    """
+    return [column for metric in metrics for column in SENTENCE_COLUMNS[metric]]
+
+
+def iter_sentence_scores(lines, metrics, hypStats=None, rougeRefs=None, batchSize=SENTENCE_BATCH_SIZE):
+    """
+    score each utterance of a system, a batch of utterances at a time: the smoothed sentence
+    BLEU with the effective order, the ROUGE-2 and ROUGE-L recalls and the distinct-n
+    :param lines: sequence type, lines of the system, sliced batch by batch
+    :param metrics: list type, selected metrics, keys of SENTENCE_COLUMNS
+    :param hypStats: HypothesisStatistics type, statistics of the system cached for the corpus
+        scores, needed by bleu, and its words are reused by distinct
+    :param rougeRefs: RougeReferences type, statistics of the references, needed by rouge
+    :param batchSize: int type, number of utterances per batch
+    :return batches: generator type, (first utterance, column name to the scores of the batch) tuples
+    """
+    bleuStatistics = None
+    if 'bleu' in metrics:
+        bleuStatistics = sentence_bleu_statistics(hypStats)
+    for start in range(0, len(lines), batchSize):
+        stop = min(start + batchSize, len(lines))
+        columns = dict()
+        if 'bleu' in metrics:
+            columns['BLEU-4'] = bleu_from_statistics(bleuStatistics[start:stop], hypStats.maxOrder, True).tolist()
+        if 'rouge' in metrics:
+            precisions, recalls = sentence_rouge(lines[start:stop], rougeRefs, range(start, stop))
+            columns['ROUGE-2'] = recalls['rouge-2']
+            columns['ROUGE-L'] = recalls['rouge-l']
+        if 'distinct' in metrics:
+            words = hypStats.words[start:stop] if hypStats is not None else lines[start:stop]
+            sentenceDistinctN, _ = batch_distinct_n(words, [1, 2, 3])
+            for n in [1, 2, 3]:
+                columns['Distinct-{}'.format(n)] = sentenceDistinctN[n].tolist()
+        yield start, columns
+
+
+class SentenceWriter(object):
+    """
+    stream the sentence level scores to a CSV file with a header or to a JSON lines file,
+    the rows are formatted a batch at a time and written once batchSize rows are buffered
+    """
+
+    def __init__(self, file, columns, fileFormat=None, batchSize=SENTENCE_BATCH_SIZE):
+        """
+        :param file: String type, output file name
+        :param columns: list type, score columns, as given by sentence_columns
+        :param fileFormat: String type, one of csv, jsonl, None to tell it from the extension
+        :param batchSize: int type, number of rows buffered before they are written
+        """
+        if fileFormat is None:
+            fileFormat = 'jsonl' if os.path.splitext(file)[1] in ['.jsonl', '.json'] else 'csv'
+        if fileFormat not in SENTENCE_FORMATS:
+            raise ValueError('unknown sentence format: {}, expected one of {}'.format(fileFormat, SENTENCE_FORMATS))
+        self.fileFormat = fileFormat
+        self.columns = columns
+        self.batchSize = batchSize
+        self.buffer = list()
+        self.rows = 0
+        self.f = open(file, 'w')
+        if fileFormat == 'csv':
+            self.f.write(','.join(['System', 'Utterance'] + columns) + '\n')
+
+    def template(self, systemId):
+        """
+        get the format of a row of a system, the utterance and the scores are its fields
+        :param systemId: String type, system id
+        :return template: String type, format string of a row with its newline
+        """
+        if self.fileFormat == 'csv':
+            prefix = systemId + ','
+            fields = ','.join(['{}'] * (len(self.columns) + 1))
+        else:
+            prefix = '{"System": ' + json.dumps(systemId) + ', "Utterance": '
+            fields = '{}' + ''.join(', "{}": {{}}'.format(column) for column in self.columns) + '}}'
+        return prefix.replace('{', '{{').replace('}', '}}') + fields + '\n'
+
+    def write(self, systemId, start, scores):
+        """
+        add the rows of a batch of utterances of a system
+        :param systemId: String type, system id
+        :param start: int type, first utterance of the batch
+        :param scores: dict type, column name to the scores of the batch
+        """
+        template = self.template(systemId)
+        values = [scores[column] for column in self.columns]
+        self.buffer.extend(template.format(start + i, *row) for i, row in enumerate(zip(*values)))
+        self.rows += len(values[0]) if len(values) > 0 else 0
+        if len(self.buffer) >= self.batchSize:
+            self.flush()
+
+    def flush(self):
+        """
+        write the buffered rows
+        """
+        self.f.write(''.join(self.buffer))
+        self.buffer = list()
+
+    def close(self):
+        """
+        write the buffered rows and close the file
+        """
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+
+def write_sentence_scores(hypotheses, metrics, file, cache=None, rougeRefs=None, fileFormat=None,
+                          batchSize=SENTENCE_BATCH_SIZE):
+    """
+    write the score of every utterance of every system, one system after the other, reusing the
+    tokenized hypotheses and n-gram matches cached for the corpus scores
+    :param hypotheses: dict type, hypotheses data
+    :param metrics: list type, selected metrics, keys of SENTENCE_COLUMNS
+    :param file: String type, output file name, .jsonl for JSON lines and CSV otherwise
+    :param cache: NgramStatistics type, n-gram statistics of the run, needed by bleu
+    :param rougeRefs: RougeReferences type, statistics of the references, needed by rouge
+    :param fileFormat: String type, one of csv, jsonl, None to tell it from the extension
+    :param batchSize: int type, number of utterances scored and written at a time
+    :return rows: int type, number of written rows
+    """
+    with SentenceWriter(file, sentence_columns(metrics), fileFormat, batchSize) as writer:
+        for systemId in hypotheses:
+            hypStats = None
+            if cache is not None:
+                hypStats = cache.hypothesis(systemId, hypotheses[systemId])
+            for start, scores in iter_sentence_scores(hypotheses[systemId], metrics, hypStats, rougeRefs, batchSize):
+                writer.write(systemId, start, scores)
+    return writer.rows
@@ -0,0 +1,354 @@
+import os
+import sys
+import json
+import numpy as np
+from ngram_stats import bleu_from_statistics
+
+BOOTSTRAP_SAMPLES = 1000
+
+CONFIDENCE = 0.95
+
+# cells of the resample count matrix built at a time, the resamples are done in batches under it
+RESAMPLE_CELLS = 1 << 22
+
+REDUCERS = ['bleu', 'mean', 'ratio']
+
+CORRELATIONS = ['Pearson', 'Spearman', 'Kendall']
+
+
+class SufficientStatistics(object):
+    """
+    the per-item sufficient statistics of the scores of the systems, the score of a
+    system on any resample of the items is a reducer of the count-weighted sum of the rows:
+    bleu for the rows of sentence_bleu_statistics, mean for a column of per-item scores,
+    ratio for a column of sums over a column of counts
+    """
+
+    def __init__(self, numberItems):
+        """
+        :param numberItems: int type, number of items, e.g. utterances, all systems share them
+        """
+        self.numberItems = numberItems
+        self.systemIds = list()
+        self.metrics = list()
+        self.reducers = dict()
+        self.blocks = dict()
+
+    def add(self, metric, systemId, statistics, reducer='mean'):
+        """
+        add the statistics of a system for a metric
+        :param metric: String type, metric name
+        :param systemId: String type, system id
+        :param statistics: numpy array type, (items x columns) statistics, or one value per item
+        :param reducer: String type, one of bleu, mean, ratio
+        """
+        if reducer not in REDUCERS:
+            raise ValueError('unknown reducer: {}, expected one of {}'.format(reducer, REDUCERS))
+        statistics = np.asarray(statistics, dtype=np.float64).reshape(self.numberItems, -1)
+        if metric not in self.reducers:
+            self.metrics.append(metric)
+            self.reducers[metric] = reducer
+        if systemId not in self.systemIds:
+            self.systemIds.append(systemId)
+        self.blocks[(metric, systemId)] = statistics
+
+    def matrix(self):
+        """
+        stack the statistics of all metrics and systems side by side
+        :return matrix: numpy array type, (items x all columns) statistics
+        :return columns: dict type, (metric, systemId) -> slice of its columns
+        """
+        columns = dict()
+        start = 0
+        for key in self.blocks:
+            width = self.blocks[key].shape[1]
+            columns[key] = slice(start, start + width)
+            start += width
+        if len(self.blocks) == 0:
+            return np.zeros((self.numberItems, 0)), columns
+        return np.hstack(list(self.blocks.values())), columns
+
+    def reduce(self, sums, columns):
+        """
+        get the scores of many resamples from their summed statistics
+        :param sums: numpy array type, (resamples x all columns) count-weighted sums
+        :param columns: dict type, (metric, systemId) -> slice of its columns, as given by matrix
+        :return scores: dict type, metric -> (resamples x systems) scores, nan for a missing system
+        """
+        scores = dict()
+        for metric in self.metrics:
+            reducer = self.reducers[metric]
+            metricScores = np.full((len(sums), len(self.systemIds)), np.nan)
+            for k, systemId in enumerate(self.systemIds):
+                if (metric, systemId) not in columns:
+                    continue
+                block = sums[:, columns[(metric, systemId)]]
+                with np.errstate(divide='ignore', invalid='ignore'):
+                    if reducer == 'bleu':
+                        metricScores[:, k] = bleu_from_statistics(block, (block.shape[1] - 2) // 2)
+                    elif reducer == 'mean':
+                        metricScores[:, k] = block[:, 0] / self.numberItems
+                    else:
+                        metricScores[:, k] = block[:, 0] / block[:, 1]
+            scores[metric] = metricScores
+        return scores
+
+    def scores(self):
+        """
+        get the scores on all the items
+        :return scores: dict type, metric -> (systems,) scores
+        """
+        matrix, columns = self.matrix()
+        sums = matrix.sum(axis=0)[np.newaxis, :]
+        return dict((metric, values[0]) for metric, values in self.reduce(sums, columns).items())
+
+    def bootstrap(self, samples=BOOTSTRAP_SAMPLES, seed=0):
+        """
+        get the scores of bootstrap resamples of the items, a resample is a row of counts of
+        the drawn items and the sums of all resamples are one matrix product, the same
+        resamples are used for every system so the systems are compared on paired samples
+        :param samples: int type, number of resamples
+        :param seed: int type, seed of the resampling
+        :return scores: dict type, metric -> (samples x systems) scores
+        """
+        rng = np.random.default_rng(seed)
+        matrix, columns = self.matrix()
+        numberItems = self.numberItems
+        batchSize = max(1, RESAMPLE_CELLS // max(numberItems, 1))
+        batches = list()
+        for start in range(0, samples, batchSize):
+            size = min(batchSize, samples - start)
+            drawn = rng.integers(0, numberItems, size=(size, numberItems))
+            cells = (np.arange(size)[:, np.newaxis] * numberItems + drawn).ravel()
+            counts = np.bincount(cells, minlength=size * numberItems).reshape(size, numberItems)
+            batches.append(self.reduce(counts.astype(np.float64) @ matrix, columns))
+        return dict((metric, np.vstack([batch[metric] for batch in batches])) for metric in self.metrics)
+
+    def save(self, file):
+        """
+        write the statistics, so the analysis can be run again without the metrics
+        :param file: String type, .npz file name
+        """
+        meta = {'numberItems': self.numberItems, 'systemIds': self.systemIds,
+                'metrics': self.metrics, 'reducers': self.reducers,
+                'blocks': [list(key) for key in self.blocks]}
+        arrays = dict(('block{}'.format(i), self.blocks[key]) for i, key in enumerate(self.blocks))
+        np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+
+    @classmethod
+    def load(cls, file):
+        """
+        read the statistics written by save
+        :param file: String type, .npz file name
+        :return statistics: SufficientStatistics type, the statistics
+        """
+        with np.load(file) as data:
+            meta = json.loads(str(data['meta']))
+            statistics = cls(meta['numberItems'])
+            statistics.systemIds = meta['systemIds']
+            statistics.metrics = meta['metrics']
+            statistics.reducers = meta['reducers']
+            for i, (metric, systemId) in enumerate(meta['blocks']):
+                statistics.blocks[(metric, systemId)] = data['block{}'.format(i)]
+        return statistics
+
+
+def confidence_interval(scores, confidence=CONFIDENCE):
+    """
+    get the percentile confidence interval of bootstrap scores
+    :param scores: numpy array type, (samples x systems) scores
+    :param confidence: float type, confidence level
+    :return lower: numpy array type, lower bound of each system
+    :return upper: numpy array type, upper bound of each system
+    """
+    tail = (1 - confidence) / 2 * 100
+    return np.percentile(scores, tail, axis=0), np.percentile(scores, 100 - tail, axis=0)
+
+
+def paired_significance(scores, point):
+    """
+    get the p-values of the paired bootstrap test of every pair of systems, the share of
+    resamples where the system observed better is not better, 1 for observed ties, one
+    system against all the others at a time
+    :param scores: numpy array type, (samples x systems) bootstrap scores
+    :param point: numpy array type, (systems,) scores on all the items
+    :return deltas: numpy array type, (systems x systems) observed score differences
+    :return pValues: numpy array type, (systems x systems) p-values
+    """
+    deltas = point[:, np.newaxis] - point[np.newaxis, :]
+    pValues = np.empty(deltas.shape, dtype=np.float64)
+    for a in range(len(point)):
+        sampled = scores[:, a:a + 1] - scores
+        pValues[a] = (sampled * np.sign(deltas[a]) <= 0).mean(axis=0)
+    pValues[deltas == 0] = 1.0
+    return deltas, pValues
+
+
+def average_ranks(values):
+    """
+    rank the values along the last axis from 1, the ties get their average rank
+    :param values: numpy array type, values
+    :return ranks: numpy array type, ranks of the values
+    """
+    rows = values.reshape(-1, values.shape[-1])
+    ranks = np.empty(rows.shape, dtype=np.float64)
+    for i, row in enumerate(rows):
+        unique, inverse, counts = np.unique(row, return_inverse=True, return_counts=True)
+        # the ranks of a group of ties go from its end - count + 1 to its end
+        ranks[i] = (np.cumsum(counts) - (counts - 1) / 2)[inverse.reshape(-1)]
+    return ranks.reshape(values.shape)
+
+
+def pearson(x, y):
+    """
+    the Pearson correlation along the last axis
+    :param x: numpy array type, values
+    :param y: numpy array type, values
+    :return r: numpy array type, correlations
+    """
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (x * y).sum(axis=-1) / np.sqrt((x * x).sum(axis=-1) * (y * y).sum(axis=-1))
+
+
+def spearman(x, y):
+    """
+    the Spearman correlation along the last axis, the Pearson correlation of the average ranks
+    :param x: numpy array type, values
+    :param y: numpy array type, values
+    :return rho: numpy array type, correlations
+    """
+    return pearson(average_ranks(x), average_ranks(y))
+
+
+def kendall(x, y):
+    """
+    the Kendall tau-b correlation along the last axis, the pairs of items are compared
+    a block of rows at a time under RESAMPLE_CELLS cells
+    :param x: numpy array type, values
+    :param y: numpy array type, values
+    :return tau: numpy array type, correlations
+    """
+    numberItems = x.shape[-1]
+    blockRows = max(1, RESAMPLE_CELLS // max(1, x.size))
+    concordant = np.zeros(x.shape[:-1], dtype=np.float64)
+    pairsX = np.zeros(x.shape[:-1], dtype=np.float64)
+    pairsY = np.zeros(x.shape[:-1], dtype=np.float64)
+    for start in range(0, numberItems, blockRows):
+        stop = min(start + blockRows, numberItems)
+        signX = np.sign(x[..., start:stop, np.newaxis] - x[..., np.newaxis, :])
+        signY = np.sign(y[..., start:stop, np.newaxis] - y[..., np.newaxis, :])
+        concordant += (signX * signY).sum(axis=(-2, -1))
+        pairsX += (signX != 0).sum(axis=(-2, -1))
+        pairsY += (signY != 0).sum(axis=(-2, -1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return concordant / np.sqrt(pairsX * pairsY)
+
+
+CORRELATION_FUNCTIONS = {'Pearson': pearson, 'Spearman': spearman, 'Kendall': kendall}
+
+
+def analyze(metricStats, humanStats=None, samples=BOOTSTRAP_SAMPLES, confidence=CONFIDENCE, seed=0):
+    """
+    bootstrap the metrics and the human ratings: the confidence interval of every score, the
+    paired significance of every pair of systems, and the system level correlations of every
+    metric with every human rating, the ratings are resampled over the rated utterances
+    :param metricStats: SufficientStatistics type, statistics of the metrics over the utterances
+    :param humanStats: SufficientStatistics type, statistics of the human ratings over the rated utterances, None for none
+    :param samples: int type, number of bootstrap resamples
+    :param confidence: float type, confidence level of the intervals
+    :param seed: int type, seed of the resampling
+    :return intervals: list type, (metric, systemId, score, lower, upper) tuples
+    :return pairs: list type, (metric, systemA, systemB, delta, pValue) tuples
+    :return correlations: list type, (metric, human, name, value, lower, upper) tuples
+    """
+    groups = [(metricStats, 0)] if humanStats is None else [(metricStats, 0), (humanStats, 1)]
+    points = dict()
+    sampled = dict()
+    systemIds = dict()
+    intervals = list()
+    pairs = list()
+    for stats, offset in groups:
+        groupPoints = stats.scores()
+        groupSamples = stats.bootstrap(samples, seed + offset)
+        for metric in stats.metrics:
+            points[metric] = groupPoints[metric]
+            sampled[metric] = groupSamples[metric]
+            systemIds[metric] = stats.systemIds
+            lower, upper = confidence_interval(groupSamples[metric], confidence)
+            for k, systemId in enumerate(stats.systemIds):
+                intervals.append((metric, systemId, groupPoints[metric][k], lower[k], upper[k]))
+            deltas, pValues = paired_significance(groupSamples[metric], groupPoints[metric])
+            for a, systemA in enumerate(stats.systemIds):
+                for b, systemB in enumerate(stats.systemIds):
+                    if a < b:
+                        pairs.append((metric, systemA, systemB, deltas[a, b], pValues[a, b]))
+    correlations = list()
+    if humanStats is None:
+        return intervals, pairs, correlations
+    for human in humanStats.metrics:
+        for metric in metricStats.metrics:
+            # the systems scored by both, with a defined score
+            common = [systemId for systemId in metricStats.systemIds if systemId in humanStats.systemIds]
+            x = np.array([metricStats.systemIds.index(systemId) for systemId in common], dtype=np.int64)
+            y = np.array([humanStats.systemIds.index(systemId) for systemId in common], dtype=np.int64)
+            valid = np.isfinite(points[metric][x]) & np.isfinite(points[human][y])
+            x = x[valid]
+            y = y[valid]
+            for name in CORRELATIONS:
+                function = CORRELATION_FUNCTIONS[name]
+                value = function(points[metric][x], points[human][y])
+                lower, upper = confidence_interval(
+                    function(sampled[metric][:, x], sampled[human][:, y])[:, np.newaxis], confidence)
+                correlations.append((metric, human, name, float(value), lower[0], upper[0]))
+    return intervals, pairs, correlations
+
+
+def write_analysis(intervals, pairs, correlations, prefix):
+    """
+    write the results of analyze as three CSV files
+    :param intervals: list type, as given by analyze
+    :param pairs: list type, as given by analyze
+    :param correlations: list type, as given by analyze
+    :param prefix: String type, output path without the suffixes _bootstrap.csv,
+        _significance.csv and _correlation.csv
+    """
+    with open(prefix + '_bootstrap.csv', 'w') as of:
+        of.write('Metric,System,Score,Lower,Upper\n')
+        for row in intervals:
+            of.write(','.join(str(value) for value in row) + '\n')
+    with open(prefix + '_significance.csv', 'w') as of:
+        of.write('Metric,System_A,System_B,Delta,P_Value\n')
+        for row in pairs:
+            of.write(','.join(str(value) for value in row) + '\n')
+    with open(prefix + '_correlation.csv', 'w') as of:
+        of.write('Metric,Human,Correlation,Value,Lower,Upper\n')
+        for row in correlations:
+            of.write(','.join(str(value) for value in row) + '\n')
+
+
+def main():
+    """
+    The main function, analyze again the statistics saved by ds_ex3 -bootstrap
+    """
+    # ds_ex3 imports this module at its top, so its parser is imported here to avoid a cycle
+    from ds_ex3 import parse_args
+    options = parse_args(sys.argv[1:])
+    if 'path' in options:
+        inputs = options['path']
+    else:
+        print('please input the path of the evaluation')
+        inputs = input("input:")
+    metricStats = SufficientStatistics.load(os.path.join(inputs, 'output_statistics.npz'))
+    humanFile = os.path.join(inputs, 'output_human_statistics.npz')
+    humanStats = SufficientStatistics.load(humanFile) if os.path.exists(humanFile) else None
+    intervals, pairs, correlations = analyze(metricStats, humanStats, int(options.get('samples', BOOTSTRAP_SAMPLES)),
+                                             float(options.get('confidence', CONFIDENCE)), int(options.get('seed', 0)))
+    write_analysis(intervals, pairs, correlations, os.path.join(inputs, 'output'))
+    print('{} scores, {} pairs of systems and {} correlations written to {}'.format(
+        len(intervals), len(pairs), len(correlations), inputs))
+
+
+if __name__ == '__main__':
+    main()
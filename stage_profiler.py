@@ -0,0 +1,204 @@
+import os
+import sys
+import json
+import time
+import platform
+import cProfile
+import tracemalloc
+from contextlib import contextmanager
+try:
+    import resource
+except ImportError:
+    # getrusage is only available on Unix, the peaks are then left out of the report
+    resource = None
+
+
+def peak_rss():
+    """
+    get the peak resident set size of the process, VmHWM where /proc is available,
+    which can be reset between stages, else the lifetime peak of getrusage
+    :return peakRss: int type, peak resident set size in bytes, None where neither is available
+    """
+    try:
+        with open('/proc/self/status', 'r') as sf:
+            for line in sf:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError):
+        pass
+    return rusage_peak_rss()
+
+
+def rusage_peak_rss(children=False):
+    """
+    get the lifetime peak resident set size of the process or of its waited children from getrusage
+    :param children: bool type, the peak of the children instead of the process
+    :return peakRss: int type, peak resident set size in bytes, None where getrusage is not available
+    """
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return rusage_bytes(resource.getrusage(who).ru_maxrss)
+
+
+def rusage_bytes(maxrss):
+    """
+    convert the ru_maxrss of getrusage to bytes, it is in kilobytes except on macOS
+    :param maxrss: int type, ru_maxrss of getrusage
+    :return size: int type, size in bytes
+    """
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def reset_peak_rss():
+    """
+    reset the peak resident set size of the process, only possible on Linux
+    :return reset: bool type, whether the peak was reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as cf:
+            cf.write('5')
+        return True
+    except (IOError, OSError):
+        return False
+
+
+class StageProfiler(object):
+    """
+    record the wall time, cpu time and peak memory of the stages of a run and of the
+    systems inside a stage, a disabled profiler records nothing and costs nothing
+    """
+
+    def __init__(self, enabled=False, traceMemory=False, profileStages=False):
+        """
+        :param enabled: bool type, record the stages
+        :param traceMemory: bool type, also record the peak of the memory traced by tracemalloc,
+            which slows the run down
+        :param profileStages: bool type, run every stage under cProfile and keep the profile
+            of the slowest stage, which slows the run down
+        """
+        self.enabled = enabled or traceMemory or profileStages
+        self.traceMemory = traceMemory
+        self.profileStages = profileStages
+        self.stages = list()
+        self.current = None
+        self.slowestProfile = None
+        self.slowestStage = None
+        self.started = time.time()
+        self.startWall = time.perf_counter()
+        self.startCpu = time.process_time()
+        if self.traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        record a stage of the run
+        :param name: String type, name of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+        record = {'name': name, 'wall': None, 'cpu': None, 'peakRss': None,
+                  'peakRssReset': reset_peak_rss(), 'tracemallocPeak': None, 'systems': dict()}
+        if self.traceMemory:
+            tracemalloc.reset_peak()
+            record['tracemallocPeak'] = 0
+        profile = None
+        if self.profileStages:
+            profile = cProfile.Profile()
+            profile.enable()
+        self.current = record
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            record['wall'] = time.perf_counter() - wall
+            record['cpu'] = time.process_time() - cpu
+            if profile is not None:
+                profile.disable()
+                if self.slowestStage is None or record['wall'] > self.slowestStage['wall']:
+                    self.slowestProfile = profile
+                    self.slowestStage = record
+            record['peakRss'] = peak_rss()
+            if self.traceMemory:
+                record['tracemallocPeak'] = max(record['tracemallocPeak'], tracemalloc.get_traced_memory()[1])
+            self.current = None
+            self.stages.append(record)
+
+    @contextmanager
+    def system(self, systemId):
+        """
+        record one system inside the current stage
+        :param systemId: String type, system id
+        """
+        if not self.enabled or self.current is None:
+            yield
+            return
+        record = self.current
+        if self.traceMemory:
+            # keep the stage peak before the peak is reset for the system
+            record['tracemallocPeak'] = max(record['tracemallocPeak'], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_system(systemId, time.perf_counter() - wall, time.process_time() - cpu)
+            if self.traceMemory:
+                peak = tracemalloc.get_traced_memory()[1]
+                record['systems'][systemId]['tracemallocPeak'] = peak
+                record['tracemallocPeak'] = max(record['tracemallocPeak'], peak)
+
+    def add_system(self, systemId, wall, cpu, stage=None):
+        """
+        add the figures of a system measured elsewhere, e.g. in a worker process
+        :param systemId: String type, system id
+        :param wall: float type, wall time in seconds
+        :param cpu: float type, cpu time in seconds
+        :param stage: String type, name of a finished stage, None for the current stage
+        """
+        if not self.enabled:
+            return
+        record = self.current
+        if stage is not None:
+            record = [s for s in self.stages if s['name'] == stage][-1]
+        record['systems'][systemId] = {'wall': wall, 'cpu': cpu}
+
+    def report(self):
+        """
+        gather the figures of the run
+        :return report: dict type, figures of the run and of each stage
+        """
+        report = dict()
+        report['started'] = time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started))
+        report['python'] = platform.python_version()
+        report['platform'] = platform.platform()
+        report['wall'] = time.perf_counter() - self.startWall
+        report['cpu'] = time.process_time() - self.startCpu
+        report['peakRss'] = rusage_peak_rss()
+        report['childrenPeakRss'] = rusage_peak_rss(True)
+        report['tracemalloc'] = self.traceMemory
+        report['cprofile'] = self.profileStages
+        report['stages'] = self.stages
+        slowest = max(self.stages, key=lambda s: s['wall']) if len(self.stages) > 0 else None
+        report['slowestStage'] = slowest['name'] if slowest is not None else None
+        return report
+
+    def write(self, file, profileFile=None):
+        """
+        write the report as JSON, and the cProfile statistics of the slowest stage
+        :param file: String type, report file name
+        :param profileFile: String type, file name of the cProfile statistics, None for no dump
+        :return report: dict type, the written report
+        """
+        report = self.report()
+        if profileFile is not None and self.slowestProfile is not None:
+            self.slowestProfile.dump_stats(profileFile)
+            report['cprofileFile'] = os.path.abspath(profileFile)
+            report['cprofileStage'] = self.slowestStage['name']
+        with open(file, 'w') as rf:
+            json.dump(report, rf, indent=2)
+        return report
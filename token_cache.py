@@ -0,0 +1,278 @@
+import os
+import json
+import hashlib
+from array import array
+import numpy as np
+
+# bumped when the stored entries change, the entries of another version are never found
+CACHE_VERSION = '1'
+
+DIGEST_CHUNK_SIZE = 1 << 20
+
+DEFAULT_CACHE_SIZE = 1 << 30
+
+ENTRY_SUFFIXES = ['.vocab.json', '.offsets.npy', '.ids.npy']
+
+
+def file_digest(file):
+    """
+    hash the content of a file, so a moved or touched file keeps its cache entries
+    :param file: String type, file name
+    :return digest: String type, hex digest of the content
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file, 'rb') as f:
+        while True:
+            data = f.read(DIGEST_CHUNK_SIZE)
+            if len(data) == 0:
+                break
+            digest.update(data)
+    return digest.hexdigest()
+
+
+class TokenizedCorpus(object):
+    """
+    the tokenized lines of a cached file, the token ids and the line offsets are
+    memory-mapped and the tokens of a line are looked up when it is read
+    """
+
+    def __init__(self, prefix):
+        """
+        :param prefix: String type, path of the entry without suffix
+        """
+        self.prefix = prefix
+        with open(prefix + '.vocab.json', 'r', encoding='utf-8') as vf:
+            self.vocabulary = np.array(json.load(vf), dtype=object)
+        self.offsets = np.load(prefix + '.offsets.npy', mmap_mode='r')
+        self.ids = np.load(prefix + '.ids.npy', mmap_mode='r') if self.offsets[-1] > 0 \
+            else np.zeros(0, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.slice(*index.indices(len(self))[:2])
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('line {} out of range of {} lines'.format(index, len(self)))
+        return self.vocabulary[self.ids[int(self.offsets[index]):int(self.offsets[index + 1])]].tolist()
+
+    def slice(self, start, stop):
+        """
+        read the tokens of a range of lines with one lookup of the vocabulary
+        :param start: int type, first line
+        :param stop: int type, line after the last line
+        :return tokensList: list type, list of tokens of each line of the range
+        """
+        offsets = self.offsets[start:stop + 1]
+        if len(offsets) < 2:
+            return list()
+        tokens = self.vocabulary[self.ids[int(offsets[0]):int(offsets[-1])]].tolist()
+        bounds = (offsets - offsets[0]).tolist()
+        return [tokens[bounds[i]:bounds[i + 1]] for i in range(0, len(bounds) - 1)]
+
+    def __iter__(self):
+        return self.iter_lines()
+
+    def iter_lines(self, batchSize=10000):
+        """
+        stream the tokens of all the lines, reading a batch of lines at a time
+        :param batchSize: int type, number of lines per read
+        :return tokens: generator type, list of tokens of each line
+        """
+        for start in range(0, len(self), batchSize):
+            for tokens in self.slice(start, min(start + batchSize, len(self))):
+                yield tokens
+
+    def __getstate__(self):
+        return {'prefix': self.prefix}
+
+    def __setstate__(self, state):
+        self.__init__(state['prefix'])
+
+
+class TokenizedWriter(object):
+    """
+    collect the tokenized lines of a file batch by batch, the entry is written
+    to the cache by close, under temporary names first so a reader never sees half of it
+    """
+
+    def __init__(self, cache, key):
+        """
+        :param cache: TokenCache type, cache of the entry
+        :param key: String type, key of the entry
+        """
+        self.cache = cache
+        self.key = key
+        self.vocabulary = dict()
+        self.ids = array('i')
+        self.offsets = array('q', [0])
+
+    def add(self, tokensList):
+        """
+        add the tokens of a batch of lines
+        :param tokensList: list type, list of tokens of each line
+        """
+        vocabulary = self.vocabulary
+        for tokens in tokensList:
+            for token in tokens:
+                if token not in vocabulary:
+                    vocabulary[token] = len(vocabulary)
+            self.ids.extend([vocabulary[token] for token in tokens])
+            self.offsets.append(len(self.ids))
+
+    def close(self, evict=True):
+        """
+        write the entry and evict the least recently used entries beyond the size limit
+        :param evict: bool type, evict now, False when many small entries are written and
+            the cache is trimmed once afterwards
+        :return corpus: TokenizedCorpus type, the written entry
+        """
+        prefix = self.cache.prefix(self.key)
+        temporary = '{}.{}.tmp'.format(prefix, os.getpid())
+        with open(temporary + ENTRY_SUFFIXES[0], 'w', encoding='utf-8') as vf:
+            json.dump(list(self.vocabulary), vf)
+        np.save(temporary + ENTRY_SUFFIXES[1], np.frombuffer(self.offsets, dtype=np.int64))
+        np.save(temporary + ENTRY_SUFFIXES[2], np.frombuffer(self.ids, dtype=np.int32))
+        # the ids are moved last, an entry is complete once they are in place
+        for suffix in ENTRY_SUFFIXES:
+            os.replace(temporary + suffix, prefix + suffix)
+        if evict:
+            self.cache.evict(keep=self.key)
+        return TokenizedCorpus(prefix)
+
+
+class TokenCache(object):
+    """
+    content-addressed cache of tokenized files, an entry is found by the hash of the file
+    content and the tokenizer configuration, and the least recently used entries are
+    evicted when the cache grows beyond its size limit
+    """
+
+    def __init__(self, path, maxSize=DEFAULT_CACHE_SIZE):
+        """
+        :param path: String type, directory of the cache
+        :param maxSize: int type, size limit of the cache in bytes
+        """
+        self.path = path
+        self.maxSize = maxSize
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, file, config):
+        """
+        get the key of the entry of a file
+        :param file: String type, file name
+        :param config: String type, tokenizer configuration
+        :return key: String type, key of the entry
+        """
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update('\t'.join([CACHE_VERSION, config, file_digest(file)]).encode('utf-8'))
+        return digest.hexdigest()
+
+    def prefix(self, key):
+        """
+        get the path of an entry without suffix
+        :param key: String type, key of the entry
+        :return prefix: String type, path of the entry
+        """
+        return os.path.join(self.path, key)
+
+    def lookup(self, file, config):
+        """
+        find the entry of a file, a found entry becomes the most recently used
+        :param file: String type, file name
+        :param config: String type, tokenizer configuration
+        :return corpus: TokenizedCorpus type, the entry, None if it is not cached
+        """
+        return self.load(self.key(file, config))
+
+    def load(self, key):
+        """
+        open an entry by its key, a found entry becomes the most recently used
+        :param key: String type, key of the entry
+        :return corpus: TokenizedCorpus type, the entry, None if it is not cached
+        """
+        prefix = self.prefix(key)
+        if not all(os.path.exists(prefix + suffix) for suffix in ENTRY_SUFFIXES):
+            return None
+        os.utime(prefix + ENTRY_SUFFIXES[-1])
+        return TokenizedCorpus(prefix)
+
+    def writer(self, key):
+        """
+        start an entry, for a file tokenized as it is streamed
+        :param key: String type, key of the entry, as given by key
+        :return writer: TokenizedWriter type, writer of the entry
+        """
+        return TokenizedWriter(self, key)
+
+    def tokenize(self, file, config, lines, tokenizeBatch, batchSize=10000):
+        """
+        get the tokenized lines of a file from the cache, tokenized and stored on a miss
+        :param file: String type, file name, whose content identifies the lines
+        :param config: String type, tokenizer configuration
+        :param lines: sequence type, lines of the file, only read on a miss
+        :param tokenizeBatch: function type, tokenize a list of lines into a list of lists of tokens
+        :param batchSize: int type, number of lines tokenized together
+        :return corpus: TokenizedCorpus type, tokens of each line
+        """
+        key = self.key(file, config)
+        corpus = self.load(key)
+        if corpus is None:
+            writer = self.writer(key)
+            for start in range(0, len(lines), batchSize):
+                writer.add(tokenizeBatch(lines[start:start + batchSize]))
+            corpus = writer.close()
+        return corpus
+
+    def entries(self):
+        """
+        list the complete entries from the least recently used
+        :return entries: list type, (last use, size, key) tuples
+        """
+        entries = list()
+        for fname in os.listdir(self.path):
+            if not fname.endswith(ENTRY_SUFFIXES[-1]) or fname.endswith('.tmp' + ENTRY_SUFFIXES[-1]):
+                continue
+            key = fname[:-len(ENTRY_SUFFIXES[-1])]
+            prefix = self.prefix(key)
+            try:
+                used = os.stat(prefix + ENTRY_SUFFIXES[-1]).st_mtime_ns
+                size = sum(os.path.getsize(prefix + suffix) for suffix in ENTRY_SUFFIXES)
+            except OSError:
+                continue
+            entries.append((used, size, key))
+        return sorted(entries)
+
+    def size(self):
+        """
+        get the size of the complete entries
+        :return size: int type, size in bytes
+        """
+        return sum(size for used, size, key in self.entries())
+
+    def evict(self, keep=None):
+        """
+        remove the least recently used entries until the cache fits in its size limit
+        :param keep: String type, key of an entry which is never removed, None for none
+        :return removed: int type, number of removed entries
+        """
+        entries = self.entries()
+        total = sum(size for used, size, key in entries)
+        removed = 0
+        for used, size, key in entries:
+            if total <= self.maxSize:
+                break
+            if key == keep:
+                continue
+            prefix = self.prefix(key)
+            for suffix in reversed(ENTRY_SUFFIXES):
+                try:
+                    os.remove(prefix + suffix)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,282 @@
+import math
+import json
+import heapq
+from collections import Counter
+import numpy as np
+from unique_counter import hash64, HyperLogLogCounter
+
+FREQUENCY_MODES = ['exact', 'sketch']
+
+
+class ExactFrequency(Counter):
+    """
+    count the frequency of every token exactly, the memory grows with the vocabulary
+    """
+    mode = 'exact'
+
+    def add_tokens(self, tokens):
+        """
+        count a batch of tokens
+        :param tokens: list type, tokens to be counted
+        """
+        self.update(tokens)
+
+    def merge(self, other):
+        """
+        merge another exact frequency counter into this one
+        :param other: ExactFrequency type, counter to be merged
+        """
+        self.update(other)
+
+    def add_counts(self, counts):
+        """
+        count a batch of distinct tokens with their counts
+        :param counts: dict type, token to its count
+        """
+        self.update(counts)
+
+    def estimate(self, token):
+        """
+        get the frequency of a token
+        :param token: String type, token
+        :return count: int type, frequency of the token
+        """
+        return self[token]
+
+    def total(self):
+        """
+        get the number of counted tokens
+        :return total: int type, sum of the frequencies
+        """
+        return sum(self.values())
+
+    def top(self, k):
+        """
+        get the most frequent tokens, the ties are broken by the token
+        :param k: int type, number of tokens, None for all the tokens
+        :return top: list type, (token, count) tuples from the most frequent
+        """
+        key = lambda item: (-item[1], item[0])
+        if k is None:
+            return sorted(self.items(), key=key)
+        return heapq.nsmallest(k, self.items(), key=key)
+
+    def to_bytes(self):
+        """
+        serialize the counter, for the on-disk index
+        :return data: bytes type, serialized counter
+        """
+        return json.dumps(self, sort_keys=True).encode('utf-8')
+
+    def merge_bytes(self, data):
+        """
+        merge a serialized exact frequency counter into this one
+        :param data: bytes type, counter serialized by to_bytes
+        """
+        self.update(json.loads(data.decode('utf-8')))
+
+
+class CountMinFrequency(object):
+    """
+    estimate the frequency of the tokens with a count-min sketch, the memory is fixed by the
+    error bound: an estimate is never below the true frequency and is above it by at most
+    error times the number of counted tokens with probability 1 - delta; the heavy hitters
+    are kept as candidates for the top tokens, and the unique tokens are counted by HyperLogLog
+    """
+    mode = 'sketch'
+
+    def __init__(self, error=0.0001, delta=0.01, capacity=10000, uniqueError=0.01):
+        """
+        :param error: float type, error bound of the estimates relative to the number of tokens
+        :param delta: float type, probability that an estimate exceeds the error bound
+        :param capacity: int type, number of heavy hitter candidates kept
+        :param uniqueError: float type, relative standard error of the unique token count
+        """
+        self.error = error
+        self.delta = delta
+        self.capacity = capacity
+        self.width = int(math.ceil(math.e / error))
+        self.depth = int(math.ceil(math.log(1 / delta)))
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.count = 0
+        self.candidates = dict()
+        self.unique = HyperLogLogCounter(uniqueError)
+
+    def columns(self, tokens):
+        """
+        get the column of the tokens in every row, the rows hash with h1 + i * h2
+        from the two halves of the 64-bit hash of a token
+        :param tokens: list type, tokens
+        :return columns: numpy array type, depth x len(tokens) columns
+        """
+        hashes = np.frombuffer(b''.join(hash64(token) for token in tokens), dtype='<u8')
+        h1 = hashes & np.uint64(0xffffffff)
+        h2 = (hashes >> np.uint64(32)) | np.uint64(1)
+        rows = np.arange(self.depth, dtype=np.uint64)[:, None]
+        return ((h1 + rows * h2) % np.uint64(self.width)).astype(np.intp)
+
+    def add_counts(self, counts):
+        """
+        count a batch of distinct tokens with their counts
+        :param counts: dict type, token to its count
+        """
+        if len(counts) == 0:
+            return
+        tokens = list(counts)
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(tokens))
+        columns = self.columns(tokens)
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], values)
+        self.count += int(values.sum())
+        for token in tokens:
+            self.unique.add(token)
+        estimates = self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+        self.candidates.update(zip(tokens, estimates.tolist()))
+        if len(self.candidates) > 2 * self.capacity:
+            self.prune()
+
+    def add_tokens(self, tokens):
+        """
+        count a batch of tokens
+        :param tokens: list type, tokens to be counted
+        """
+        self.add_counts(Counter(tokens))
+
+    def prune(self):
+        """
+        keep the capacity candidates with the highest estimates, a dropped token comes back
+        with its whole estimate the next time it is counted
+        """
+        self.refresh()
+        kept = sorted(self.candidates.items(), key=lambda item: -item[1])[:self.capacity]
+        self.candidates = dict(kept)
+
+    def refresh(self):
+        """
+        update the estimates of the candidates from the table
+        """
+        if len(self.candidates) > 0:
+            tokens = list(self.candidates)
+            columns = self.columns(tokens)
+            estimates = self.table[np.arange(self.depth)[:, None], columns].min(axis=0)
+            self.candidates = dict(zip(tokens, estimates.tolist()))
+
+    def merge(self, other):
+        """
+        merge another sketch with the same shape into this one
+        :param other: CountMinFrequency type, sketch to be merged
+        """
+        if other.width != self.width or other.depth != self.depth:
+            raise ValueError('cannot merge count-min sketches of different shapes')
+        self.table += other.table
+        self.count += other.count
+        self.unique.merge(other.unique)
+        self.candidates.update(other.candidates)
+        self.refresh()
+        if len(self.candidates) > 2 * self.capacity:
+            self.prune()
+
+    def merge_bytes(self, data):
+        """
+        count the tokens of a serialized exact frequency counter, as stored in the on-disk index
+        :param data: bytes type, counter serialized by ExactFrequency.to_bytes
+        """
+        self.add_counts(json.loads(data.decode('utf-8')))
+
+    def estimate(self, token):
+        """
+        estimate the frequency of a token
+        :param token: String type, token
+        :return count: int type, estimated frequency, an upper bound with probability 1 - delta
+        """
+        columns = self.columns([token])
+        return int(self.table[np.arange(self.depth), columns[:, 0]].min())
+
+    def total(self):
+        """
+        get the number of counted tokens
+        :return total: int type, sum of the frequencies
+        """
+        return self.count
+
+    def heavy_hitters(self, threshold):
+        """
+        get the candidates whose estimate is at least threshold of the counted tokens
+        :param threshold: float type, minimum frequency relative to the number of tokens
+        :return hitters: list type, (token, estimate) tuples from the most frequent
+        """
+        return [(token, count) for token, count in self.top(None) if count >= threshold * self.count]
+
+    def top(self, k):
+        """
+        get the candidates with the highest estimates, the ties are broken by the token
+        :param k: int type, number of tokens, None for all the candidates
+        :return top: list type, (token, estimate) tuples from the most frequent
+        """
+        self.refresh()
+        return sorted(self.candidates.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def __len__(self):
+        return self.unique.count()
+
+
+def new_frequency(mode='exact', error=0.0001, capacity=10000):
+    """
+    create a token frequency counter for the counting backend
+    :param mode: String type, one of exact, sketch
+    :param error: float type, error bound relative to the number of tokens, only used by sketch
+    :param capacity: int type, number of heavy hitter candidates, only used by sketch
+    :return counter: counter with add_tokens, merge, merge_bytes, estimate, top and len
+    """
+    if mode == 'exact':
+        return ExactFrequency()
+    elif mode == 'sketch':
+        return CountMinFrequency(error, capacity=capacity)
+    raise ValueError('unknown frequency mode: {}, expected one of {}'.format(mode, FREQUENCY_MODES))
+
+
+def describe_frequency(counter):
+    """
+    describe the backend which produced the token frequencies, for the report
+    :param counter: counter created by new_frequency
+    :return description: String type, description of the frequency mode
+    """
+    if counter.mode == 'sketch':
+        return 'approximate, count-min sketch {}x{} within {:.4%} of the tokens with probability {:.0%}'.format(
+            counter.depth, counter.width, counter.error, 1 - counter.delta)
+    return 'exact'
+
+
+def save_vocabulary(counter, file, minCount=1):
+    """
+    write the vocabulary as one token and its frequency per line, separated by a tab,
+    from the most frequent, a sketch writes its heavy hitter candidates only
+    :param counter: counter created by new_frequency
+    :param file: String type, vocabulary file name
+    :param minCount: int type, minimum frequency of a written token
+    :return size: int type, number of written tokens
+    """
+    size = 0
+    with open(file, 'w', encoding='utf-8') as vf:
+        for token, count in counter.top(None):
+            if count < minCount:
+                break
+            vf.write('{}\t{}\n'.format(token, count))
+            size += 1
+    return size
+
+
+def load_vocabulary(file):
+    """
+    read a vocabulary written by save_vocabulary
+    :param file: String type, vocabulary file name
+    :return counter: ExactFrequency type, token frequencies of the file
+    """
+    counter = ExactFrequency()
+    with open(file, 'r', encoding='utf-8') as vf:
+        for number, line in enumerate(vf, 1):
+            fields = line.rstrip('\n').rsplit('\t', 1)
+            if len(fields) != 2:
+                raise ValueError('line {} of {} is not a token and its frequency separated by a tab'.format(number, file))
+            counter[fields[0]] = int(fields[1])
+    return counter
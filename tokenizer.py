@@ -0,0 +1,148 @@
+import re
+import string
+from collections import Counter
+
+PUNCTUATION_PATTERN = re.compile(r"[!\"#$%&\'()*+,-./:;<=>?@\\\[\]^_`{|}~]")
+
+# ascii punctuation is removed as in normalize, the unicode quotes and dashes
+# left in the text are split off as tokens by the treebank tokenizer of nltk
+PUNCTUATION_TABLE = dict()
+for char in string.punctuation:
+    PUNCTUATION_TABLE[ord(char)] = ' '
+for char in '«“‘„»”’‒–—―':
+    PUNCTUATION_TABLE[ord(char)] = ' ' + char + ' '
+
+# contractions which the treebank tokenizer still splits once the apostrophes are gone
+CONTRACTIONS = {
+    'cannot': ['can', 'not'],
+    'gimme': ['gim', 'me'],
+    'gonna': ['gon', 'na'],
+    'gotta': ['got', 'ta'],
+    'lemme': ['lem', 'me'],
+    'wanna': ['wan', 'na'],
+}
+
+BATCH_SEPARATOR = '\x00'
+
+
+class NltkTokenizer(object):
+    """
+    the reference tokenizer, remove punctuation, lower and nltk word_tokenize
+    """
+    name = 'nltk'
+
+    def __init__(self):
+        # nltk is imported by the first nltk tokenizer, the fast tokenizer never loads it
+        from nltk.tokenize import word_tokenize
+        self.word_tokenize = word_tokenize
+
+    def tokenize(self, utterance):
+        """
+        tokenize a single utterance
+        :param utterance: String type, a line of sentence
+        :return tokens: list type, normalized tokens
+        """
+        uttWithoutPun = PUNCTUATION_PATTERN.sub(' ', utterance.lower())
+        return self.word_tokenize(uttWithoutPun)
+
+    def tokenize_batch(self, utterances):
+        """
+        tokenize a batch of utterances
+        :param utterances: list type, lines of sentences
+        :return tokensList: list type, normalized tokens for each utterance
+        """
+        return [self.tokenize(utterance) for utterance in utterances]
+
+
+class FastTokenizer(object):
+    """
+    the fast tokenizer, a translate table for punctuation and whitespace split,
+    which reproduces the nltk tokenizer on text whose punctuation is removed
+    """
+    name = 'fast'
+
+    def tokenize(self, utterance):
+        """
+        tokenize a single utterance
+        :param utterance: String type, a line of sentence
+        :return tokens: list type, normalized tokens
+        """
+        return self.split_contractions(utterance.lower().translate(PUNCTUATION_TABLE).split())
+
+    def tokenize_batch(self, utterances):
+        """
+        tokenize a batch of utterances, lower and translate the whole batch at once
+        :param utterances: list type, lines of sentences
+        :return tokensList: list type, normalized tokens for each utterance
+        """
+        texts = BATCH_SEPARATOR.join(utterances).lower().translate(PUNCTUATION_TABLE).split(BATCH_SEPARATOR)
+        if len(texts) != len(utterances):
+            return [self.tokenize(utterance) for utterance in utterances]
+        return [self.split_contractions(text.split()) for text in texts]
+
+    def split_contractions(self, tokens):
+        """
+        split the contractions as the treebank tokenizer does
+        :param tokens: list type, whitespace separated tokens
+        :return tokens: list type, tokens with contractions split
+        """
+        if CONTRACTIONS.keys().isdisjoint(tokens):
+            return tokens
+        splitTokens = list()
+        for token in tokens:
+            if token in CONTRACTIONS:
+                splitTokens.extend(CONTRACTIONS[token])
+            else:
+                splitTokens.append(token)
+        return splitTokens
+
+
+TOKENIZERS = {
+    'nltk': NltkTokenizer,
+    'fast': FastTokenizer,
+}
+
+
+def get_tokenizer(name='nltk'):
+    """
+    get the tokenizer backend by name
+    :param name: String type, one of nltk, fast
+    :return tokenizer: tokenizer with tokenize and tokenize_batch
+    """
+    if name not in TOKENIZERS:
+        raise ValueError('unknown tokenizer: {}, expected one of {}'.format(name, list(TOKENIZERS)))
+    return TOKENIZERS[name]()
+
+
+def parity(utterances, reference='nltk', candidate='fast', examples=5):
+    """
+    compare the candidate tokenizer to the reference tokenizer on a sample
+    :param utterances: list type, sample of utterances
+    :param reference: String type, name of the reference tokenizer
+    :param candidate: String type, name of the candidate tokenizer
+    :param examples: int type, number of differing utterances kept as examples
+    :return report: dict type, number of utterances and tokens which differ
+    """
+    referenceTokens = get_tokenizer(reference).tokenize_batch(utterances)
+    candidateTokens = get_tokenizer(candidate).tokenize_batch(utterances)
+    report = {
+        'utterances': len(utterances),
+        'differingUtterances': 0,
+        'referenceTokens': 0,
+        'candidateTokens': 0,
+        'differingTokens': 0,
+        'examples': list(),
+    }
+    for utterance, refTokens, candTokens in zip(utterances, referenceTokens, candidateTokens):
+        report['referenceTokens'] += len(refTokens)
+        report['candidateTokens'] += len(candTokens)
+        if refTokens != candTokens:
+            report['differingUtterances'] += 1
+            refCounter = Counter(refTokens)
+            candCounter = Counter(candTokens)
+            missing = refCounter - candCounter
+            extra = candCounter - refCounter
+            report['differingTokens'] += sum(missing.values()) + sum(extra.values())
+            if len(report['examples']) < examples:
+                report['examples'].append((utterance, refTokens, candTokens))
+    return report
@@ -0,0 +1,214 @@
+import math
+import json
+import hashlib
+import numpy as np
+
+MODES = ['raw', 'exact', 'hll']
+
+
+def hash64(item):
+    """
+    hash a string to a 64-bit digest, stable across processes and runs
+    :param item: String type, item to be hashed
+    :return digest: bytes type, 8 bytes digest of the item
+    """
+    return hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest()
+
+
+class RawCounter(set):
+    """
+    count the unique items by keeping the items themselves, the original behavior
+    """
+    mode = 'raw'
+
+    def merge(self, other):
+        """
+        merge another raw counter into this one
+        :param other: RawCounter type, counter to be merged
+        """
+        self.update(other)
+
+    def to_bytes(self):
+        """
+        serialize the counter, for the on-disk index
+        :return data: bytes type, serialized counter
+        """
+        return json.dumps(sorted(self)).encode('utf-8')
+
+    def merge_bytes(self, data):
+        """
+        merge a serialized raw counter into this one
+        :param data: bytes type, counter serialized by to_bytes
+        """
+        self.update(json.loads(data.decode('utf-8')))
+
+
+class ExactCounter(object):
+    """
+    count the unique items exactly by keeping a sorted array of their 64-bit hashes,
+    new hashes are buffered and compacted into the sorted array when the buffer is full
+    """
+    mode = 'exact'
+
+    def __init__(self, bufferSize=1 << 20):
+        """
+        :param bufferSize: int type, number of hashes buffered before compaction
+        """
+        self.bufferSize = bufferSize
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.buffer = bytearray()
+
+    def add(self, item):
+        """
+        add an item to the counter
+        :param item: String type, item to be counted
+        """
+        self.buffer += hash64(item)
+        if len(self.buffer) >= self.bufferSize * 8:
+            self.compact()
+
+    def compact(self):
+        """
+        move the buffered hashes into the sorted unique array
+        """
+        if len(self.buffer) > 0:
+            buffered = np.frombuffer(bytes(self.buffer), dtype=np.uint64)
+            self.hashes = np.union1d(self.hashes, buffered)
+            self.buffer = bytearray()
+
+    def merge(self, other):
+        """
+        merge another exact counter into this one
+        :param other: ExactCounter type, counter to be merged
+        """
+        other.compact()
+        self.merge_bytes(other.hashes.tobytes())
+
+    def to_bytes(self):
+        """
+        serialize the counter, for the on-disk index
+        :return data: bytes type, serialized counter
+        """
+        self.compact()
+        return self.hashes.tobytes()
+
+    def merge_bytes(self, data):
+        """
+        merge a serialized exact counter into this one, the hashes are buffered
+        so merging many small counters does not rebuild the array every time
+        :param data: bytes type, counter serialized by to_bytes
+        """
+        self.buffer += data
+        if len(self.buffer) >= self.bufferSize * 8:
+            self.compact()
+
+    def __len__(self):
+        self.compact()
+        return len(self.hashes)
+
+    def __getstate__(self):
+        self.compact()
+        return self.__dict__
+
+
+class HyperLogLogCounter(object):
+    """
+    estimate the number of unique items with HyperLogLog, the memory is fixed by the error bound
+    """
+    mode = 'hll'
+
+    def __init__(self, error=0.01):
+        """
+        :param error: float type, relative standard error of the estimation
+        """
+        precision = int(math.ceil(math.log2((1.04 / error) ** 2)))
+        self.precision = min(max(precision, 4), 18)
+        self.error = error
+        self.registers = bytearray(1 << self.precision)
+
+    def add(self, item):
+        """
+        add an item to the counter
+        :param item: String type, item to be counted
+        """
+        h = int.from_bytes(hash64(item), 'little')
+        index = h >> (64 - self.precision)
+        rank = (64 - self.precision) - (h & ((1 << (64 - self.precision)) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        merge another HyperLogLog counter with the same precision into this one
+        :param other: HyperLogLogCounter type, counter to be merged
+        """
+        if other.precision != self.precision:
+            raise ValueError('cannot merge HyperLogLog counters with different precisions')
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        np.maximum(registers, np.frombuffer(other.registers, dtype=np.uint8), out=registers)
+
+    def to_bytes(self):
+        """
+        serialize the counter sparsely as the indices and values of the non-empty registers,
+        for the on-disk index, a small file only sets a few registers
+        :return data: bytes type, serialized counter
+        """
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        indices = np.flatnonzero(registers).astype(np.uint32)
+        return indices.tobytes() + registers[indices].tobytes()
+
+    def merge_bytes(self, data):
+        """
+        merge a serialized HyperLogLog counter with the same precision into this one
+        :param data: bytes type, counter serialized by to_bytes
+        """
+        size = len(data) // 5
+        indices = np.frombuffer(data, dtype=np.uint32, count=size)
+        values = np.frombuffer(data, dtype=np.uint8, offset=size * 4)
+        np.maximum.at(np.frombuffer(self.registers, dtype=np.uint8), indices, values)
+
+    def count(self):
+        """
+        estimate the number of unique items
+        :return estimate: int type, estimated number of unique items
+        """
+        m = len(self.registers)
+        registers = np.frombuffer(self.registers, dtype=np.uint8)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.power(2.0, -registers.astype(np.float64)).sum()
+        zeros = int((registers == 0).sum())
+        if estimate <= 2.5 * m and zeros > 0:
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+    def __len__(self):
+        return self.count()
+
+
+def new_counter(mode='exact', error=0.01):
+    """
+    create a unique counter for the counting backend
+    :param mode: String type, one of raw, exact, hll
+    :param error: float type, relative standard error, only used by hll
+    :return counter: counter with add, merge and len
+    """
+    if mode == 'raw':
+        return RawCounter()
+    elif mode == 'exact':
+        return ExactCounter()
+    elif mode == 'hll':
+        return HyperLogLogCounter(error)
+    raise ValueError('unknown counting mode: {}, expected one of {}'.format(mode, MODES))
+
+
+def describe_counter(counter):
+    """
+    describe the backend which produced the unique count, for the report
+    :param counter: counter created by new_counter
+    :return description: String type, description of the counting mode
+    """
+    if counter.mode == 'hll':
+        return 'approximate, HyperLogLog with {:.2%} standard error'.format(counter.error)
+    elif counter.mode == 'exact':
+        return 'exact, 64-bit hashes'
+    return 'exact, raw strings'
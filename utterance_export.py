@@ -0,0 +1,227 @@
+import os
+import re
+import numpy as np
+from unique_counter import hash64
+from token_frequency import ExactFrequency, load_vocabulary
+from tokenizer import get_tokenizer
+from corpus_reader import iter_chunks, iter_line_batches, decode_fields, iter_dialogues
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_BATCH_SIZE = 100000
+
+VOCABULARY_EXTENSION = '.vocab'
+
+# speaker in the 2nd column and utterance in the 4th column of an ubuntu line
+UBUNTU_PATTERN = re.compile(rb'^[^\t\n]*\t([^\t\n]*)\t[^\t\n]*\t([^\t\n]*\n?)', re.M)
+
+
+class Vocabulary(object):
+    """
+    the token ids of an export, saved in the vocabulary format of token_frequency, one token
+    and its frequency per line, the id of a token is its line number starting at 0, so the
+    vocabulary written by -frequencies can be extended by an export and read back; the lines
+    stay in the order of the ids, so unlike save_vocabulary a new token is appended whatever
+    its frequency
+    """
+
+    def __init__(self, file=None):
+        """
+        :param file: String type, vocabulary file to extend, None to start empty
+        """
+        self.counts = ExactFrequency()
+        if file is not None and os.path.exists(file):
+            self.counts = load_vocabulary(file)
+        self.ids = {token: tokenId for tokenId, token in enumerate(self.counts)}
+
+    def encode(self, tokens):
+        """
+        get the ids of tokens and count them, new tokens are added to the vocabulary
+        :param tokens: list type, tokens
+        :return ids: list type, token ids
+        """
+        ids = self.ids
+        for token in tokens:
+            if token not in ids:
+                ids[token] = len(ids)
+        self.counts.update(tokens)
+        return [ids[token] for token in tokens]
+
+    def save(self, file):
+        """
+        write the vocabulary, one token and its frequency per line in the order of the ids
+        :param file: String type, vocabulary file name
+        """
+        with open(file, 'w', encoding='utf-8') as vf:
+            for token in self.ids:
+                vf.write('{}\t{}\n'.format(token, self.counts[token]))
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def iter_ubuntu_records(root):
+    """
+    stream the utterances of an ubuntu corpus, a file is a conversation
+    :param root: String type, root dir of corpus
+    :return records: generator type, (conversation, speakers, utterances) of each chunk
+    """
+    from ds_ex2_task4 import list_ubuntu_files
+    for file in list_ubuntu_files(root):
+        conversation = os.path.splitext(os.path.relpath(file, root))[0]
+        for chunk in iter_chunks(file):
+            fields = UBUNTU_PATTERN.findall(chunk)
+            speakers = decode_fields([speaker for speaker, utterance in fields])
+            utterances = decode_fields([utterance for speaker, utterance in fields])
+            yield conversation, speakers, utterances
+
+
+def iter_twitter_records(file):
+    """
+    stream the utterances of a twitter corpus, the conversations are separated by blank
+    lines and numbered from 0
+    :param file: String type, file path of corpus
+    :return records: generator type, (conversation, speakers, utterances) of each conversation
+    """
+    conversation = 0
+    speakers = list()
+    utterances = list()
+    for lines in iter_line_batches(file):
+        for line in lines:
+            if len(line.strip()) == 0:
+                if len(utterances) > 0:
+                    yield str(conversation), decode_fields(speakers), decode_fields(utterances)
+                    conversation += 1
+                    speakers = list()
+                    utterances = list()
+                continue
+            fields = line.split(b'\t', 3)
+            if len(fields) > 1:
+                utterances.append(fields[1])
+                speakers.append(fields[2] if len(fields) > 2 else b'')
+    if len(utterances) > 0:
+        yield str(conversation), decode_fields(speakers), decode_fields(utterances)
+
+
+def iter_json_records(file):
+    """
+    stream the utterances of a json corpus, the speaker is sys or usr, and the turns
+    are exported as they are, a missing or empty utterance gives no record
+    :param file: String type, file path of corpus
+    :return records: generator type, (conversation, speakers, utterances) of each dialogue
+    """
+    for name, turns in iter_dialogues(file):
+        speakers = list()
+        utterances = list()
+        for turn in turns:
+            for key in ["sys", "usr"]:
+                if key in turn and len(turn[key]) >= 1:
+                    speakers.append(key)
+                    utterances.append(turn[key])
+        yield name, speakers, utterances
+
+
+def iter_corpus_records(path, corpus=None):
+    """
+    stream the utterances of a corpus, the corpus kind is told by ds_ex2_task4.corpus_kind
+    :param path: String type, path of the corpus
+    :param corpus: String type, one of json, twitter, ubuntu, None to tell it from the path
+    :return corpus: String type, corpus kind, one of json, twitter, ubuntu
+    :return records: generator type, (conversation, speakers, utterances) tuples
+    """
+    from ds_ex2_task4 import corpus_kind
+    corpus = corpus_kind(path, corpus)
+    if corpus == 'json':
+        return corpus, iter_json_records(path)
+    elif corpus == 'twitter':
+        return corpus, iter_twitter_records(path)
+    return corpus, iter_ubuntu_records(path)
+
+
+def export_schema():
+    """
+    the schema of the exported records
+    :return schema: pyarrow schema type, columns of the records
+    """
+    return pa.schema([
+        ('corpus', pa.string()),
+        ('conversation', pa.string()),
+        ('speaker', pa.string()),
+        ('tokenCount', pa.int32()),
+        ('utteranceHash', pa.uint64()),
+        ('tokenIds', pa.list_(pa.int32())),
+    ])
+
+
+def batch_table(corpus, batch, engine, vocabulary, schema):
+    """
+    tokenize a batch of utterances and build its table of records
+    :param corpus: String type, corpus kind
+    :param batch: dict type, conversation, speaker and utterance lists of the batch
+    :param engine: tokenizer backend returned by get_tokenizer
+    :param vocabulary: Vocabulary type, vocabulary of the export
+    :param schema: pyarrow schema type, columns of the records
+    :return table: pyarrow table type, records of the batch
+    """
+    tokensList = engine.tokenize_batch(batch['utterance'])
+    lengths = np.array([len(tokens) for tokens in tokensList], dtype=np.int32)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int32)
+    np.cumsum(lengths, out=offsets[1:])
+    tokenIds = np.fromiter((tokenId for tokens in tokensList for tokenId in vocabulary.encode(tokens)),
+                           dtype=np.int32, count=int(offsets[-1]))
+    hashes = np.frombuffer(b''.join(hash64(utterance) for utterance in batch['utterance']), dtype='<u8')
+    return pa.Table.from_arrays([
+        pa.array([corpus] * len(lengths), pa.string()),
+        pa.array(batch['conversation'], pa.string()),
+        pa.array(batch['speaker'], pa.string()),
+        pa.array(lengths),
+        pa.array(hashes),
+        pa.ListArray.from_arrays(pa.array(offsets), pa.array(tokenIds)),
+    ], schema=schema)
+
+
+def export_corpus(path, outFile, tokenizer='nltk', vocabularyFile=None, batchSize=EXPORT_BATCH_SIZE, corpus=None):
+    """
+    write one record per utterance to a Parquet file, in row groups of batchSize records:
+    corpus, conversation, speaker, tokenCount, utteranceHash (the 64-bit hash of the unique
+    counter) and tokenIds against the vocabulary, which is saved next to the file with the
+    token frequencies, in the format of token_frequency.save_vocabulary
+    :param path: String type, path of the corpus
+    :param outFile: String type, Parquet file name
+    :param tokenizer: String type, tokenizer backend, one of nltk, fast
+    :param vocabularyFile: String type, vocabulary file, e.g. written by -frequencies, whose ids are kept
+        and whose frequencies are added to if it exists, None for a new vocabulary in outFile.vocab
+    :param batchSize: int type, number of records written at a time
+    :param corpus: String type, one of json, twitter, ubuntu, None to tell it from the path
+    :return numberRecords: int type, number of records written
+    :return vocabularySize: int type, number of tokens of the vocabulary
+    """
+    if pa is None:
+        raise ImportError('the export needs pyarrow, install it with: pip install pyarrow')
+    # the vocabulary of an earlier export to the same file is replaced, not counted again
+    vocabulary = Vocabulary(vocabularyFile)
+    if vocabularyFile is None:
+        vocabularyFile = outFile + VOCABULARY_EXTENSION
+    schema = export_schema()
+    engine = get_tokenizer(tokenizer)
+    corpus, records = iter_corpus_records(path, corpus)
+    batch = {'conversation': list(), 'speaker': list(), 'utterance': list()}
+    numberRecords = 0
+
+    with pq.ParquetWriter(outFile, schema) as writer:
+        for conversation, speakers, utterances in records:
+            batch['conversation'].extend([conversation] * len(utterances))
+            batch['speaker'].extend(speakers)
+            batch['utterance'].extend(utterances)
+            numberRecords += len(utterances)
+            if len(batch['utterance']) >= batchSize:
+                writer.write_table(batch_table(corpus, batch, engine, vocabulary, schema))
+                batch = {'conversation': list(), 'speaker': list(), 'utterance': list()}
+        if len(batch['utterance']) > 0:
+            writer.write_table(batch_table(corpus, batch, engine, vocabulary, schema))
+    vocabulary.save(vocabularyFile)
+    return numberRecords, len(vocabulary)